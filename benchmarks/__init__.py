@@ -0,0 +1,3 @@
+"""
+离线基准测试：合成Vault、本地桩LLM和性能测量脚本。
+"""
@@ -0,0 +1,63 @@
+"""
+比较两次基准测试的结果，按语料规模列出各项指标的变化。
+
+用法：
+    python -m benchmarks.compare 旧结果.json 新结果.json
+"""
+import json
+import sys
+from pathlib import Path
+
+# (指标路径, 是否越小越好)
+METRICS = [
+    (("initial_index_seconds",), True),
+    (("incremental_index_seconds",), True),
+    (("search", "p50_ms"), True),
+    (("search", "p99_ms"), True),
+    (("process_article", "requests_per_second"), False),
+    (("process_article", "p50_ms"), True),
+    (("process_article", "p99_ms"), True),
+    (("peak_rss_mb",), True),
+]
+
+
+def _get(result: dict, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(old_report: dict, new_report: dict) -> str:
+    old_by_size = {r["size"]: r for r in old_report["results"]}
+    lines = [f"{old_report.get('commit')} -> {new_report.get('commit')}"]
+    for new in new_report["results"]:
+        old = old_by_size.get(new["size"])
+        if old is None:
+            continue
+        lines.append(f"\n规模 {new['size']}:")
+        for path, lower_is_better in METRICS:
+            old_value, new_value = _get(old, path), _get(new, path)
+            if old_value is None or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            worse = change > 0 if lower_is_better else change < 0
+            marker = " ⚠️" if worse and abs(change) >= 10 else ""
+            lines.append(
+                f"  {'.'.join(path):40s} {old_value:12.3f} -> {new_value:12.3f} ({change:+.1f}%){marker}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    old_report, new_report = (json.loads(Path(p).read_text(encoding="utf-8")) for p in argv)
+    print(compare(old_report, new_report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+离线基准测试。
+
+为每个语料规模生成合成Vault，用本地桩LLM替换 ChatDeepSeek，测量：
+- 初始索引构建耗时、修改部分笔记后的增量重建耗时
+- search_by_bm25 的 p50/p99 延迟
+- 并发请求 /process-article 的端到端吞吐量和延迟
+- 进程峰值内存（RSS）
+每个规模在独立子进程中运行，结果汇总写入JSON文件，便于在不同提交之间比较。
+
+用法：
+    python -m benchmarks.run --sizes 1000,10000 --llm-latency 0.05
+    python -m benchmarks.compare benchmarks/results/旧.json benchmarks/results/新.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _latency_stats(values) -> dict:
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+        "p50_ms": _percentile(values, 0.50) * 1000,
+        "p99_ms": _percentile(values, 0.99) * 1000,
+    }
+
+
+def _peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是KiB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _load_test(app, articles, concurrency: int) -> dict:
+    """在进程内通过ASGI直接并发请求 /process-article。"""
+    import httpx
+
+    latencies = []
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def one(text: str):
+                nonlocal errors
+                async with limit:
+                    started = time.perf_counter()
+                    response = await client.post("/process-article", json={"text": text})
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(text) for text in articles))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(articles),
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_second": len(articles) / elapsed if elapsed else 0.0,
+        **_latency_stats(latencies),
+    }
+
+
+def run_size(args, size: int) -> dict:
+    """在当前进程中完成一个语料规模的全部测量（需在导入 src.storage 之前调用）。"""
+    workdir = Path(tempfile.mkdtemp(prefix=f"alchemist-bench-{size}-"))
+    vault = workdir / "vault"
+
+    import config
+    config.VAULT_PATH = str(vault)
+    config.DATA_DIR = workdir
+    config.DB_PATH = workdir / "reasoning_index.db"
+    config.LLM_CACHE_PATH = workdir / "llm_cache.db"
+    # 关闭响应缓存，测量的是每次都调用（桩）LLM的开销
+    config.LLM_CACHE_ENABLED = False
+    config.SEARCH_ENGINE = args.engine
+    config.CHUNKED_INDEXING = args.chunked
+    config.DENSE_RETRIEVAL = args.dense
+    config.EMBEDDING_BACKEND = args.embedding_backend
+    config.INDEX_CONCURRENCY = args.index_concurrency
+    config.METRICS_SUMMARY_INTERVAL_SECONDS = 0
+
+    from benchmarks.stub_llm import StubChatModel
+    from benchmarks.synthetic_vault import generate_note, generate_vault
+    from src.llm import set_llm_factory
+    set_llm_factory(lambda model: StubChatModel(model, latency=args.llm_latency))
+
+    result = {"size": size, "engine": "chunks" if args.chunked else args.engine, "dense": args.dense}
+
+    started = time.perf_counter()
+    paths = generate_vault(vault, size, language=args.language, seed=args.seed)
+    result["generate_seconds"] = time.perf_counter() - started
+
+    from src import indexer
+    started = time.perf_counter()
+    indexer.build_initial_index()
+    result["initial_index_seconds"] = time.perf_counter() - started
+
+    # 修改一部分笔记后再次运行，测量增量重建（包括扫描未修改文件的开销）
+    rng = random.Random(args.seed + 1)
+    changed = rng.sample(paths, max(1, int(size * args.changed_ratio)))
+    for path in changed:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n" + generate_note(rng, args.language))
+    started = time.perf_counter()
+    indexer.build_initial_index()
+    result["incremental_index_seconds"] = time.perf_counter() - started
+    result["changed_notes"] = len(changed)
+
+    # 检索延迟：查询为随机笔记经桩模型提炼出的指纹
+    store = indexer.store
+    stub = StubChatModel()
+    queries = [
+        stub.respond(f"---\n{generate_note(rng, args.language)}\n---")
+        for _ in range(args.queries)
+    ]
+    store.warm_up()
+    store.search_by_bm25(queries[0])
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        store.search_by_bm25(query)
+        latencies.append(time.perf_counter() - started)
+    result["search"] = _latency_stats(latencies)
+
+    # 端到端吞吐量
+    from src.main import app
+    articles = [generate_note(rng, args.language) for _ in range(args.requests)]
+    result["process_article"] = asyncio.run(_load_test(app, articles, args.concurrency))
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="知识炼金术师离线基准测试")
+    parser.add_argument("--sizes", default="1000,10000", help="逗号分隔的笔记数量，例如 1000,10000,100000")
+    parser.add_argument("--language", default="mixed", choices=["zh", "en", "mixed"])
+    parser.add_argument("--engine", default="resident", choices=["rank_bm25", "fts5", "resident"])
+    parser.add_argument("--chunked", action="store_true", help="启用章节索引（CHUNKED_INDEXING）")
+    parser.add_argument("--dense", action="store_true", help="启用向量检索与RRF融合（DENSE_RETRIEVAL）")
+    parser.add_argument(
+        "--embedding-backend", default="hashing", choices=["hashing", "sentence_transformers"],
+        help="向量检索的嵌入后端；默认用无需模型文件的哈希嵌入，只测量开销而不代表召回质量"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="桩LLM每次调用的模拟延迟（秒）")
+    parser.add_argument("--index-concurrency", type=int, default=4)
+    parser.add_argument("--changed-ratio", type=float, default=0.01, help="增量重建时修改的笔记比例")
+    parser.add_argument("--queries", type=int, default=200, help="检索延迟测量的查询数")
+    parser.add_argument("--requests", type=int, default=50, help="端到端测试的请求总数")
+    parser.add_argument("--concurrency", type=int, default=8, help="端到端测试的并发请求数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果JSON路径（默认写入 benchmarks/results/）")
+    # 内部使用：在子进程中运行单个规模并把结果写入该文件
+    parser.add_argument("--single-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.single_size is not None:
+        result = run_size(args, args.single_size)
+        Path(args.result_file).write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    forwarded = [arg for arg in (argv if argv is not None else sys.argv[1:])]
+    results = []
+    for size in sizes:
+        print(f"=== 规模 {size} ===")
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_file = f.name
+        # 每个规模使用独立进程，保证模块级单例和峰值内存互不影响
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", *forwarded,
+             "--single-size", str(size), "--result-file", result_file],
+            cwd=PROJECT_ROOT, check=True
+        )
+        result = json.loads(Path(result_file).read_text(encoding="utf-8"))
+        Path(result_file).unlink()
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            key: value for key, value in vars(args).items()
+            if key not in ("single_size", "result_file", "output")
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{commit}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+确定性的本地桩LLM，用于在没有DeepSeek密钥的情况下运行整个流程。
+按提示类型返回与真实模型相同格式的响应，并可模拟调用延迟。
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.tokenizer import get_tokenizer
+
+# 指纹中保留的词元数量
+FINGERPRINT_TOKENS = 24
+# 流式输出时每段的字符数
+STREAM_CHUNK_CHARS = 16
+
+
+def _usage(prompt: str, content: str) -> dict:
+    # 粗略估算：平均每2个字符一个token
+    input_tokens = len(prompt) // 2
+    output_tokens = len(content) // 2
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+class StubChatModel:
+    """
+    实现 invoke / ainvoke / astream 的桩模型。
+    - 指纹提炼：返回原文中出现最多的词元，保证检索结果有意义且可复现
+    - 重排序：按候选出现的顺序返回前 top_k 个ID
+    - 合成：根据文章内容的哈希生成两个知识点
+    """
+
+    def __init__(self, model: str = "stub", latency: float = 0.0):
+        self.model_name = model
+        self.latency = latency
+        self.tokenizer = get_tokenizer()
+
+    def respond(self, prompt: str) -> str:
+        if "知识连接推理引擎" in prompt:
+            return self._rerank(prompt)
+        if "knowledge_points" in prompt:
+            return self._synthesize(prompt)
+        return self._distill(prompt)
+
+    def _distill(self, prompt: str) -> str:
+        parts = prompt.split("---")
+        text = parts[1] if len(parts) >= 3 else prompt
+        counts = Counter(self.tokenizer.tokenize(text))
+        return " ".join(token for token, _ in counts.most_common(FINGERPRINT_TOKENS))
+
+    @staticmethod
+    def _rerank(prompt: str) -> str:
+        ids = re.findall(r"^ID: (.+)$", prompt, flags=re.MULTILINE)
+        match = re.search(r"排名前(\d+)位", prompt)
+        top_k = int(match.group(1)) if match else 3
+        return json.dumps({
+            "results": [{"id": doc_id, "reason": "桩模型：按检索顺序选取"} for doc_id in ids[:top_k]]
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _synthesize(prompt: str) -> str:
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=4).hexdigest()
+        return json.dumps({
+            "knowledge_points": [
+                {
+                    "title": f"合成笔记 {digest}-{i}",
+                    "content": f"---\ntags: [benchmark]\n---\n# 合成笔记 {digest}-{i}\n\n桩模型生成的内容。"
+                }
+                for i in range(2)
+            ]
+        }, ensure_ascii=False)
+
+    def invoke(self, prompt, **kwargs) -> AIMessage:
+        prompt = str(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        content = self.respond(prompt)
+        return AIMessage(content=content, usage_metadata=_usage(prompt, content))
+
+    async def ainvoke(self, prompt, **kwargs) -> AIMessage:
+        prompt = str(prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = self.respond(prompt)
+        return AIMessage(content=content, usage_metadata=_usage(prompt, content))
+
+    async def astream(self, prompt, **kwargs):
+        prompt = str(prompt)
+        content = self.respond(prompt)
+        chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        delay = self.latency / len(chunks) if self.latency and chunks else 0
+        for i, piece in enumerate(chunks):
+            if delay:
+                await asyncio.sleep(delay)
+            usage = _usage(prompt, content) if i == len(chunks) - 1 else None
+            yield AIMessageChunk(content=piece, usage_metadata=usage)
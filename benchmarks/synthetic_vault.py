@@ -0,0 +1,75 @@
+"""
+合成Vault生成器。
+生成可复现的中文/英文/混合Markdown笔记：每篇笔记围绕少数几个主题词，
+词频服从长尾分布，使BM25检索的结果有区分度。
+"""
+import random
+from pathlib import Path
+from typing import List
+
+ZH_PREFIXES = [
+    "机器", "深度", "数据", "知识", "网络", "系统", "模型", "算法", "结构", "语言",
+    "信息", "推理", "检索", "存储", "分布式", "并发", "缓存", "索引", "向量", "图谱",
+]
+ZH_SUFFIXES = ["学习", "分析", "优化", "设计", "架构", "管理", "计算", "表示", "融合", "治理"]
+ZH_FILLERS = ["的", "是", "在", "通过", "因此", "并且", "可以", "需要", "以及", "对于"]
+
+EN_ADJECTIVES = [
+    "distributed", "neural", "adaptive", "semantic", "parallel", "sparse", "robust", "latent",
+    "incremental", "probabilistic", "causal", "federated", "vector", "graph", "streaming",
+    "hierarchical", "symbolic", "temporal", "cached", "compressed",
+]
+EN_NOUNS = [
+    "learning", "retrieval", "index", "inference", "storage", "scheduling", "reasoning",
+    "embedding", "consensus", "compilation",
+]
+EN_FILLERS = ["the", "of", "and", "with", "for", "is", "that", "in", "to", "by"]
+
+ZH_TERMS = [p + s for p in ZH_PREFIXES for s in ZH_SUFFIXES]
+EN_TERMS = [f"{a} {n}" for a in EN_ADJECTIVES for n in EN_NOUNS]
+
+
+def _sentence(rng: random.Random, topics: List[str], terms: List[str], fillers: List[str], zh: bool) -> str:
+    words = []
+    for _ in range(rng.randint(6, 14)):
+        roll = rng.random()
+        if roll < 0.45:
+            words.append(rng.choice(topics))
+        elif roll < 0.6:
+            words.append(rng.choice(terms))
+        else:
+            words.append(rng.choice(fillers))
+    return ("".join(words) + "。") if zh else (" ".join(words).capitalize() + ".")
+
+
+def generate_note(rng: random.Random, language: str = "mixed") -> str:
+    """生成一篇笔记的Markdown文本。language 为 zh / en / mixed。"""
+    if language == "mixed":
+        language = rng.choice(["zh", "en"])
+    zh = language == "zh"
+    terms, fillers = (ZH_TERMS, ZH_FILLERS) if zh else (EN_TERMS, EN_FILLERS)
+    topics = rng.sample(terms, 3)
+
+    lines = [f"# {topics[0]}", ""]
+    for section in range(rng.randint(1, 3)):
+        lines.append(f"## {topics[section % len(topics)]}")
+        for _ in range(rng.randint(1, 3)):
+            lines.append(" ".join(
+                _sentence(rng, topics, terms, fillers, zh) for _ in range(rng.randint(2, 5))
+            ))
+            lines.append("")
+    return "\n".join(lines)
+
+
+def generate_vault(root: Path, num_notes: int, language: str = "mixed", seed: int = 0,
+                   notes_per_dir: int = 500) -> List[Path]:
+    """在 root 下生成 num_notes 篇笔记（每个子目录最多 notes_per_dir 篇），返回文件路径列表。"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(num_notes):
+        directory = root / f"folder_{i // notes_per_dir:04d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"note_{i:06d}.md"
+        path.write_text(generate_note(rng, language), encoding="utf-8")
+        paths.append(path)
+    return paths
@@ -19,9 +19,182 @@ DATA_DIR.mkdir(exist_ok=True)
 # --- 模型配置 ---
 # 来自DeepSeek的强大"炼金术士"LLM，用于所有推理任务。
 ALCHEMY_LLM_MODEL = "deepseek-chat"
+# 各阶段可单独指定模型（例如为指纹提炼使用更便宜的模型）；未配置或为空时使用 ALCHEMY_LLM_MODEL
+STAGE_LLM_MODELS = {
+    "distillation": ALCHEMY_LLM_MODEL,
+    "rerank": ALCHEMY_LLM_MODEL,
+    "synthesis": ALCHEMY_LLM_MODEL,
+}
+# LLM HTTP客户端：总超时与连接超时（秒）、失败重试次数
+LLM_TIMEOUT_SECONDS = 300
+LLM_CONNECT_TIMEOUT_SECONDS = 10
+LLM_MAX_RETRIES = 2
+# 共享连接池：最大连接数、保持keep-alive的空闲连接数及其过期时间（秒）
+LLM_MAX_CONNECTIONS = 20
+LLM_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_KEEPALIVE_EXPIRY_SECONDS = 60
 
 # --- 检索器配置 ---
 # 使用BM25获取候选之前要获取的候选数量
 LIBRARIAN_TOP_K = 10
 # LLM重排序后用作上下文的最终文档数量
-FINAL_TOP_K = 5
\ No newline at end of file
+FINAL_TOP_K = 5
+# 自适应重排序：检索结果足够明确时跳过LLM重排序，或只把难以区分的尾部候选交给LLM
+ADAPTIVE_RERANK = True
+# 候选数不超过该值时（例如库中笔记很少）直接全部使用，不调用LLM重排序
+RERANK_SKIP_MAX_CANDIDATES = FINAL_TOP_K
+# 相邻两个候选的得分差达到最高得分的该比例时，视为分界：分界之前的候选直接入选；
+# 分界恰好落在第 FINAL_TOP_K 名之后时完全跳过LLM重排序
+RERANK_SCORE_GAP = 0.3
+# 启用向量检索或推测检索时候选按RRF融合得分排序，改用该阈值判断分界。
+# 融合得分只取决于各路排名（1 / (RRF_K + 排名) 之和），同一路数命中的相邻候选相差不到最高得分的几个百分点，
+# 较大的间隔几乎只出现在"被更多路检索同时命中"与"被更少路命中"的候选之间，
+# 因此该阈值实际判断的是各路检索是否在前几名上达成一致
+RERANK_FUSED_SCORE_GAP = 0.2
+
+# --- 检索引擎配置 ---
+# BM25检索引擎：
+# - "rank_bm25"：每次查询读取全部指纹并在内存中构建BM25Okapi
+# - "fts5"：使用SQLite FTS5虚拟表及其内置bm25()排序，只返回top-k行
+# - "resident"：进程内常驻的向量化BM25索引，只构建一次并按写入代数增量刷新（适合API进程）
+SEARCH_ENGINE = "rank_bm25"
+# 指纹分词器（写入时分词并持久化，查询端使用同一分词器）：
+# - "ngram" / "ngram3"：CJK片段切分为字符2-gram/3-gram，其他文字按单词切分（默认，无需词典）
+# - "jieba"：jieba词典分词（需要 pip install jieba）
+# - "whitespace"：按空白切分（旧版行为）
+# 修改后下次打开数据库时会自动重新分词全部指纹
+TOKENIZER = "ngram"
+# 写入变更日志保留的条数；常驻索引落后超过该数量时会完整重建
+INDEX_CHANGELOG_RETENTION = 10000
+
+# --- 章节索引配置 ---
+# 是否按Markdown标题把长笔记切分为章节，分别提炼指纹、按章节检索并只取回命中的章节
+# （章节检索始终使用常驻索引；未切分的笔记按整篇作为一个章节参与检索）
+CHUNKED_INDEXING = False
+# 参与切分的标题级别（1 表示只按 # 切分，3 表示按 #、##、### 切分）
+CHUNK_HEADING_LEVELS = 3
+# 短于该字符数的章节并入前一个章节；切分后只剩一个章节的笔记按整篇索引
+CHUNK_MIN_CHARS = 300
+# 章节检索取回 top_k * CHUNK_SEARCH_OVERSAMPLE 个章节，再按笔记聚合
+CHUNK_SEARCH_OVERSAMPLE = 4
+# 笔记得分 = 各命中章节得分按从高到低乘以 CHUNK_AGGREGATION_DECAY ** i 后求和
+CHUNK_AGGREGATION_DECAY = 0.3
+
+# --- 向量检索配置 ---
+# 是否在BM25之外进行本地向量检索，并用倒数排名融合(RRF)合并两路候选
+DENSE_RETRIEVAL = False
+# 嵌入后端：
+# - "sentence_transformers"：本地 sentence-transformers 模型（默认；需要 pip install sentence-transformers，
+#   EMBEDDING_MODEL 为本地目录或已下载到缓存的模型名，不会联网下载）。启用向量检索而模型不可用时直接报错
+# - "hashing"：特征哈希嵌入，仅用于测试和离线基准。它与BM25使用相同的词元，
+#   没有语义泛化能力，融合后只是把词面信号重复计算一次，不要在正式检索中使用
+EMBEDDING_BACKEND = "sentence_transformers"
+EMBEDDING_MODEL = "BAAI/bge-small-zh-v1.5"
+# 哈希嵌入的维度（sentence_transformers 使用模型自身的维度）
+EMBEDDING_DIM = 256
+# 向量矩阵的存储类型："float16" 或 "int8"（体积减半、打分更快，精度略降）
+EMBEDDING_DTYPE = "float16"
+# 每次送入嵌入模型的指纹数量
+EMBEDDING_BATCH_SIZE = 256
+# 向量检索返回的候选数量（融合后仍截取 LIBRARIAN_TOP_K 个）
+DENSE_TOP_K = 10
+# RRF 的平滑常数：得分为 1 / (RRF_K + 排名)
+RRF_K = 60
+
+# --- 推测检索配置 ---
+# 是否在提炼指纹的同时，用从原文中抽取的关键词并行进行一次推测检索，
+# 其结果在指纹检索后与之融合，为重排序提供更大的候选池而不增加等待时间
+SPECULATIVE_RETRIEVAL = False
+# 从原文中抽取的关键词数量（按词频选取，忽略单字符词元和纯数字）
+SPECULATIVE_KEYWORDS = 40
+# 推测检索返回的候选数量；融合后候选池最多为 LIBRARIAN_TOP_K + SPECULATIVE_TOP_K 篇
+SPECULATIVE_TOP_K = 5
+
+# --- SQLite连接配置 ---
+# 每个存储实例保持的只读长连接数量上限（另有一个独占的写连接）
+SQLITE_READ_POOL_SIZE = 4
+# 等待数据库锁的超时时间（毫秒）
+SQLITE_BUSY_TIMEOUT_MS = 5000
+# WAL模式下NORMAL已能保证数据库一致性，仅在断电时可能丢失最近的事务
+SQLITE_SYNCHRONOUS = "NORMAL"
+# 每个连接的页缓存大小（KiB）
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+# 内存映射I/O的大小（字节）
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+# 每个连接缓存的预编译语句数量
+SQLITE_STATEMENT_CACHE_SIZE = 256
+# 异步接口中执行SQLite操作的线程池大小
+SQLITE_EXECUTOR_WORKERS = 4
+
+# --- 正文存储配置 ---
+# 笔记正文按内容哈希去重并压缩保存："zstd"（依赖 requirements.txt 中的 zstandard；
+# 未安装时写入退回 zlib 并打印警告）、"zlib" 或 "none"；修改后只影响新写入的正文，
+# 已有正文仍按各自的压缩方式读取，读取 zstd 正文的进程必须安装 zstandard，否则直接报错
+BODY_COMPRESSION = "zstd"
+# 进程内缓存的解压后正文数量（按最近使用淘汰），0 表示不缓存
+BODY_CACHE_MAX_ENTRIES = 256
+
+# --- 合成上下文配置 ---
+# 合成提示中新文章和上下文笔记合计的token预算，0 表示不压缩
+SYNTHESIS_CONTEXT_TOKEN_BUDGET = 12000
+# 新文章最多占用的预算比例，其余分给上下文笔记
+SYNTHESIS_ARTICLE_BUDGET_RATIO = 0.5
+# 上下文笔记按排名分配预算的衰减系数（第 i 名的权重为 CONTEXT_RANK_DECAY ** i）
+CONTEXT_RANK_DECAY = 0.7
+# token计数方式：
+# - "estimate"：按字符经验估算（CJK字符约1个token，其他约4个字符1个token）
+# - "tiktoken"：使用tiktoken的cl100k_base编码计数（需要 pip install tiktoken）
+CONTEXT_TOKEN_COUNTER = "estimate"
+
+# --- API并发配置 ---
+# 每个API工作进程同时运行的文章处理流程数量上限，超出的请求排队等待
+MAX_CONCURRENT_PIPELINES = 8
+# 批量接口中每批文章同时进行的LLM调用数量上限
+BATCH_CONCURRENCY = 4
+# 批量接口单次请求允许的最大文章数
+BATCH_MAX_ARTICLES = 100
+
+# --- 后台任务配置 ---
+# API进程内执行后台任务的工作协程数量
+JOB_WORKERS = 2
+# 队列为空时检查新任务的间隔（秒）
+JOB_POLL_INTERVAL_SECONDS = 5
+# 运行中任务的心跳间隔（秒）
+JOB_HEARTBEAT_SECONDS = 30
+# 运行中任务超过该时间没有心跳即视为中断，放回队列从检查点继续（秒）
+JOB_LEASE_SECONDS = 120
+# 单个任务的最大执行次数（失败后自动重试）
+JOB_MAX_ATTEMPTS = 3
+
+# --- 批量写入配置 ---
+# 批量写入时每个事务包含的文档数量
+WRITE_BATCH_SIZE = 500
+# 写后缓冲累积到该数量时立即刷新
+WRITE_BUFFER_MAX_ITEMS = 50
+# 写后缓冲的最长刷新间隔（秒）
+WRITE_BUFFER_MAX_DELAY = 2.0
+
+# --- 索引构建配置 ---
+# 构建初始索引时并发提炼指纹的线程数（1 表示顺序处理）
+INDEX_CONCURRENCY = 4
+# 索引器调用LLM的每分钟请求数上限（0 表示不限制）
+INDEX_REQUESTS_PER_MINUTE = 0
+
+# --- 文件监视配置 ---
+# 同一文件在该时间窗口（秒）内的多次变更事件合并为一次处理
+WATCH_DEBOUNCE_SECONDS = 1.0
+# 处理文件变更的工作线程数
+WATCH_WORKERS = 2
+
+# --- 运行指标配置 ---
+# 索引器打印运行指标摘要的间隔（秒），0 表示不打印
+METRICS_SUMMARY_INTERVAL_SECONDS = 60
+
+# --- LLM响应缓存配置 ---
+# 是否缓存LLM响应（键为 模型名 + 提示模板版本 + 渲染后提示的哈希）
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = DATA_DIR / "llm_cache.db"
+# 缓存条目的有效期（秒），0 表示永不过期
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 3600
+# 缓存条目数上限，超出时淘汰最久未访问的条目
+LLM_CACHE_MAX_ENTRIES = 10000
@@ -0,0 +1,337 @@
+"""
+常驻内存的BM25索引。
+在进程内只构建一次，之后依据 reasoning_index 的写入代数(generation)增量刷新；
+使用稀疏的词-文档矩阵和NumPy向量化打分。
+"""
+import math
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Optional, Iterable
+
+import numpy as np
+
+
+class _Segment:
+    """按词排列的稀疏词-文档矩阵（CSC格式：indptr按词ID切分postings）。"""
+
+    def __init__(self, indptr: np.ndarray, slots: np.ndarray, tfs: np.ndarray):
+        self.indptr = indptr
+        self.slots = slots
+        self.tfs = tfs
+        self.num_docs = 0
+
+    @classmethod
+    def empty(cls) -> "_Segment":
+        return cls(
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        if term_id + 1 >= len(self.indptr):
+            return self.slots[:0], self.tfs[:0]
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.slots[start:end], self.tfs[start:end]
+
+
+class ResidentBM25Index:
+    """
+    BM25Okapi的常驻、可增量更新实现。
+
+    文档被分配到只追加的槽位(slot)。更新或删除文档时旧槽位被标记为失效，
+    新版本追加到一个小的增量段(delta)中；增量段或失效槽位过多时，
+    在内存中合并为新的主段，无需重新读取数据库或重新分词。
+    """
+
+    # 增量段文档数超过 max(DELTA_MIN_DOCS, 主段文档数 * DELTA_RATIO) 时合并
+    DELTA_MIN_DOCS = 1000
+    DELTA_RATIO = 0.1
+    # 失效槽位占比超过该值时合并
+    DEAD_RATIO = 0.3
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.generation: Optional[int] = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._vocab: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        self._slot_of: Dict[str, int] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_terms: List[np.ndarray] = []
+        self._doc_tfs: List[np.ndarray] = []
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._total_len = 0.0
+        self._main = _Segment.empty()
+        self._main_end = 0
+        self._delta = _Segment.empty()
+        self._idf: Optional[np.ndarray] = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._slot_of)
+
+    # --- 刷新 ---
+
+    def refresh(self, store) -> None:
+        """若存储的写入代数发生变化，则增量应用变更；首次调用时完整构建。"""
+        with self._lock:
+            generation = store.get_generation()
+            if self.generation == generation:
+                return
+
+            changed_doc_ids = None
+            if self.generation is not None:
+                changed_doc_ids = store.get_changed_doc_ids(self.generation)
+
+            if changed_doc_ids is None:
+                # 尚未构建，或变更日志已被裁剪，只能完整重建
+                self._reset()
+                self._apply(self._load_token_streams(store, None))
+                self._compact()
+            else:
+                token_streams = self._load_token_streams(store, changed_doc_ids)
+                for doc_id in changed_doc_ids:
+                    self._discard(doc_id)
+                self._apply(token_streams)
+                self._maybe_compact()
+
+            self.generation = generation
+
+    def _load_token_streams(self, store, doc_ids: Optional[List[str]]) -> List[tuple]:
+        return store.get_token_streams(doc_ids)
+
+    def _discard(self, doc_id: str):
+        """移除文档的全部条目（文档变更或删除时调用）。"""
+        self._remove(doc_id)
+
+    def _apply(self, token_streams: Iterable[Tuple[str, str]]):
+        """加入 (doc_id, 以空格连接的持久化词元) 序列。"""
+        for doc_id, tokens in token_streams:
+            self._add(doc_id, (tokens or "").split())
+
+    def _add(self, doc_id: str, tokens: List[str]):
+        if doc_id in self._slot_of:
+            self._remove(doc_id)
+
+        counts = Counter(tokens)
+        term_ids = np.fromiter(
+            (self._term_id(term) for term in counts), dtype=np.int64, count=len(counts)
+        )
+        tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+        slot = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._doc_terms.append(term_ids)
+        self._doc_tfs.append(tfs)
+        self._doc_len = self._grow(self._doc_len, slot + 1)
+        self._doc_len[slot] = len(tokens)
+        self._alive = self._grow(self._alive, slot + 1)
+        self._alive[slot] = True
+        self._slot_of[doc_id] = slot
+        self._total_len += len(tokens)
+        self._df[term_ids] += 1
+        self._idf = None
+
+    def _remove(self, doc_id: str):
+        slot = self._slot_of.pop(doc_id, None)
+        if slot is None:
+            return
+        self._alive[slot] = False
+        self._doc_ids[slot] = None
+        self._total_len -= float(self._doc_len[slot])
+        self._df[self._doc_terms[slot]] -= 1
+        self._idf = None
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._vocab.get(term)
+        if term_id is None:
+            term_id = len(self._vocab)
+            self._vocab[term] = term_id
+            self._df = self._grow(self._df, term_id + 1)
+        return term_id
+
+    @staticmethod
+    def _grow(array: np.ndarray, size: int) -> np.ndarray:
+        """按倍增策略扩容数组，保证长度至少为 size。"""
+        if len(array) >= size:
+            return array
+        grown = np.zeros(max(size, len(array) * 2, 16), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def _maybe_compact(self):
+        num_slots = len(self._doc_ids)
+        delta_docs = num_slots - self._main_end
+        dead = num_slots - self.num_docs
+        delta_limit = max(self.DELTA_MIN_DOCS, self._main_end * self.DELTA_RATIO)
+        if delta_docs > delta_limit or (num_slots and dead / num_slots > self.DEAD_RATIO):
+            self._compact()
+        else:
+            self._delta = self._build_segment(range(self._main_end, num_slots))
+
+    def _compact(self):
+        """丢弃失效槽位，把所有存活文档重新排布为一个主段。"""
+        live_slots = [s for s in range(len(self._doc_ids)) if self._alive[s]]
+        doc_ids = [self._doc_ids[s] for s in live_slots]
+        doc_terms = [self._doc_terms[s] for s in live_slots]
+        doc_tfs = [self._doc_tfs[s] for s in live_slots]
+        doc_len = self._doc_len[live_slots] if live_slots else np.zeros(0, dtype=np.float32)
+
+        self._doc_ids = doc_ids
+        self._doc_terms = doc_terms
+        self._doc_tfs = doc_tfs
+        self._doc_len = doc_len.astype(np.float32)
+        self._alive = np.ones(len(doc_ids), dtype=bool)
+        self._slot_of = {doc_id: slot for slot, doc_id in enumerate(doc_ids)}
+        self._main = self._build_segment(range(len(doc_ids)))
+        self._main_end = len(doc_ids)
+        self._delta = _Segment.empty()
+
+    def _build_segment(self, slots: Iterable[int]) -> _Segment:
+        slots = [s for s in slots if self._alive[s]]
+        segment = _Segment.empty()
+        if not slots:
+            return segment
+        terms = np.concatenate([self._doc_terms[s] for s in slots])
+        tfs = np.concatenate([self._doc_tfs[s] for s in slots])
+        lengths = [len(self._doc_terms[s]) for s in slots]
+        slot_arr = np.repeat(np.asarray(slots, dtype=np.int64), lengths)
+
+        order = np.argsort(terms, kind="stable")
+        counts = np.bincount(terms, minlength=len(self._vocab))
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        segment = _Segment(indptr, slot_arr[order], tfs[order])
+        segment.num_docs = len(slots)
+        return segment
+
+    # --- 检索 ---
+
+    def _get_idf(self) -> np.ndarray:
+        """与 rank_bm25.BM25Okapi 一致的IDF：负IDF替换为 epsilon * 平均IDF。"""
+        if self._idf is None:
+            n = self.num_docs
+            df = self._df[:len(self._vocab)].astype(np.float64)
+            present = df > 0
+            idf = np.zeros(len(df), dtype=np.float64)
+            idf[present] = np.log(n - df[present] + 0.5) - np.log(df[present] + 0.5)
+            if present.any():
+                average_idf = idf[present].mean()
+                idf[present & (idf < 0)] = self.epsilon * average_idf
+            self._idf = idf
+        return self._idf
+
+    # 批量检索时每次一起打分的查询数，限制得分矩阵的内存占用
+    QUERY_BLOCK_SIZE = 32
+
+    def search(self, tokens: List[str], top_k: int) -> List[Tuple[str, float]]:
+        """返回得分最高的 top_k 个 (doc_id, score)。"""
+        return self.search_many([tokens], top_k)[0]
+
+    def search_many(self, queries: List[List[str]], top_k: int) -> List[List[Tuple[str, float]]]:
+        """
+        对多条查询一起打分，返回与 queries 顺序一致的结果列表。
+        每个查询词的BM25贡献只计算一次，再累加到所有包含该词的查询行上。
+        """
+        with self._lock:
+            n_docs = self.num_docs
+            if n_docs == 0 or top_k <= 0:
+                return [[] for _ in queries]
+
+            num_slots = len(self._doc_ids)
+            idf = self._get_idf()
+            avgdl = self._total_len / n_docs if self._total_len > 0 else 1.0
+            doc_len = self._doc_len[:num_slots]
+            norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+            dead = ~self._alive[:num_slots]
+            k = min(top_k, n_docs)
+
+            results = []
+            for start in range(0, len(queries), self.QUERY_BLOCK_SIZE):
+                block = queries[start:start + self.QUERY_BLOCK_SIZE]
+                # 词ID -> {查询行: 出现次数}，重复的查询词按次数计分（与 BM25Okapi 一致）
+                term_rows: Dict[int, Counter] = {}
+                for row, tokens in enumerate(block):
+                    for token in tokens:
+                        term_id = self._vocab.get(token)
+                        if term_id is not None:
+                            term_rows.setdefault(term_id, Counter())[row] += 1
+
+                scores = np.zeros((len(block), num_slots), dtype=np.float64)
+                for term_id, rows in term_rows.items():
+                    row_ids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+                    weights = np.fromiter(rows.values(), dtype=np.float64, count=len(rows))
+                    for segment in (self._main, self._delta):
+                        slots, tfs = segment.postings(term_id)
+                        if len(slots):
+                            contribution = idf[term_id] * (
+                                tfs * (self.k1 + 1) / (tfs + norm[slots])
+                            )
+                            scores[np.ix_(row_ids, slots)] += weights[:, None] * contribution
+
+                scores[:, dead] = -math.inf
+                results.extend(self._top_k(row_scores, k) for row_scores in scores)
+            return results
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        num_slots = len(scores)
+        if k < num_slots:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(num_slots)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (self._doc_ids[slot], float(scores[slot]))
+            for slot in top
+            if self._alive[slot]
+        ][:k]
+
+
+class ResidentChunkIndex(ResidentBM25Index):
+    """
+    按章节(chunk)打分的常驻索引。条目键为 (doc_id, ordinal)；
+    变更日志仍以文档为单位，文档变更时整体替换它的全部章节。
+    """
+
+    def _reset(self):
+        super()._reset()
+        self._chunks_of: Dict[str, List[Tuple[str, int]]] = {}
+
+    def _load_token_streams(self, store, doc_ids: Optional[List[str]]) -> List[tuple]:
+        return store.get_chunk_token_streams(doc_ids)
+
+    def _discard(self, doc_id: str):
+        for key in self._chunks_of.pop(doc_id, []):
+            self._remove(key)
+
+    def _apply(self, token_streams: Iterable[Tuple[str, int, str]]):
+        """加入 (doc_id, 章节序号, 以空格连接的持久化词元) 序列。"""
+        for doc_id, ordinal, tokens in token_streams:
+            key = (doc_id, ordinal)
+            if key not in self._slot_of:
+                self._chunks_of.setdefault(doc_id, []).append(key)
+            self._add(key, (tokens or "").split())
+
+
+# 进程级共享的常驻索引（按数据库路径和索引粒度区分）
+_resident_indexes: Dict[Tuple[str, bool], ResidentBM25Index] = {}
+_resident_indexes_lock = threading.Lock()
+
+
+def get_resident_index(db_path, chunked: bool = False) -> ResidentBM25Index:
+    """获取（必要时创建）指定数据库对应的进程级常驻索引；chunked 为 True 时返回章节级索引。"""
+    key = (str(db_path), chunked)
+    with _resident_indexes_lock:
+        index = _resident_indexes.get(key)
+        if index is None:
+            index = ResidentChunkIndex() if chunked else ResidentBM25Index()
+            _resident_indexes[key] = index
+        return index
@@ -0,0 +1,119 @@
+"""
+笔记正文的压缩编码与进程内缓存。
+正文按内容哈希寻址保存在 reasoning_blobs 表中（内容相同的笔记共用一份），
+写入时用 zstd 压缩（未安装 zstandard 时退回标准库 zlib），读取时按需解压；
+最近读取的正文以内容哈希为键保存在一个小的LRU缓存中，内容不可变，因此无需失效。
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import config
+from src import metrics
+
+# 压缩后不比原文小时按原样保存
+RAW_CODEC = "none"
+
+_warned_zstd_fallback = False
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def body_hash(text: str) -> str:
+    """计算正文的内容哈希，作为 reasoning_blobs 的主键。"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """
+    返回实际使用的压缩方式：配置为 zstd 但未安装 zstandard 时退回 zlib 并打印一次警告。
+    zlib 正文任何进程都能读取；反过来，zstd 正文只能由安装了 zstandard 的进程读取。
+    """
+    global _warned_zstd_fallback
+    codec = codec or config.BODY_COMPRESSION
+    if codec == "zstd" and _zstandard() is None:
+        if not _warned_zstd_fallback:
+            _warned_zstd_fallback = True
+            print("警告：未安装 zstandard，正文改用 zlib 压缩（pip install -r requirements.txt）")
+        return "zlib"
+    if codec not in ("zstd", "zlib", RAW_CODEC):
+        raise ValueError(f"不支持的正文压缩方式: {codec}")
+    return codec
+
+
+def compress(text: str, codec: Optional[str] = None) -> Tuple[str, bytes]:
+    """压缩正文，返回 (压缩方式, 数据)。"""
+    raw = text.encode("utf-8")
+    codec = resolve_codec(codec)
+    if codec == "zstd":
+        # ZstdCompressor 不是线程安全的，每次压缩单独创建
+        data = _zstandard().ZstdCompressor().compress(raw)
+    elif codec == "zlib":
+        data = zlib.compress(raw)
+    else:
+        data = raw
+    if len(data) >= len(raw):
+        return RAW_CODEC, raw
+    return codec, data
+
+
+def decompress(codec: str, data: bytes) -> str:
+    """按压缩方式解压正文。"""
+    if codec == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError("读取 zstd 压缩的正文需要先安装：pip install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec != RAW_CODEC:
+        raise ValueError(f"不支持的正文压缩方式: {codec}")
+    return bytes(data).decode("utf-8")
+
+
+class BodyCache:
+    """以内容哈希为键、按条数淘汰最久未访问条目的解压后正文缓存（线程安全）。"""
+
+    def __init__(self, max_entries: int = config.BODY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, str]:
+        """返回已缓存的 {内容哈希: 正文}，并把命中的条目移到最近使用的位置。"""
+        found = {}
+        requested = 0
+        with self._lock:
+            for digest in hashes:
+                requested += 1
+                text = self._entries.get(digest)
+                if text is not None:
+                    self._entries.move_to_end(digest)
+                    found[digest] = text
+        if found:
+            metrics.BODY_CACHE.inc(len(found), result="hit")
+        if requested > len(found):
+            metrics.BODY_CACHE.inc(requested - len(found), result="miss")
+        return found
+
+    def put_many(self, bodies: Dict[str, str]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for digest, text in bodies.items():
+                self._entries[digest] = text
+                self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
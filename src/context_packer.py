@@ -0,0 +1,187 @@
+"""
+合成提示的上下文打包。
+在给定的token预算内分配新文章和按排名排序的上下文笔记所占的篇幅：
+排名越靠前的笔记分得的预算越多，超出预算的笔记保留YAML前端信息和所有标题，
+只保留与查询指纹最相关的段落，而不是简单地截断末尾。
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from src.tokenizer import get_tokenizer
+
+_CJK_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]")
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+# 被省略的段落用该标记代替
+OMISSION_MARK = "……"
+# 剩余预算不少于该值时，把放不下的最相关段落截断后放入
+MIN_FRAGMENT_TOKENS = 32
+
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    try:
+        import tiktoken
+    except ImportError as e:
+        raise ImportError("使用 tiktoken 计数需要先安装：pip install tiktoken") from e
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """
+    估算文本的token数。
+    默认按经验估算：每个CJK字符约1个token，其他非空白字符约4个字符1个token；
+    CONTEXT_TOKEN_COUNTER 为 "tiktoken" 时使用 tiktoken 精确计数。
+    """
+    if not text:
+        return 0
+    if config.CONTEXT_TOKEN_COUNTER == "tiktoken":
+        return len(_tiktoken_encoding().encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    others = len(text) - cjk - sum(1 for ch in text if ch.isspace())
+    return cjk + math.ceil(max(others, 0) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """把文本截断到不超过 max_tokens 个token。"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if config.CONTEXT_TOKEN_COUNTER == "tiktoken":
+        encoding = _tiktoken_encoding()
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def _split_blocks(text: str) -> List[Tuple[str, str]]:
+    """
+    把Markdown切分为 (类型, 文本) 块：
+    "front_matter" 为开头的YAML前端信息，"heading" 为标题行，"paragraph" 为空行分隔的段落。
+    """
+    lines = text.split("\n")
+    blocks: List[Tuple[str, str]] = []
+    start = 0
+    if lines and lines[0].strip() == "---":
+        for i in range(1, len(lines)):
+            if lines[i].strip() == "---":
+                blocks.append(("front_matter", "\n".join(lines[:i + 1])))
+                start = i + 1
+                break
+
+    paragraph: List[str] = []
+    for line in lines[start:]:
+        if _HEADING_RE.match(line) or not line.strip():
+            if paragraph:
+                blocks.append(("paragraph", "\n".join(paragraph)))
+                paragraph = []
+            if line.strip():
+                blocks.append(("heading", line))
+        else:
+            paragraph.append(line)
+    if paragraph:
+        blocks.append(("paragraph", "\n".join(paragraph)))
+    return blocks
+
+
+def _relevance(text: str, query_tokens: set) -> float:
+    tokens = get_tokenizer().tokenize(text)
+    if not tokens or not query_tokens:
+        return 0.0
+    matched = len(query_tokens.intersection(tokens))
+    # 按段落长度归一化，避免长段落仅凭篇幅占优
+    return matched / math.sqrt(len(tokens))
+
+
+def trim_to_budget(text: str, budget: int, query: str = "") -> str:
+    """
+    把一篇Markdown压缩到 budget 个token以内。
+    保留前端信息和所有标题，按与 query 的相关度挑选段落，并保持原有顺序，
+    省略的连续段落用 OMISSION_MARK 标出。前端信息和标题放入后已容纳不下
+    MIN_FRAGMENT_TOKENS 的正文时，只保留最相关段落的开头，避免只剩标题而没有内容。
+    """
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+
+    blocks = _split_blocks(text)
+    costs = [count_tokens(block) for _, block in blocks]
+    query_tokens = set(get_tokenizer().tokenize(query))
+    paragraphs = [i for i, (kind, _) in enumerate(blocks) if kind == "paragraph"]
+    if not paragraphs:
+        return truncate_to_tokens(text, budget)
+    # 相关度相同时优先保留靠前的段落
+    paragraphs.sort(key=lambda i: (-_relevance(blocks[i][1], query_tokens), i))
+
+    # 省略标记本身也占用少量预算
+    mark_cost = count_tokens(OMISSION_MARK)
+    required = sum(cost for (kind, _), cost in zip(blocks, costs) if kind != "paragraph")
+    remaining = budget - required - mark_cost * len(paragraphs)
+    if remaining < MIN_FRAGMENT_TOKENS:
+        best = blocks[paragraphs[0]][1]
+        if budget <= mark_cost:
+            return truncate_to_tokens(best, budget)
+        return truncate_to_tokens(best, budget - mark_cost) + OMISSION_MARK
+
+    kept: Dict[int, str] = {}
+    for i in paragraphs:
+        if costs[i] <= remaining:
+            kept[i] = blocks[i][1]
+            remaining -= costs[i]
+    for i in paragraphs:
+        if i not in kept:
+            if remaining >= MIN_FRAGMENT_TOKENS:
+                kept[i] = truncate_to_tokens(blocks[i][1], remaining) + OMISSION_MARK
+            break
+
+    parts: List[str] = []
+    for i, (kind, block) in enumerate(blocks):
+        if kind != "paragraph":
+            parts.append(block)
+        elif i in kept:
+            parts.append(kept[i])
+        elif not parts or parts[-1] != OMISSION_MARK:
+            parts.append(OMISSION_MARK)
+    return "\n\n".join(parts)
+
+
+def pack_context(article: str, notes: List[Dict[str, Any]], query: str = "",
+                 budget: Optional[int] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    在 budget（默认 SYNTHESIS_CONTEXT_TOKEN_BUDGET）内打包新文章和上下文笔记。
+    notes 按排名排序，返回 (文章文本, 笔记列表)，笔记的 full_text 为压缩后的内容。
+    - 文章最多占用 SYNTHESIS_ARTICLE_BUDGET_RATIO 比例的预算
+    - 剩余预算按 CONTEXT_RANK_DECAY 的几何衰减权重分给各笔记，
+      较短的笔记用不完的预算顺延给排名靠后的笔记
+    - 分得的预算放不下 MIN_FRAGMENT_TOKENS 的正文时，该笔记及排名更靠后的笔记都不放入结果
+    budget 为 0 时不做任何压缩。
+    """
+    budget = config.SYNTHESIS_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if budget <= 0:
+        return article, notes
+
+    article_budget = int(budget * config.SYNTHESIS_ARTICLE_BUDGET_RATIO)
+    packed_article = trim_to_budget(article, article_budget, query)
+    remaining = budget - count_tokens(packed_article)
+
+    weights = [config.CONTEXT_RANK_DECAY ** rank for rank in range(len(notes))]
+    packed_notes = []
+    for rank, note in enumerate(notes):
+        share = int(remaining * weights[rank] / sum(weights[rank:]))
+        if share < MIN_FRAGMENT_TOKENS and count_tokens(note["full_text"]) > share:
+            break
+        text = trim_to_budget(note["full_text"], share, query)
+        remaining -= count_tokens(text)
+        packed_notes.append({**note, "full_text": text})
+    return packed_article, packed_notes
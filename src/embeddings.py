@@ -0,0 +1,355 @@
+"""
+本地向量检索。
+用本地 sentence-transformers 模型为每篇笔记的指纹计算紧凑向量（测试和离线基准可改用哈希嵌入），
+以连续的 float16/int8 矩阵保存在 data/ 下并通过内存映射加载；
+检索时向量化计算余弦相似度，再与BM25结果做倒数排名融合(RRF)。
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from src.tokenizer import get_tokenizer
+
+
+class Embedder:
+    """嵌入模型基类。embed 返回按行L2归一化的 float32 矩阵。"""
+
+    name = "base"
+    dim = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+@lru_cache(maxsize=65536)
+def _hash_bucket(token: str, dim: int) -> Tuple[int, float]:
+    value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+class HashingEmbedder(Embedder):
+    """
+    特征哈希嵌入：词元和相邻词元对带符号地哈希到固定维度，词频取对数后做L2归一化。
+    仅用于测试和离线基准：它与BM25使用相同的词元，不具备语义泛化能力，
+    与BM25融合只会重复计算词面信号，不能找回措辞不同的笔记。
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.tokenizer = get_tokenizer()
+        self.name = f"hashing{dim}-{self.tokenizer.name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = self.tokenizer.tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                column, sign = _hash_bucket(feature, self.dim)
+                matrix[row, column] += sign
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """sentence-transformers 模型（可选依赖），只从本地目录或已下载的缓存加载，不访问网络。"""
+
+    def __init__(self, model: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "使用 sentence_transformers 嵌入需要先安装：pip install sentence-transformers"
+            ) from e
+        try:
+            self._model = SentenceTransformer(model, local_files_only=True)
+        except Exception as e:
+            raise RuntimeError(
+                f"无法从本地加载嵌入模型 {model}：请先下载模型，或把 EMBEDDING_MODEL 指向本地模型目录"
+            ) from e
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f"st-{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+@lru_cache(maxsize=None)
+def _create_embedder(backend: str, model: str, dim: int) -> Embedder:
+    if backend == "sentence_transformers":
+        return SentenceTransformerEmbedder(model)
+    if backend == "hashing":
+        print("警告：哈希嵌入仅用于测试和离线基准，不能提供语义召回")
+        return HashingEmbedder(dim)
+    raise ValueError(f"未知的嵌入后端: {backend}")
+
+
+def get_embedder() -> Embedder:
+    """按 config.EMBEDDING_BACKEND 获取（进程内共享的）嵌入模型。"""
+    return _create_embedder(config.EMBEDDING_BACKEND, config.EMBEDDING_MODEL, config.EMBEDDING_DIM)
+
+
+# int8 量化：归一化向量的分量在 [-1, 1] 内，按 127 缩放
+INT8_SCALE = 127.0
+
+
+class DenseIndex:
+    """
+    指纹向量的常驻索引。
+
+    主矩阵以 .npy 快照的形式保存在数据目录中并以内存映射方式只读加载，
+    之后依据 reasoning_index 的写入代数增量刷新：变更的文档在主矩阵中标记为失效，
+    新向量追加到内存中的增量矩阵；增量或失效行过多时合并并写出新的快照。
+    进程重启后从快照记录的代数开始追赶变更日志，只为期间变更的文档重新计算向量。
+    """
+
+    # 增量行数超过 max(DELTA_MIN_ROWS, 主矩阵行数 * DELTA_RATIO) 时合并
+    DELTA_MIN_ROWS = 1000
+    DELTA_RATIO = 0.1
+    # 失效行占比超过该值时合并
+    DEAD_RATIO = 0.3
+    # 打分时每次从内存映射转换的行数，限制临时内存
+    SCORE_BLOCK_ROWS = 65536
+    META_FILE = "dense.json"
+
+    def __init__(self, directory: Path, embedder: Embedder, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"不支持的向量存储类型: {dtype}")
+        self.directory = Path(directory)
+        self.embedder = embedder
+        self.dtype = dtype
+        self.generation: Optional[int] = None
+        # 构建快照时所用数据库的标识（见 ReasoningIndexStore.database_id）
+        self.database_id: Optional[str] = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._main = np.zeros((0, self.embedder.dim), dtype=self.dtype)
+        self._delta = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._doc_ids: List[Optional[str]] = []
+        self._slot_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._slot_of)
+
+    # --- 刷新 ---
+
+    def refresh(self, store) -> None:
+        """若存储的写入代数发生变化，则增量应用变更；首次调用时加载快照或完整构建。"""
+        with self._lock:
+            if not self._loaded:
+                self._load_snapshot()
+                self._loaded = True
+
+            generation = store.get_generation()
+            if self.database_id != store.database_id or (
+                self.generation is not None and self.generation > generation
+            ):
+                # 快照来自另一个数据库（例如数据库被删除后重建），其代数与变更日志都不可比较
+                if self.generation is not None:
+                    print("向量快照与当前数据库不匹配，将重新构建")
+                self.generation = None
+                self.database_id = store.database_id
+            elif self.generation == generation:
+                return
+
+            changed_doc_ids = None
+            if self.generation is not None:
+                changed_doc_ids = store.get_changed_doc_ids(self.generation)
+
+            if changed_doc_ids is None:
+                # 没有可用的快照，或变更日志已被裁剪，只能完整重建
+                self._reset()
+                self._append(store.get_fingerprints())
+                self._compact(generation)
+            else:
+                rows = store.get_fingerprints(changed_doc_ids)
+                for doc_id in changed_doc_ids:
+                    self._remove(doc_id)
+                self._append(rows)
+                if self._needs_compaction():
+                    self._compact(generation)
+
+            self.generation = generation
+
+    def _append(self, rows: List[Tuple[str, str]]):
+        """计算 (doc_id, 指纹) 的向量并追加到增量矩阵。"""
+        vectors = []
+        for start in range(0, len(rows), config.EMBEDDING_BATCH_SIZE):
+            batch = rows[start:start + config.EMBEDDING_BATCH_SIZE]
+            vectors.append(self.embedder.embed([fingerprint or "" for _, fingerprint in batch]))
+        if not vectors:
+            return
+        self._delta = np.concatenate([self._delta, *vectors])
+        for doc_id, _ in rows:
+            self._remove(doc_id)
+            self._slot_of[doc_id] = len(self._doc_ids)
+            self._doc_ids.append(doc_id)
+        self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+
+    def _remove(self, doc_id: str):
+        slot = self._slot_of.pop(doc_id, None)
+        if slot is not None:
+            self._alive[slot] = False
+            self._doc_ids[slot] = None
+
+    def _needs_compaction(self) -> bool:
+        num_slots = len(self._doc_ids)
+        delta_limit = max(self.DELTA_MIN_ROWS, len(self._main) * self.DELTA_RATIO)
+        dead = num_slots - self.num_docs
+        return len(self._delta) > delta_limit or (num_slots and dead / num_slots > self.DEAD_RATIO)
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            return np.round(vectors * INT8_SCALE).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _compact(self, generation: int):
+        """丢弃失效行，把主矩阵和增量矩阵合并为新的快照文件并重新映射。"""
+        main_alive = self._alive[:len(self._main)]
+        delta_alive = self._alive[len(self._main):]
+        matrix = np.concatenate([
+            np.asarray(self._main[main_alive]), self._quantize(self._delta[delta_alive])
+        ])
+        doc_ids = [doc_id for doc_id in self._doc_ids if doc_id is not None]
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        matrix_file = f"dense-{generation}.npy"
+        # 先写临时文件再原子替换：其他进程读取到的总是完整的快照
+        temp_path = self.directory / f".{matrix_file}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(temp_path, self.directory / matrix_file)
+        self._write_meta({
+            "embedder": self.embedder.name,
+            "dtype": self.dtype,
+            "database_id": self.database_id,
+            "generation": generation,
+            "matrix": matrix_file,
+            "doc_ids": doc_ids,
+        })
+        self._remove_stale_snapshots(matrix_file)
+
+        self._main = np.load(self.directory / matrix_file, mmap_mode="r")
+        self._delta = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._doc_ids = doc_ids
+        self._slot_of = {doc_id: slot for slot, doc_id in enumerate(doc_ids)}
+        self._alive = np.ones(len(doc_ids), dtype=bool)
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        temp_path = self.directory / f".{self.META_FILE}.{os.getpid()}.tmp"
+        temp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp_path, self.directory / self.META_FILE)
+
+    def _remove_stale_snapshots(self, current: str):
+        # 已映射旧快照的进程不受删除影响
+        for path in self.directory.glob("dense-*.npy"):
+            if path.name != current:
+                path.unlink(missing_ok=True)
+
+    def _load_snapshot(self):
+        """加载与当前嵌入模型和存储类型一致的快照；不存在或不匹配时保持为空。"""
+        meta_path = self.directory / self.META_FILE
+        if not meta_path.exists():
+            return
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta["embedder"] != self.embedder.name or meta["dtype"] != self.dtype:
+                print(f"向量快照由 {meta['embedder']}/{meta['dtype']} 生成，与当前配置不同，将重新构建")
+                return
+            main = np.load(self.directory / meta["matrix"], mmap_mode="r")
+            if main.shape != (len(meta["doc_ids"]), self.embedder.dim):
+                raise ValueError(f"快照形状 {main.shape} 与记录不符")
+        except Exception as e:
+            print(f"加载向量快照失败，将重新构建: {e}")
+            return
+        self._main = main
+        self._doc_ids = list(meta["doc_ids"])
+        self._slot_of = {doc_id: slot for slot, doc_id in enumerate(self._doc_ids)}
+        self._alive = np.ones(len(self._doc_ids), dtype=bool)
+        self.generation = meta["generation"]
+        self.database_id = meta.get("database_id")
+
+    # --- 检索 ---
+
+    def search_many(self, queries: List[str], top_k: int) -> List[List[Tuple[str, float]]]:
+        """对多条查询文本做精确的余弦相似度检索，返回与 queries 顺序一致的 (doc_id, score) 列表。"""
+        with self._lock:
+            if self.num_docs == 0 or top_k <= 0 or not queries:
+                return [[] for _ in queries]
+
+            query_vectors = self.embedder.embed(queries)
+            num_main = len(self._main)
+            scores = np.empty((len(queries), len(self._doc_ids)), dtype=np.float32)
+            scale = 1.0 / INT8_SCALE if self.dtype == "int8" else 1.0
+            for start in range(0, num_main, self.SCORE_BLOCK_ROWS):
+                block = np.asarray(self._main[start:start + self.SCORE_BLOCK_ROWS], dtype=np.float32)
+                scores[:, start:start + len(block)] = query_vectors @ block.T * scale
+            if len(self._delta):
+                scores[:, num_main:] = query_vectors @ self._delta.T
+            scores[:, ~self._alive] = -math.inf
+
+            k = min(top_k, self.num_docs)
+            results = []
+            for row_scores in scores:
+                top = np.argpartition(-row_scores, k - 1)[:k] if k < len(row_scores) else np.arange(len(row_scores))
+                top = top[np.argsort(-row_scores[top], kind="stable")]
+                results.append([
+                    (self._doc_ids[slot], float(row_scores[slot])) for slot in top if self._alive[slot]
+                ][:k])
+            return results
+
+
+# 进程级共享的向量索引（按数据库路径区分）
+_dense_indexes: Dict[str, DenseIndex] = {}
+_dense_indexes_lock = threading.Lock()
+
+
+def get_dense_index(db_path) -> DenseIndex:
+    """获取（必要时创建）指定数据库对应的进程级向量索引，快照保存在数据库旁的目录中。"""
+    key = str(db_path)
+    with _dense_indexes_lock:
+        index = _dense_indexes.get(key)
+        if index is None:
+            directory = Path(db_path).with_name(Path(db_path).stem + "_embeddings")
+            index = DenseIndex(directory, get_embedder(), config.EMBEDDING_DTYPE)
+            _dense_indexes[key] = index
+        return index
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]], top_k: int, k: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    倒数排名融合：每个结果列表中排名为 r（从1开始）的文档得分 1 / (k + r)，跨列表累加后排序。
+    同一文档保留第一个列表中的句柄（例如带有命中章节的BM25句柄），并附上 fusion_score。
+    """
+    k = config.RRF_K if k is None else k
+    scores: Dict[str, float] = {}
+    handles: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, handle in enumerate(results, start=1):
+            doc_id = handle["doc_id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            handles.setdefault(doc_id, handle)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [dict(handles[doc_id], fusion_score=scores[doc_id]) for doc_id in ranked]
@@ -5,6 +5,7 @@
 import streamlit as st
 import requests
 import json
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -18,6 +19,23 @@ st.set_page_config(
 
 # API配置
 API_BASE_URL = "http://127.0.0.1:8000"
+# 轮询后台任务状态的间隔（秒）
+JOB_POLL_INTERVAL = 2
+# 单次等待后台任务的最长时间（秒）；超时后任务仍在后台执行，可刷新页面或按任务ID继续查看
+JOB_WAIT_TIMEOUT = 30 * 60
+# 记录等待中任务ID的URL查询参数（session_state 在浏览器刷新后会被清空）
+JOB_QUERY_PARAM = "job"
+
+# 后台任务各节点完成后的进度说明
+JOB_STAGE_LABELS = {
+    None: "⏳ 等待执行...",
+    "distill_fingerprint": "🔍 已提炼文章指纹，正在检索候选笔记...",
+    "filter_candidates": "📚 已检索候选笔记，正在重排序...",
+    "reason_and_rerank": "🧠 已完成重排序，正在读取上下文笔记...",
+    "skip_rerank": "🧠 检索结果明确，已跳过重排序，正在读取上下文笔记...",
+    "fetch_context": "✍️ 正在生成笔记...",
+    "synthesize_note": "✅ 笔记已生成",
+}
 
 # 自定义CSS样式
 st.markdown("""
@@ -60,26 +78,87 @@ def check_api_health():
     except:
         return False
 
-def process_article(text, source_url=""):
-    """调用API处理文章"""
+def iter_sse_events(response):
+    """解析server-sent events响应，逐个产出 (事件名, 数据)"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            # 空行表示一个事件结束
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def process_article_stream(text, source_url=""):
+    """调用流式API处理文章，实时显示各阶段进度和已生成的知识点"""
     try:
         payload = {
             "text": text,
             "source_url": source_url
         }
 
-        with st.spinner("🧪 正在处理文章，请稍候..."):
-            response = requests.post(
-                f"{API_BASE_URL}/process-article",
-                json=payload,
-                timeout=600  # 10分钟超时
-            )
+        result = None
+        knowledge_points = []
+        received_chars = 0
+        points_placeholder = None
 
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("generated_note", []), None
-        else:
-            return None, f"API错误: {response.status_code} - {response.text}"
+        with st.status("🧪 正在处理文章...", expanded=True) as status:
+            with requests.post(
+                f"{API_BASE_URL}/process-article/stream",
+                json=payload,
+                stream=True,
+                timeout=600  # 两次数据之间最长等待10分钟
+            ) as response:
+                if response.status_code != 200:
+                    status.update(label="❌ 处理失败", state="error")
+                    return None, f"API错误: {response.status_code} - {response.text}"
+
+                response.encoding = "utf-8"
+                for event, data in iter_sse_events(response):
+                    if event == "fingerprint":
+                        st.write("🔍 已提炼文章指纹")
+                        st.caption(data.get("fingerprint", "")[:300])
+                    elif event == "speculative_candidates":
+                        st.write(f"⚡ 按原文关键词预检索到 {len(data.get('doc_ids', []))} 篇候选笔记")
+                    elif event == "candidates":
+                        st.write(f"📚 检索到 {len(data.get('doc_ids', []))} 篇候选笔记")
+                    elif event == "rerank":
+                        st.write("🧠 检索结果明确，跳过重排序：" if data.get("skipped") else "🧠 重排序完成：")
+                        for item in data.get("results", []):
+                            st.markdown(f"- **{item['doc_id']}**：{item.get('reason', '')}")
+                    elif event == "context":
+                        st.write(f"📖 已读取 {len(data.get('doc_ids', []))} 篇上下文笔记，开始生成笔记...")
+                        points_placeholder = st.empty()
+                    elif event == "token":
+                        received_chars += len(data.get("text", ""))
+                        status.update(label=f"✍️ 正在生成笔记（已接收 {received_chars} 字）...")
+                    elif event == "knowledge_point":
+                        # 每个知识点生成完毕后立即显示，无需等待全部完成
+                        knowledge_points.append(data)
+                        if points_placeholder is None:
+                            points_placeholder = st.empty()
+                        with points_placeholder.container():
+                            for kp in knowledge_points:
+                                with st.expander(f"📝 {kp.get('title', '未知标题')}"):
+                                    st.markdown(kp.get("content", ""))
+                    elif event == "result":
+                        result = data.get("generated_note", [])
+                    elif event == "error":
+                        status.update(label="❌ 处理失败", state="error")
+                        return None, f"处理文章时出错: {data.get('message', '')}"
+
+            if result is None:
+                status.update(label="❌ 处理中断", state="error")
+                return None, "连接中断，未收到完整结果"
+
+            status.update(label="✅ 处理完成", state="complete", expanded=False)
+
+        return result, None
 
     except requests.exceptions.Timeout:
         return None, "请求超时，请稍后重试"
@@ -88,6 +167,66 @@ def process_article(text, source_url=""):
     except Exception as e:
         return None, f"处理文章时出错: {str(e)}"
 
+def submit_job(text, source_url=""):
+    """提交后台处理任务，返回 (任务ID, 错误信息)"""
+    try:
+        payload = {
+            "text": text,
+            "source_url": source_url
+        }
+        response = requests.post(f"{API_BASE_URL}/jobs", json=payload, timeout=30)
+        if response.status_code == 202:
+            return response.json()["job_id"], None
+        return None, f"API错误: {response.status_code} - {response.text}"
+    except requests.exceptions.ConnectionError:
+        return None, "无法连接到API服务器，请确保服务正在运行"
+    except Exception as e:
+        return None, f"提交任务时出错: {str(e)}"
+
+def wait_for_job(job_id):
+    """
+    轮询后台任务直到完成或超过 JOB_WAIT_TIMEOUT，返回 (结果, 错误信息, 是否已结束)；
+    API暂时不可用时继续等待（任务会在服务重启后继续执行）
+    """
+    deadline = time.monotonic() + JOB_WAIT_TIMEOUT
+    with st.status("🧪 正在处理文章...", expanded=True) as status:
+        st.caption(f"任务ID: {job_id}")
+        while True:
+            if time.monotonic() > deadline:
+                status.update(label="⏰ 等待超时，任务仍在后台执行", state="error")
+                return None, (
+                    f"等待超过 {JOB_WAIT_TIMEOUT // 60} 分钟，任务 {job_id} 仍在后台执行。"
+                    f"可稍后刷新本页面继续等待，或访问 {API_BASE_URL}/jobs/{job_id} 查看结果"
+                ), False
+            try:
+                response = requests.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=10)
+            except requests.exceptions.RequestException:
+                status.update(label="⚠️ 暂时无法连接API服务器，稍后自动重试...")
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            if response.status_code == 404:
+                status.update(label="❌ 任务不存在", state="error")
+                return None, f"任务 {job_id} 不存在", True
+            if response.status_code != 200:
+                status.update(label="⚠️ 查询任务状态失败，稍后自动重试...")
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            job = response.json()
+            if job["status"] == "succeeded":
+                status.update(label="✅ 处理完成", state="complete", expanded=False)
+                return job.get("generated_note", []), None, True
+            if job["status"] == "failed":
+                status.update(label="❌ 处理失败", state="error")
+                return None, f"处理文章时出错: {job.get('error', '')}", True
+
+            label = JOB_STAGE_LABELS.get(job.get("last_node"), "🧪 正在处理文章...")
+            if job.get("attempts", 0) > 1:
+                label += f"（第 {job['attempts']} 次尝试）"
+            status.update(label=label)
+            time.sleep(JOB_POLL_INTERVAL)
+
 def save_knowledge_point(knowledge_point, save_folder="lang_vault/lang-vault"):
     """保存知识点到文件"""
     try:
@@ -138,6 +277,15 @@ def main():
             st.error("❌ API服务器未运行")
             st.info("请确保已启动API服务器：\n```bash\n./start.sh\n```")
 
+        st.markdown("---")
+        st.header("处理方式")
+        processing_mode = st.radio(
+            "处理方式",
+            ["后台任务", "流式输出"],
+            label_visibility="collapsed",
+            help="后台任务：提交后轮询结果，任务ID记录在页面地址中，刷新页面或API重启都不会丢失进度；流式输出：实时显示生成过程"
+        )
+
         st.markdown("---")
         st.header("使用说明")
         st.markdown("""
@@ -184,14 +332,36 @@ def main():
             if not check_api_health():
                 st.error("API服务器未运行，请先启动服务")
             else:
-                result, error = process_article(article_text, source_url)
-
-                if error:
-                    st.markdown(f'<div class="error-box">{error}</div>', unsafe_allow_html=True)
+                if processing_mode == "后台任务":
+                    job_id, error = submit_job(article_text, source_url)
+                    if job_id:
+                        # 任务ID写入页面地址，浏览器刷新后继续等待同一个任务
+                        st.query_params[JOB_QUERY_PARAM] = job_id
+                    else:
+                        st.markdown(f'<div class="error-box">{error}</div>', unsafe_allow_html=True)
                 else:
-                    st.session_state.generated_note = result
-                    st.session_state.processed_at = datetime.now()
-                    st.success("✅ 文章处理完成！")
+                    result, error = process_article_stream(article_text, source_url)
+
+                    if error:
+                        st.markdown(f'<div class="error-box">{error}</div>', unsafe_allow_html=True)
+                    else:
+                        st.session_state.generated_note = result
+                        st.session_state.processed_at = datetime.now()
+                        st.success("✅ 文章处理完成！")
+
+    # 等待未完成的后台任务
+    pending_job_id = st.query_params.get(JOB_QUERY_PARAM)
+    if pending_job_id:
+        result, error, finished = wait_for_job(pending_job_id)
+        if finished:
+            del st.query_params[JOB_QUERY_PARAM]
+
+        if error:
+            st.markdown(f'<div class="error-box">{error}</div>', unsafe_allow_html=True)
+        else:
+            st.session_state.generated_note = result
+            st.session_state.processed_at = datetime.now()
+            st.success("✅ 文章处理完成！")
 
     # 生成的笔记部分
     if "generated_note" in st.session_state:
@@ -1,159 +1,409 @@
 """
 核心LangGraph定义和节点。
 定义了处理新文章的有状态图。
+每个节点同时提供同步与异步实现：invoke 走同步路径，ainvoke 走异步路径
+（LLM调用使用 ainvoke，SQLite操作放到线程池中执行，不阻塞事件循环）。
 """
+import asyncio
+import functools
 import json
-import os
-from typing import List, Dict, Any
+from collections import Counter
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple, Union
 from typing_extensions import TypedDict
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import PromptTemplate
-from langgraph.graph import StateGraph, END
-from pydantic import SecretStr
+from langchain_core.runnables import RunnableLambda
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, START, END
 
 import config
-from src import storage
-from src.prompts import DISTILLATION_PROMPT, REASONING_MATCH_PROMPT, SYNTHESIS_PROMPT
+from src import metrics, storage
+from src.context_packer import count_tokens, pack_context
+from src.embeddings import reciprocal_rank_fusion
+from src.llm import get_llm
+from src.llm_cache import cached_invoke, acached_invoke
+from src.prompts import (
+    DISTILLATION_PROMPT, DISTILLATION_PROMPT_VERSION,
+    REASONING_MATCH_PROMPT, REASONING_MATCH_PROMPT_VERSION,
+    SYNTHESIS_PROMPT, SYNTHESIS_PROMPT_VERSION,
+)
+from src.stream_parser import KnowledgePointStreamParser
+from src.tokenizer import get_tokenizer
 
 
 # 定义图的状态
 class KnowledgeAlchemistState(TypedDict):
     article_text: str
     source_url: str
+    # 为 True 时本次运行的LLM调用跳过响应缓存
+    bypass_cache: bool
+    # 为 True 时合成阶段以流式调用LLM，并通过 custom 流模式发出 token / knowledge_point 事件
+    stream_tokens: bool
     query_fingerprint: str
+    # 推测检索（与指纹提炼并行）得到的候选，在 filter_candidates 中与指纹检索结果融合
+    speculative_candidates: List[Dict[str, Any]]
     candidates: List[Dict[str, Any]]
     ranked_candidates: List[Dict[str, Any]]
     context_notes: List[Dict[str, Any]]
     final_note: str
+    # 从检查点恢复时要执行的第一个节点（为空时从头开始）
+    resume_from: str
+
+
+# 节点的执行顺序
+NODE_ORDER = [
+    "distill_fingerprint",
+    "filter_candidates",
+    "reason_and_rerank",
+    "fetch_context",
+    "synthesize_note",
+]
+# 分支节点在执行顺序中所占的位置（skip_rerank 代替 reason_and_rerank）
+NODE_ALIASES = {"skip_rerank": "reason_and_rerank"}
+# 与 distill_fingerprint 并行的推测检索节点，不单独占用检查点位置
+SPECULATIVE_NODE = "speculative_retrieval"
 
 
 # 定义图的节点
+def _build_distillation_prompt(state: KnowledgeAlchemistState) -> str:
+    return DISTILLATION_PROMPT.format(text=state["article_text"])
+
+
 def distill_fingerprint_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
     """提炼新文章的指纹。"""
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    llm_instance = ChatDeepSeek(
-        model=config.ALCHEMY_LLM_MODEL,
-        api_key=SecretStr(api_key) if api_key else None
+    fingerprint = cached_invoke(
+        get_llm("distillation"), _build_distillation_prompt(state), DISTILLATION_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), stage="distillation"
     )
-    prompt = DISTILLATION_PROMPT.format(text=state["article_text"])
-    response = llm_instance.invoke(prompt)
-    fingerprint = response.content if hasattr(response, 'content') else str(response)
-    # 确保指纹是字符串
-    if not isinstance(fingerprint, str):
-        fingerprint = str(fingerprint)
     return {"query_fingerprint": fingerprint}
 
 
+async def adistill_fingerprint_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """提炼新文章的指纹（异步）。"""
+    fingerprint = await acached_invoke(
+        get_llm("distillation"), _build_distillation_prompt(state), DISTILLATION_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), stage="distillation"
+    )
+    return {"query_fingerprint": fingerprint}
+
+
+def extract_keywords(text: str, limit: int = config.SPECULATIVE_KEYWORDS) -> List[str]:
+    """
+    不调用LLM，从原文中按词频抽取 limit 个关键词元（使用索引的分词器）。
+    单字符词元和纯数字区分度太低，不参与选取；词频相同时先出现的优先。
+    """
+    counts = Counter(
+        token for token in get_tokenizer().tokenize(text)
+        if len(token) > 1 and not token.isdigit()
+    )
+    return [token for token, _ in counts.most_common(limit)]
+
+
+def speculative_retrieval_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """
+    用原文关键词进行推测检索，与指纹提炼并行执行；未启用推测检索时直接返回。
+    推测检索只是尽力而为：出错时记录日志并返回空结果，filter_candidates 按常规路径检索。
+    """
+    if not config.SPECULATIVE_RETRIEVAL:
+        return {"speculative_candidates": []}
+    try:
+        candidates = storage.get_store().search_by_bm25(
+            query=extract_keywords(state["article_text"]),
+            top_k=config.SPECULATIVE_TOP_K
+        )
+    except Exception as e:
+        print(f"推测检索失败，回退到常规检索: {e}")
+        return {"speculative_candidates": []}
+    metrics.CANDIDATES.observe(len(candidates), stage="speculative")
+    return {"speculative_candidates": _slim_candidates(candidates)}
+
+
+async def aspeculative_retrieval_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """用原文关键词进行推测检索（在数据库线程池中执行）。"""
+    return await storage.run_in_db_thread(speculative_retrieval_node, state)
+
+
+def _merge_candidates(
+    candidates: List[Dict[str, Any]], dense: Optional[List[Dict[str, Any]]],
+    speculative: Optional[List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """把指纹检索结果与向量检索、推测检索的结果按倒数排名融合；没有其他来源时原样返回。"""
+    result_lists = [candidates] + [results for results in (dense, speculative) if results is not None]
+    if len(result_lists) == 1:
+        return candidates
+    top_k = config.LIBRARIAN_TOP_K + (config.SPECULATIVE_TOP_K if speculative is not None else 0)
+    return reciprocal_rank_fusion(result_lists, top_k)
+
+
 def filter_candidates_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
-    """使用BM25过滤候选笔记。"""
-    store_instance = storage.ReasoningIndexStore()
+    """使用BM25过滤候选笔记（启用推测检索时在此与推测检索的结果汇合）。"""
+    store_instance = storage.get_store()
+    # 查询端使用与写入时相同的分词器
+    query_tokens = get_tokenizer().tokenize(state["query_fingerprint"])
     candidates = store_instance.search_by_bm25(
-        query=state["query_fingerprint"],
+        query=query_tokens,
         top_k=config.LIBRARIAN_TOP_K
     )
-    return {"candidates": candidates}
+    metrics.CANDIDATES.observe(len(candidates), stage="bm25")
+    dense = None
+    if config.DENSE_RETRIEVAL:
+        # 向量检索补充措辞不同但概念相关的笔记，与BM25结果按倒数排名融合
+        dense = store_instance.search_by_embedding(state["query_fingerprint"], top_k=config.DENSE_TOP_K)
+    speculative = state.get("speculative_candidates") if config.SPECULATIVE_RETRIEVAL else None
+    candidates = _merge_candidates(candidates, dense, speculative)
+    return {"candidates": _slim_candidates(candidates)}
 
 
-def reason_and_rerank_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
-    """使用LLM推理和重排序候选笔记。"""
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    llm_instance = ChatDeepSeek(
-        model=config.ALCHEMY_LLM_MODEL,
-        api_key=SecretStr(api_key) if api_key else None
-    )
-    
+async def afilter_candidates_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """使用BM25过滤候选笔记（在数据库线程池中执行）。"""
+    return await storage.run_in_db_thread(filter_candidates_node, state)
+
+
+# 图状态中候选句柄保留的字段：状态在节点之间传递并写入任务检查点，
+# 因此只携带排序和取正文所需的字段，元数据与正文不进入状态
+CANDIDATE_FIELDS = ("doc_id", "fingerprint_text", "score", "fusion_score", "chunks")
+
+
+def _slim_candidates(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{field: c[field] for field in CANDIDATE_FIELDS if field in c} for c in candidates]
+
+
+def _candidate_fingerprint(candidate: Dict[str, Any]) -> str:
+    # 章节检索的候选只展示命中章节的指纹
+    if candidate.get("chunks"):
+        return " / ".join(chunk["fingerprint_text"] for chunk in candidate["chunks"])
+    return candidate["fingerprint_text"]
+
+
+# 未经LLM重排序、按检索得分直接入选的候选附带的理由
+CONFIDENT_REASON = "检索得分明显领先，未经LLM重排序直接入选"
+
+
+def _candidate_score(candidate: Dict[str, Any]) -> Optional[float]:
+    # 融合检索的候选按融合得分排序
+    return candidate.get("fusion_score", candidate.get("score"))
+
+
+def _confident_head(candidates: List[Dict[str, Any]]) -> int:
+    """
+    返回按检索得分可以直接入选的前几名候选数（0 ~ FINAL_TOP_K）。
+    从前 FINAL_TOP_K 名中找出最靠后的一个分界：相邻得分差不小于最高得分的 RERANK_SCORE_GAP 倍；
+    融合检索的候选改用 RERANK_FUSED_SCORE_GAP，分界即各路检索一致命中的前几名与其余候选之间。
+    """
+    if not config.ADAPTIVE_RERANK or not candidates:
+        return 0
+    if len(candidates) <= config.RERANK_SKIP_MAX_CANDIDATES:
+        return min(len(candidates), config.FINAL_TOP_K)
+    scores = [_candidate_score(c) for c in candidates]
+    if any(score is None for score in scores) or scores[0] <= 0:
+        return 0
+    threshold = config.RERANK_FUSED_SCORE_GAP if "fusion_score" in candidates[0] else config.RERANK_SCORE_GAP
+    head = 0
+    for j in range(1, min(config.FINAL_TOP_K, len(scores)) + 1):
+        next_score = scores[j] if j < len(scores) else 0.0
+        if (scores[j - 1] - next_score) / scores[0] >= threshold:
+            head = j
+    return head
+
+
+def _route_rerank(state: KnowledgeAlchemistState) -> str:
+    """条件边：检索结果已能确定全部上下文笔记时跳过LLM重排序。"""
+    if _confident_head(state["candidates"]) >= min(len(state["candidates"]), config.FINAL_TOP_K):
+        return "skip_rerank"
+    return "reason_and_rerank"
+
+
+def skip_rerank_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """按检索得分直接选出前 FINAL_TOP_K 个候选，不调用LLM。"""
+    ranked_candidates = [
+        dict(candidate, reason=CONFIDENT_REASON) for candidate in state["candidates"][:config.FINAL_TOP_K]
+    ]
+    metrics.RERANK_PATH.inc(path="skip")
+    metrics.CANDIDATES.observe(len(ranked_candidates), stage="rerank")
+    return {"ranked_candidates": ranked_candidates}
+
+
+async def askip_rerank_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    return skip_rerank_node(state)
+
+
+def _build_rerank_prompt(state: KnowledgeAlchemistState) -> str:
+    # 得分明显领先的候选直接入选，只让LLM在其余候选中选出剩下的名额
+    head = _confident_head(state["candidates"])
     # 格式化候选指纹
     candidate_fingerprints = "\n".join([
-        f"ID: {c['doc_id']}\n指纹: {c['fingerprint_text']}"
-        for c in state["candidates"]
+        f"ID: {c['doc_id']}\n指纹: {_candidate_fingerprint(c)}"
+        for c in state["candidates"][head:]
     ])
-    
+
     # 构建推理提示
-    prompt = REASONING_MATCH_PROMPT.format(
+    return REASONING_MATCH_PROMPT.format(
         query_fingerprint=state["query_fingerprint"],
         candidate_fingerprints=candidate_fingerprints,
-        top_k=config.FINAL_TOP_K
+        top_k=config.FINAL_TOP_K - head
     )
-    
-    # 获取LLM响应
-    response = llm_instance.invoke(prompt)
-    result_text = response.content if hasattr(response, 'content') else str(response)
-    # 确保结果是字符串
-    if not isinstance(result_text, str):
-        result_text = str(result_text)
-    
-    # 解析响应
+
+
+def _load_rerank_results(result_text: str) -> List[Tuple[str, str]]:
+    """解析重排序响应为 (ID, 理由) 列表，格式不符时抛出 ValueError。"""
     try:
         result = json.loads(result_text)
-        ranked_ids = [item["id"] for item in result["results"]]
-        
-        # 根据排名ID排序候选
+        return [(item["id"], item.get("reason", "")) for item in result["results"]]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"重排序响应格式不符: {e}") from e
+
+
+def _is_valid_response(loader: Callable[[str], Any]) -> Callable[[str], bool]:
+    """把解析函数包装为响应缓存的校验函数：无法解析的响应不写入缓存。"""
+    def validate(text: str) -> bool:
+        try:
+            loader(text)
+        except ValueError:
+            return False
+        return True
+    return validate
+
+
+def _parse_rerank_response(state: KnowledgeAlchemistState, result_text: str) -> Dict[str, Any]:
+    head = _confident_head(state["candidates"])
+    confident = [dict(c, reason=CONFIDENT_REASON) for c in state["candidates"][:head]]
+    tail = state["candidates"][head:]
+    metrics.RERANK_PATH.inc(path="shrink" if head else "full")
+
+    # 解析响应
+    try:
+        ranked_items = _load_rerank_results(result_text)
+
+        # 根据排名ID排序候选，并附上LLM给出的理由
         ranked_candidates = []
-        for ranked_id in ranked_ids:
-            for candidate in state["candidates"]:
+        for ranked_id, reason in ranked_items:
+            for candidate in tail:
                 if candidate["doc_id"] == ranked_id:
-                    ranked_candidates.append(candidate)
+                    ranked_candidates.append(dict(candidate, reason=reason))
                     break
-        
-        return {"ranked_candidates": ranked_candidates[:config.FINAL_TOP_K]}
-    except (json.JSONDecodeError, KeyError):
+
+        ranked_candidates = (confident + ranked_candidates)[:config.FINAL_TOP_K]
+    except ValueError:
         # 如果解析失败，使用前N个候选
-        return {"ranked_candidates": state["candidates"][:config.FINAL_TOP_K]}
+        ranked_candidates = state["candidates"][:config.FINAL_TOP_K]
+
+    metrics.CANDIDATES.observe(len(ranked_candidates), stage="rerank")
+    return {"ranked_candidates": ranked_candidates}
+
+
+def reason_and_rerank_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """使用LLM推理和重排序候选笔记。"""
+    # 获取LLM响应
+    result_text = cached_invoke(
+        get_llm("rerank"), _build_rerank_prompt(state), REASONING_MATCH_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), stage="rerank",
+        validate=_valid_rerank_response
+    )
+    return _parse_rerank_response(state, result_text)
+
+
+async def areason_and_rerank_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """使用LLM推理和重排序候选笔记（异步）。"""
+    result_text = await acached_invoke(
+        get_llm("rerank"), _build_rerank_prompt(state), REASONING_MATCH_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), stage="rerank",
+        validate=_valid_rerank_response
+    )
+    return _parse_rerank_response(state, result_text)
+
+
+def _matched_sections(full_text: str, candidate: Dict[str, Any]) -> str:
+    """章节检索的候选只保留命中的章节（按原文顺序），不相邻的章节之间用省略号分隔。"""
+    chunks = candidate.get("chunks")
+    if not chunks or not full_text or any(c["start_offset"] is None for c in chunks):
+        return full_text
+    sections = []
+    previous_end = 0
+    for chunk in sorted(chunks, key=lambda c: c["start_offset"]):
+        if chunk["start_offset"] > previous_end:
+            sections.append("……")
+        sections.append(full_text[chunk["start_offset"]:chunk["end_offset"]].strip())
+        previous_end = chunk["end_offset"]
+    if previous_end < len(full_text.rstrip()):
+        sections.append("……")
+    return "\n\n".join(sections)
+
+
+def _context_notes(ranked_candidates: List[Dict[str, Any]], bodies: Dict[str, str]) -> List[Dict[str, Any]]:
+    """按排名组装上下文笔记，只包含合成所需的 doc_id 和 full_text；已被删除的笔记被跳过。"""
+    return [
+        {"doc_id": c["doc_id"], "full_text": _matched_sections(bodies[c["doc_id"]], c)}
+        for c in ranked_candidates if bodies.get(c["doc_id"]) is not None
+    ]
 
 
 def fetch_context_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
-    """获取上下文笔记的完整文本。"""
-    store_instance = storage.ReasoningIndexStore()
-    context_notes = []
-    for candidate in state["ranked_candidates"]:
-        doc = store_instance.get_document(candidate["doc_id"])
-        if doc:
-            context_notes.append(doc)
-    
+    """获取上下文笔记的完整文本（章节检索时只取命中的章节）。"""
+    # 检索阶段只携带轻量句柄，仅在此用一次 IN 查询为最终的 FINAL_TOP_K 篇笔记从冷表读取正文
+    bodies = storage.get_store().get_bodies([c["doc_id"] for c in state["ranked_candidates"]])
+    context_notes = _context_notes(state["ranked_candidates"], bodies)
+
+    metrics.CANDIDATES.observe(len(context_notes), stage="context")
     return {"context_notes": context_notes}
 
 
-def synthesize_note_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
-    """合成最终的新笔记。"""
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    llm_instance = ChatDeepSeek(
-        model=config.ALCHEMY_LLM_MODEL,
-        api_key=SecretStr(api_key) if api_key else None
+async def afetch_context_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """获取上下文笔记的完整文本（在数据库线程池中执行）。"""
+    return await storage.run_in_db_thread(fetch_context_node, state)
+
+
+def _build_synthesis_prompt(state: KnowledgeAlchemistState) -> str:
+    # 在token预算内压缩文章和上下文笔记，排名靠前的笔记保留更多内容
+    article, context_notes = pack_context(
+        state["article_text"], state["context_notes"], state.get("query_fingerprint", "")
     )
-    
+    for packing, (text, notes) in (
+        ("raw", (state["article_text"], state["context_notes"])), ("packed", (article, context_notes))
+    ):
+        metrics.CONTEXT_TOKENS.observe(count_tokens(text), part="article", packing=packing)
+        metrics.CONTEXT_TOKENS.observe(
+            sum(count_tokens(note["full_text"]) for note in notes), part="notes", packing=packing
+        )
+
     # 格式化上下文笔记
     context_notes_text = "\n---\n".join([
         f"笔记ID: {note['doc_id']}\n内容:\n{note['full_text']}"
-        for note in state["context_notes"]
+        for note in context_notes
     ])
-    
+
     # 构建合成提示
-    prompt = SYNTHESIS_PROMPT.format(
+    return SYNTHESIS_PROMPT.format(
         source_url=state["source_url"],
-        new_article=state["article_text"],
+        new_article=article,
         context_notes=context_notes_text
     )
-    
-    # 生成最终笔记
-    response = llm_instance.invoke(prompt)
-    response_text = response.content if hasattr(response, 'content') else str(response)
-    # 确保响应是字符串
-    if not isinstance(response_text, str):
-        response_text = str(response_text)
 
+
+def _load_knowledge_points(response_text: str) -> List[Dict[str, Any]]:
+    """解析合成响应中的 knowledge_points 列表，格式不符时抛出 ValueError。"""
+    # 清理响应文本，移除可能的markdown代码块标记
+    cleaned_text = response_text.strip()
+    if cleaned_text.startswith('```json'):
+        cleaned_text = cleaned_text[7:]
+    if cleaned_text.endswith('```'):
+        cleaned_text = cleaned_text[:-3]
+    cleaned_text = cleaned_text.strip()
+
+    parsed_response = json.loads(cleaned_text)
+    if not isinstance(parsed_response, dict) or not isinstance(parsed_response.get("knowledge_points", []), list):
+        raise ValueError("合成响应中缺少 knowledge_points 列表")
+    return parsed_response.get("knowledge_points", [])
+
+
+# 只缓存能被解析的重排序和合成响应（json.JSONDecodeError 是 ValueError 的子类）
+_valid_rerank_response = _is_valid_response(_load_rerank_results)
+_valid_synthesis_response = _is_valid_response(_load_knowledge_points)
+
+
+def _parse_synthesis_response(response_text: str) -> Dict[str, Any]:
     # 尝试解析JSON响应
     try:
-        # 清理响应文本，移除可能的markdown代码块标记
-        cleaned_text = response_text.strip()
-        if cleaned_text.startswith('```json'):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith('```'):
-            cleaned_text = cleaned_text[:-3]
-        cleaned_text = cleaned_text.strip()
-
-        parsed_response = json.loads(cleaned_text)
-        final_note = parsed_response.get("knowledge_points", [])
-    except (json.JSONDecodeError, Exception) as e:
+        final_note = _load_knowledge_points(response_text)
+    except ValueError as e:
         print(f"解析JSON响应时出错: {e}")
         # 如果解析失败，返回原始文本作为单个知识点
         final_note = [{
@@ -164,28 +414,97 @@ def synthesize_note_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
     return {"final_note": final_note}
 
 
+def synthesize_note_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """合成最终的新笔记。"""
+    # 生成最终笔记
+    response_text = cached_invoke(
+        get_llm("synthesis"), _build_synthesis_prompt(state), SYNTHESIS_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), stage="synthesis",
+        validate=_valid_synthesis_response
+    )
+    return _parse_synthesis_response(response_text)
+
+
+async def _asynthesize_note(state: KnowledgeAlchemistState, writer=None) -> Dict[str, Any]:
+    on_token = None
+    if writer is not None:
+        parser = KnowledgePointStreamParser()
+
+        def on_token(text: str):
+            writer({"event": "token", "data": {"text": text}})
+            points = parser.feed(text)
+            first_index = parser.count - len(points)
+            for offset, point in enumerate(points):
+                writer({"event": "knowledge_point", "data": {"index": first_index + offset, **point}})
+
+    response_text = await acached_invoke(
+        get_llm("synthesis"), _build_synthesis_prompt(state), SYNTHESIS_PROMPT_VERSION,
+        bypass=state.get("bypass_cache", False), on_token=on_token, stage="synthesis",
+        validate=_valid_synthesis_response
+    )
+    return _parse_synthesis_response(response_text)
+
+
+async def asynthesize_note_node(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """
+    合成最终的新笔记（异步）。
+    stream_tokens 为 True 时以流式方式调用LLM，通过 custom 流模式逐段发出 token 事件，
+    每个知识点完整生成后立即发出 knowledge_point 事件。
+    """
+    writer = get_stream_writer() if state.get("stream_tokens") else None
+    return await _asynthesize_note(state, writer)
+
+
+def _node(name: str, func, afunc) -> RunnableLambda:
+    """组合同步与异步实现：图的 invoke 调用 func，ainvoke 调用 afunc；两者都记录耗时和异常次数。"""
+    @functools.wraps(func)
+    def run(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+        with metrics.track(metrics.NODE_LATENCY, metrics.NODE_ERRORS, node=name):
+            return func(state)
+
+    @functools.wraps(afunc)
+    async def arun(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+        with metrics.track(metrics.NODE_LATENCY, metrics.NODE_ERRORS, node=name):
+            return await afunc(state)
+
+    return RunnableLambda(run, afunc=arun, name=func.__name__)
+
+
+def _route_entry(state: KnowledgeAlchemistState) -> Union[str, List[str]]:
+    """入口路由：从检查点恢复时跳过已完成的节点。"""
+    resume_from = state.get("resume_from") or NODE_ORDER[0]
+    if resume_from == "reason_and_rerank":
+        return _route_rerank(state)
+    if resume_from == NODE_ORDER[0]:
+        # 推测检索与指纹提炼同时开始，两者都完成后在 filter_candidates 汇合
+        return [NODE_ORDER[0], SPECULATIVE_NODE]
+    return resume_from
+
+
 # 构建图
 def create_knowledge_alchemist_graph():
     """创建知识炼金术师图。"""
     graph = StateGraph(KnowledgeAlchemistState)
-    
+
     # 添加节点
-    graph.add_node("distill_fingerprint", distill_fingerprint_node)
-    graph.add_node("filter_candidates", filter_candidates_node)
-    graph.add_node("reason_and_rerank", reason_and_rerank_node)
-    graph.add_node("fetch_context", fetch_context_node)
-    graph.add_node("synthesize_note", synthesize_note_node)
-    
+    graph.add_node("distill_fingerprint", _node("distill_fingerprint", distill_fingerprint_node, adistill_fingerprint_node))
+    graph.add_node(SPECULATIVE_NODE, _node(SPECULATIVE_NODE, speculative_retrieval_node, aspeculative_retrieval_node))
+    graph.add_node("filter_candidates", _node("filter_candidates", filter_candidates_node, afilter_candidates_node))
+    graph.add_node("reason_and_rerank", _node("reason_and_rerank", reason_and_rerank_node, areason_and_rerank_node))
+    graph.add_node("skip_rerank", _node("skip_rerank", skip_rerank_node, askip_rerank_node))
+    graph.add_node("fetch_context", _node("fetch_context", fetch_context_node, afetch_context_node))
+    graph.add_node("synthesize_note", _node("synthesize_note", synthesize_note_node, asynthesize_note_node))
+
     # 添加边
-    graph.add_edge("distill_fingerprint", "filter_candidates")
-    graph.add_edge("filter_candidates", "reason_and_rerank")
+    graph.add_conditional_edges(START, _route_entry, NODE_ORDER + ["skip_rerank", SPECULATIVE_NODE])
+    # filter_candidates 等待指纹提炼和推测检索都完成（从检查点恢复时由入口路由直接进入）
+    graph.add_edge(["distill_fingerprint", SPECULATIVE_NODE], "filter_candidates")
+    graph.add_conditional_edges("filter_candidates", _route_rerank, ["reason_and_rerank", "skip_rerank"])
     graph.add_edge("reason_and_rerank", "fetch_context")
+    graph.add_edge("skip_rerank", "fetch_context")
     graph.add_edge("fetch_context", "synthesize_note")
     graph.add_edge("synthesize_note", END)
-    
-    # 设置入口点
-    graph.set_entry_point("distill_fingerprint")
-    
+
     return graph.compile()
 
 
@@ -193,23 +512,217 @@ def create_knowledge_alchemist_graph():
 knowledge_alchemist_graph = create_knowledge_alchemist_graph()
 
 
-def process_article(article_text: str, source_url: str = "") -> str:
-    """处理新文章的便捷函数。"""
-    # 加载环境变量
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    initial_state: KnowledgeAlchemistState = {
+def _initial_state(
+    article_text: str, source_url: str, bypass_cache: bool, stream_tokens: bool = False
+) -> KnowledgeAlchemistState:
+    return {
         "article_text": article_text,
         "source_url": source_url,
+        "bypass_cache": bypass_cache,
+        "stream_tokens": stream_tokens,
         "query_fingerprint": "",
+        "speculative_candidates": [],
         "candidates": [],
         "ranked_candidates": [],
         "context_notes": [],
         "final_note": ""
     }
-    
+
+
+async def arun_resumable(
+    article_text: str, source_url: str = "", bypass_cache: bool = False,
+    last_node: Optional[str] = None, checkpoint_state: Optional[Dict[str, Any]] = None,
+    on_checkpoint: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None
+) -> Any:
+    """
+    可断点续跑地运行流程并返回 final_note。
+    last_node / checkpoint_state 为之前保存的检查点，将从 last_node 的下一个节点继续；
+    每个节点完成后以 (节点名, 当前完整状态) 调用 on_checkpoint。
+    """
+    state = _initial_state(article_text, source_url, bypass_cache)
+    if last_node is not None:
+        state.update(checkpoint_state or {})
+        next_index = NODE_ORDER.index(NODE_ALIASES.get(last_node, last_node)) + 1
+        if next_index == len(NODE_ORDER):
+            return state["final_note"]
+        state["resume_from"] = NODE_ORDER[next_index]
+
+    async for chunk in knowledge_alchemist_graph.astream(state, stream_mode="updates"):
+        for node, update in chunk.items():
+            state.update(update)
+            if node == SPECULATIVE_NODE:
+                # 推测检索的结果随下一个检查点一并保存
+                continue
+            if on_checkpoint is not None:
+                await on_checkpoint(node, {k: v for k, v in state.items() if k != "resume_from"})
+    return state["final_note"]
+
+
+def process_article(article_text: str, source_url: str = "", bypass_cache: bool = False) -> str:
+    """处理新文章的便捷函数。bypass_cache 为 True 时不读取LLM响应缓存。"""
+    # 加载环境变量
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # 运行图
-    final_state = knowledge_alchemist_graph.invoke(initial_state)
-    
-    return final_state["final_note"]
\ No newline at end of file
+    final_state = knowledge_alchemist_graph.invoke(
+        _initial_state(article_text, source_url, bypass_cache)
+    )
+
+    return final_state["final_note"]
+
+
+async def aprocess_article(article_text: str, source_url: str = "", bypass_cache: bool = False) -> str:
+    """process_article 的异步版本：整个流程不阻塞事件循环。"""
+    final_state = await knowledge_alchemist_graph.ainvoke(
+        _initial_state(article_text, source_url, bypass_cache)
+    )
+    return final_state["final_note"]
+
+
+def _stage_event(node: str, update: Dict[str, Any]):
+    """把节点完成后的状态更新转换为 (事件名, 数据)。"""
+    if node == "distill_fingerprint":
+        return "fingerprint", {"fingerprint": update["query_fingerprint"]}
+    if node == SPECULATIVE_NODE:
+        return "speculative_candidates", {"doc_ids": [c["doc_id"] for c in update["speculative_candidates"]]}
+    if node == "filter_candidates":
+        return "candidates", {"doc_ids": [c["doc_id"] for c in update["candidates"]]}
+    if node in ("reason_and_rerank", "skip_rerank"):
+        return "rerank", {"skipped": node == "skip_rerank", "results": [
+            {"doc_id": c["doc_id"], "reason": c.get("reason", "")}
+            for c in update["ranked_candidates"]
+        ]}
+    if node == "fetch_context":
+        return "context", {"doc_ids": [note["doc_id"] for note in update["context_notes"]]}
+    if node == "synthesize_note":
+        return "result", {"generated_note": update["final_note"]}
+    return node, {}
+
+
+async def astream_article_events(
+    article_text: str, source_url: str = "", bypass_cache: bool = False
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    以异步生成器的形式运行流程，依次产出 (事件名, 数据)：
+    每个节点完成时产出 fingerprint / candidates / rerank / context / result，
+    合成阶段产出 token（文本片段）与 knowledge_point（完整的单个知识点）。
+    """
+    async for mode, chunk in knowledge_alchemist_graph.astream(
+        _initial_state(article_text, source_url, bypass_cache, stream_tokens=True),
+        stream_mode=["updates", "custom"]
+    ):
+        if mode == "custom":
+            yield chunk["event"], chunk["data"]
+        else:
+            for node, update in chunk.items():
+                if node == SPECULATIVE_NODE and not config.SPECULATIVE_RETRIEVAL:
+                    continue
+                yield _stage_event(node, update)
+
+
+async def _arerank_adaptive(state: KnowledgeAlchemistState) -> Dict[str, Any]:
+    """批量处理中逐篇选择重排序路径（与图中的条件边一致）。"""
+    if _route_rerank(state) == "skip_rerank":
+        return skip_rerank_node(state)
+    return await areason_and_rerank_node(state)
+
+
+async def aprocess_articles(
+    articles: List[Dict[str, Any]], concurrency: int = config.BATCH_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    批量处理多篇文章，articles 的每一项包含 text / source_url / bypass_cache。
+
+    各阶段依次对整批文章执行：LLM调用在 concurrency 限制下并发；
+    所有查询指纹在一次检索中打分；多篇文章共用的上下文笔记只读取一次。
+    单篇文章出错只记录在该项的 error 中，其余文章继续处理。
+    返回与输入顺序一致的 {"generated_note": ..., "error": ...} 列表。
+    """
+    states = [
+        _initial_state(a["text"], a.get("source_url") or "", a.get("bypass_cache", False))
+        for a in articles
+    ]
+    errors: List[Optional[str]] = [None] * len(states)
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    def pending() -> List[int]:
+        return [i for i, error in enumerate(errors) if error is None]
+
+    async def run_stage(stage: str, node):
+        async def run_one(i: int):
+            async with limit:
+                try:
+                    with metrics.track(metrics.NODE_LATENCY, metrics.NODE_ERRORS, node=stage):
+                        states[i].update(await node(states[i]))
+                except Exception as e:
+                    errors[i] = f"{stage}: {e}"
+        await asyncio.gather(*(run_one(i) for i in pending()))
+
+    async def run_shared(stage: str, func, indices: List[int]):
+        try:
+            await storage.run_in_db_thread(func, indices)
+        except Exception as e:
+            for i in indices:
+                errors[i] = f"{stage}: {e}"
+
+    def speculate_all(indices: List[int]):
+        # 所有文章的原文关键词一次性打分，与指纹提炼阶段并行；
+        # 出错时不标记文章失败，speculative_candidates 保持为空，按常规路径检索
+        try:
+            results = storage.get_store().search_by_bm25_many(
+                [extract_keywords(states[i]["article_text"]) for i in indices],
+                top_k=config.SPECULATIVE_TOP_K
+            )
+        except Exception as e:
+            print(f"批量推测检索失败，回退到常规检索: {e}")
+            return
+        for i, candidates in zip(indices, results):
+            metrics.CANDIDATES.observe(len(candidates), stage="speculative")
+            states[i]["speculative_candidates"] = _slim_candidates(candidates)
+
+    def filter_all(indices: List[int]):
+        # 所有查询指纹一次性打分
+        tokenizer = get_tokenizer()
+        store_instance = storage.get_store()
+        results = store_instance.search_by_bm25_many(
+            [tokenizer.tokenize(states[i]["query_fingerprint"]) for i in indices],
+            top_k=config.LIBRARIAN_TOP_K
+        )
+        if config.DENSE_RETRIEVAL:
+            dense_results = store_instance.search_by_embedding_many(
+                [states[i]["query_fingerprint"] for i in indices], top_k=config.DENSE_TOP_K
+            )
+        for n, (i, candidates) in enumerate(zip(indices, results)):
+            metrics.CANDIDATES.observe(len(candidates), stage="bm25")
+            candidates = _merge_candidates(
+                candidates,
+                dense_results[n] if config.DENSE_RETRIEVAL else None,
+                states[i]["speculative_candidates"] if config.SPECULATIVE_RETRIEVAL else None,
+            )
+            states[i]["candidates"] = _slim_candidates(candidates)
+
+    def fetch_all(indices: List[int]):
+        # 合并所有文章需要的上下文笔记，重复的笔记只读取一次
+        doc_ids = list(dict.fromkeys(c["doc_id"] for i in indices for c in states[i]["ranked_candidates"]))
+        bodies = storage.get_store().get_bodies(doc_ids)
+        for i in indices:
+            states[i]["context_notes"] = _context_notes(states[i]["ranked_candidates"], bodies)
+            metrics.CANDIDATES.observe(len(states[i]["context_notes"]), stage="context")
+
+    if config.SPECULATIVE_RETRIEVAL:
+        await asyncio.gather(
+            run_stage("distill_fingerprint", adistill_fingerprint_node),
+            run_shared(SPECULATIVE_NODE, speculate_all, pending()),
+        )
+    else:
+        await run_stage("distill_fingerprint", adistill_fingerprint_node)
+    await run_shared("filter_candidates", filter_all, pending())
+    await run_stage("reason_and_rerank", _arerank_adaptive)
+    await run_shared("fetch_context", fetch_all, pending())
+    await run_stage("synthesize_note", _asynthesize_note)
+
+    return [
+        {"generated_note": state["final_note"] if error is None else None, "error": error}
+        for state, error in zip(states, errors)
+    ]
@@ -3,39 +3,100 @@
 负责扫描Vault以构建初始推理索引，并监视文件更改以保持索引最新。
 """
 import os
+import re
 import time
 import hashlib
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Set
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import PromptTemplate
-from pydantic import SecretStr
 from dotenv import load_dotenv
 
 import config
-from src import storage
-from src.prompts import DISTILLATION_PROMPT
+from src import metrics, storage
+from src.llm import get_llm
+from src.llm_cache import cached_invoke
+from src.prompts import DISTILLATION_PROMPT, DISTILLATION_PROMPT_VERSION
 
 # 加载环境变量
 load_dotenv()
 
 # 初始化存储和LLM
-store = storage.ReasoningIndexStore()
-api_key = os.environ.get("DEEPSEEK_API_KEY")
-llm = ChatDeepSeek(
-    model=config.ALCHEMY_LLM_MODEL,
-    api_key=SecretStr(api_key) if api_key else None
-)
+store = storage.get_store()
+# 索引写入先进入写后缓冲，按数量或时间批量提交
+write_buffer = storage.WriteBehindBuffer(store)
+llm = get_llm("distillation")
+
+
+class RateLimiter:
+    """线程安全的请求速率限制器：相邻请求之间至少间隔 60/requests_per_minute 秒。"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到可以发出下一个请求。"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# 所有线程共享的LLM请求限速
+rate_limiter = RateLimiter(config.INDEX_REQUESTS_PER_MINUTE)
+
+metrics.QUEUE_DEPTH.set_function(lambda: len(write_buffer), queue="write_buffer")
+
+
+# 流式计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_content(data: bytes) -> str:
+    """计算已读入内存的文件内容的哈希值（与 get_file_hash 结果一致）。"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
 def get_file_hash(file_path: Path) -> str:
-    """计算文件内容的哈希值。"""
+    """分块流式计算文件内容的哈希值，不把整个文件读入内存。"""
+    hasher = hashlib.blake2b(digest_size=16)
     with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class _KeyedLocks:
+    """
+    按键分配的条带锁，用于避免相同内容被并发重复提炼。
+    键按哈希映射到固定数量的锁上，监视进程长期运行也不会随内容哈希的增多而占用更多内存；
+    不同的键偶尔共用一把锁只会让它们串行执行。
+    """
+
+    def __init__(self, stripes: int = 256):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+
+content_hash_locks = _KeyedLocks()
+# 本进程最近提炼的指纹（content_hash -> 指纹），覆盖尚在写后缓冲中未落盘的文档
+recent_fingerprints: "OrderedDict[str, str]" = OrderedDict()
+recent_fingerprints_lock = threading.Lock()
+RECENT_FINGERPRINTS_SIZE = 1024
 
 
 def extract_metadata(file_path: Path) -> Dict[str, Any]:
@@ -60,72 +121,178 @@ def needs_processing(file_path: Path) -> bool:
             file_path = vault_path / file_path
 
         doc_id = str(file_path.relative_to(vault_path))
-        existing_doc = store.get_document(doc_id)
+        existing_doc = store.get_document(doc_id, include_body=False)
 
         # 如果文件不在数据库中，需要处理
         if existing_doc is None:
             return True
 
-        # 检查文件修改时间
         current_metadata = extract_metadata(file_path)
         stored_metadata = json.loads(existing_doc['metadata'])
 
-        # 如果文件修改时间更新，需要处理
-        if current_metadata['modified_time'] > stored_metadata['modified_time']:
+        # 修改时间和大小都未变：无需读取文件
+        if (current_metadata['modified_time'] <= stored_metadata['modified_time']
+                and current_metadata['file_size'] == stored_metadata['file_size']):
+            return False
+
+        # 旧数据没有内容哈希，只能按修改时间/大小判断
+        stored_hash = stored_metadata.get('content_hash')
+        if stored_hash is None:
             return True
 
-        # 如果文件大小改变，需要处理
-        if current_metadata['file_size'] != stored_metadata['file_size']:
+        # 以内容哈希为准：touch、git checkout、同步等只改变了修改时间
+        current_hash = get_file_hash(file_path)
+        if current_hash != stored_hash:
             return True
 
+        # 内容未变，只刷新元数据，避免下次再计算哈希
+        current_metadata['content_hash'] = current_hash
+        store.update_metadata(doc_id, current_metadata)
         return False
     except Exception as e:
         print(f"检查文件 {file_path} 是否需要处理时出错: {e}")
         return True  # 出错时默认处理
 
 
-def process_note_file(file_path: Path):
-    """处理单个笔记文件，生成指纹并存储。"""
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+def split_into_chunks(content: str) -> List[Dict[str, Any]]:
+    """
+    按不超过 CHUNK_HEADING_LEVELS 级的Markdown标题把笔记切分为章节，
+    返回 {heading, start_offset, end_offset} 列表（字符区间覆盖全文）。
+    前端信息和代码块中的 # 不视为标题；短于 CHUNK_MIN_CHARS 的章节与相邻章节合并。
+    只有一个章节时返回空列表，表示按整篇索引。
+    """
+    sections = [[0, None]]
+    offset = 0
+    front_matter_end = 0
+    in_front_matter = content.startswith("---")
+    in_fence = False
+    for i, line in enumerate(content.splitlines(keepends=True)):
+        if in_front_matter:
+            if i > 0 and line.strip() == "---":
+                in_front_matter = False
+                front_matter_end = offset + len(line)
+        elif _FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING_RE.match(line.rstrip("\r\n"))
+            if match and len(match.group(1)) <= config.CHUNK_HEADING_LEVELS:
+                # 前端信息总是归入第一个章节
+                if content[max(sections[-1][0], front_matter_end):offset].strip():
+                    sections.append([offset, match.group(2)])
+                else:
+                    sections[-1][1] = match.group(2)
+        offset += len(line)
+
+    chunks: List[Dict[str, Any]] = []
+    for index, (start, heading) in enumerate(sections):
+        end = sections[index + 1][0] if index + 1 < len(sections) else len(content)
+        if chunks and (
+            len(content[chunks[-1]["start_offset"]:chunks[-1]["end_offset"]].strip()) < config.CHUNK_MIN_CHARS
+            or len(content[start:end].strip()) < config.CHUNK_MIN_CHARS
+        ):
+            chunks[-1]["end_offset"] = end
+            chunks[-1]["heading"] = chunks[-1]["heading"] or heading
+        else:
+            chunks.append({"heading": heading, "start_offset": start, "end_offset": end})
+    return chunks if len(chunks) > 1 else []
+
+
+def distill_fingerprint(content: str, content_hash: str) -> str:
+    """
+    生成指纹。相同内容（复制的笔记、模板等）复用已有指纹，不再调用LLM。
+    """
+    with content_hash_locks(content_hash):
+        with recent_fingerprints_lock:
+            fingerprint = recent_fingerprints.get(content_hash)
+        if fingerprint is None:
+            fingerprint = store.find_fingerprint_by_content_hash(content_hash)
+        if fingerprint is not None:
+            print(f"内容与已索引笔记相同，复用指纹: {content_hash}")
+            return fingerprint
+
+        # 生成指纹（命中响应缓存时不调用LLM，也不占用限速配额）
+        fingerprint_prompt = DISTILLATION_PROMPT.format(text=content)
+        fingerprint = cached_invoke(
+            llm, fingerprint_prompt, DISTILLATION_PROMPT_VERSION,
+            before_invoke=rate_limiter.acquire, stage="distillation"
+        )
+
+        with recent_fingerprints_lock:
+            recent_fingerprints[content_hash] = fingerprint
+            while len(recent_fingerprints) > RECENT_FINGERPRINTS_SIZE:
+                recent_fingerprints.popitem(last=False)
+        return fingerprint
+
+
+def process_note_file(file_path: Path, skip_check: bool = False):
+    """
+    处理单个笔记文件，生成指纹并存储。
+    调用方已用 needs_processing 确认需要处理时传入 skip_check=True，避免再次读取元数据和计算哈希。
+    """
+    with metrics.INDEXER_FILE_LATENCY.time():
+        result = _process_note_file(file_path, skip_check)
+    metrics.INDEXER_FILES.inc(result=result)
+
+
+def _process_note_file(file_path: Path, skip_check: bool = False) -> str:
+    """返回处理结果：processed / skipped / error。"""
     try:
         # 检查是否需要处理
-        if not needs_processing(file_path):
+        if not skip_check and not needs_processing(file_path):
             doc_id = str(file_path.relative_to(config.VAULT_PATH))
             print(f"跳过未修改的文件: {doc_id}")
-            return
+            return "skipped"
 
-        # 读取文件内容
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # 读取文件内容（只读取一次，哈希和解码共用同一份字节）
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        content = raw.decode('utf-8')
 
         # 提取元数据
         metadata = extract_metadata(file_path)
-
-        # 生成指纹
-        fingerprint_prompt = DISTILLATION_PROMPT.format(text=content)
-        response = llm.invoke(fingerprint_prompt)
-        fingerprint = response.content if hasattr(response, 'content') else str(response)
-
-        # 确保指纹是字符串
-        if not isinstance(fingerprint, str):
-            fingerprint = str(fingerprint)
-
-        # 存储到索引
+        content_hash = hash_content(raw)
+        metadata["content_hash"] = content_hash
+
+        # 章节索引：每个章节单独提炼指纹（内容未变的章节复用已有指纹），整篇指纹由各章节拼接
+        chunks = split_into_chunks(content) if config.CHUNKED_INDEXING else []
+        for chunk in chunks:
+            section = content[chunk["start_offset"]:chunk["end_offset"]]
+            chunk["content_hash"] = hash_content(section.encode("utf-8"))
+            chunk["fingerprint_text"] = distill_fingerprint(section, chunk["content_hash"])
+        if chunks:
+            fingerprint = "\n".join(chunk["fingerprint_text"] for chunk in chunks)
+        else:
+            fingerprint = distill_fingerprint(content, content_hash)
+
+        # 存储到索引（经写后缓冲批量提交）
         doc_id = str(file_path.relative_to(config.VAULT_PATH))
-        store.add_or_update_document(
-            doc_id=doc_id,
-            metadata=metadata,
-            fingerprint_text=fingerprint,
-            full_text=content
-        )
+        write_buffer.add({
+            "doc_id": doc_id,
+            "metadata": metadata,
+            "fingerprint_text": fingerprint,
+            "full_text": content,
+            "chunks": chunks,
+        })
 
         print(f"已处理文件: {doc_id}")
+        return "processed"
     except Exception as e:
         print(f"处理文件 {file_path} 时出错: {e}")
+        return "error"
 
 
-def build_initial_index():
-    """构建初始索引。"""
+def build_initial_index(concurrency: Optional[int] = None):
+    """
+    构建初始索引。
+    concurrency > 1 时使用有界线程池并发提炼指纹（受 INDEX_REQUESTS_PER_MINUTE 限速）。
+    已完成的笔记随写后缓冲持续落盘，中断后重新运行会通过 needs_processing 跳过它们。
+    """
     print("开始构建初始索引...")
+    concurrency = concurrency or config.INDEX_CONCURRENCY
 
     # 遍历Vault中的所有.md文件
     vault_path = Path(config.VAULT_PATH)
@@ -138,60 +305,228 @@ def build_initial_index():
 
     print(f"找到 {total_files} 个.md文件")
 
+    # 检查是否需要处理
+    pending_files = [file_path for file_path in md_files if needs_processing(file_path)]
+    skipped_count = total_files - len(pending_files)
     processed_count = 0
-    skipped_count = 0
-
-    for file_path in md_files:
-        # 检查是否需要处理
-        if not needs_processing(file_path):
-            skipped_count += 1
-            continue
-
-        process_note_file(file_path)
-        processed_count += 1
+    print(f"需要处理 {len(pending_files)} 个文件（并发数: {concurrency}），跳过 {skipped_count} 个未修改的文件")
 
+    def report_progress():
         # 显示进度
-        if (processed_count + skipped_count) % 10 == 0:
-            progress = (processed_count + skipped_count) / total_files * 100
-            print(f"进度: {progress:.1f}% ({processed_count + skipped_count}/{total_files})")
+        done = processed_count + skipped_count
+        if processed_count % 10 == 0 or done == total_files:
+            progress = done / total_files * 100
+            print(f"进度: {progress:.1f}% ({done}/{total_files})")
+
+    try:
+        if concurrency <= 1:
+            for file_path in pending_files:
+                process_note_file(file_path, skip_check=True)
+                processed_count += 1
+                report_progress()
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [
+                    executor.submit(process_note_file, file_path, skip_check=True) for file_path in pending_files
+                ]
+                try:
+                    # 按提交顺序等待结果，保证进度输出有序
+                    for future in futures:
+                        future.result()
+                        processed_count += 1
+                        report_progress()
+                except BaseException:
+                    # 中断时取消尚未开始的任务，正在进行的任务完成后仍会写入缓冲
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        # 提交缓冲中剩余的写入（包括中断前已完成的笔记）
+        write_buffer.flush()
 
     print(f"初始索引构建完成。")
     print(f"总文件数: {total_files}, 新处理: {processed_count}, 跳过: {skipped_count}")
 
 
+def to_doc_id(file_path: Path) -> Optional[str]:
+    """返回Vault内路径对应的doc_id；路径不在Vault内时返回 None。"""
+    try:
+        return str(Path(file_path).relative_to(config.VAULT_PATH))
+    except ValueError:
+        return None
+
+
+def sync_note_path(file_path: Path):
+    """按文件的当前状态同步索引：文件存在则处理，已不存在则从索引中删除。"""
+    if file_path.exists():
+        process_note_file(file_path)
+    else:
+        doc_id = str(file_path.relative_to(config.VAULT_PATH))
+        write_buffer.delete(doc_id)
+        print(f"已删除索引中的文件: {doc_id}")
+
+
+class DebouncedChangeQueue:
+    """
+    去重、防抖的文件变更队列。
+    同一路径在防抖窗口内的多次事件（创建/修改/删除）合并为一条，窗口结束后由工作线程池
+    按文件的最终状态处理一次；同一路径不会被并发处理，处理期间的新事件在其完成后再处理。
+    """
+
+    def __init__(
+        self, handler: Callable[[Path], None],
+        debounce_seconds: float = config.WATCH_DEBOUNCE_SECONDS,
+        workers: int = config.WATCH_WORKERS
+    ):
+        self.handler = handler
+        self.debounce_seconds = debounce_seconds
+        # 路径 -> 到期时间；每个新事件都会推迟到期时间
+        self._deadlines: Dict[Path, float] = {}
+        self._in_progress: Set[Path] = set()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="watch")
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def put(self, file_path: Path):
+        """登记一次变更（只记录路径，立即返回）。"""
+        with self._cond:
+            self._deadlines[file_path] = time.monotonic() + self.debounce_seconds
+            self._cond.notify()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._deadlines)
+
+    def _dispatch(self):
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                next_deadline = None
+                for file_path, deadline in list(self._deadlines.items()):
+                    if file_path in self._in_progress:
+                        continue
+                    if deadline <= now:
+                        del self._deadlines[file_path]
+                        self._in_progress.add(file_path)
+                        self._executor.submit(self._run, file_path)
+                    elif next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
+                self._cond.wait(None if next_deadline is None else next_deadline - now)
+
+    def _run(self, file_path: Path):
+        try:
+            self.handler(file_path)
+        except Exception as e:
+            print(f"处理文件变更 {file_path} 时出错: {e}")
+        finally:
+            with self._cond:
+                self._in_progress.discard(file_path)
+                self._cond.notify()
+
+    def close(self):
+        """停止调度，等待进行中的处理完成，并立即处理尚未到期的变更。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        for file_path in list(self._deadlines):
+            self._run(file_path)
+        self._deadlines.clear()
+
+
 class VaultChangeHandler(FileSystemEventHandler):
-    """处理Vault文件更改的事件处理器。"""
-    
-    def on_modified(self, event):
+    """
+    处理Vault文件更改的事件处理器。
+    文件的创建/修改/删除只把路径放入防抖队列，实际处理在工作线程中进行；
+    改名和目录移动/删除直接改写索引中的doc_id，不重新提炼指纹。
+    """
+
+    def __init__(self, change_queue: DebouncedChangeQueue):
+        super().__init__()
+        self.change_queue = change_queue
+
+    def _enqueue(self, event):
         if not event.is_directory:
             src_path_str = str(event.src_path)
             if src_path_str.endswith('.md'):
-                file_path = Path(src_path_str)
-                print(f"检测到文件修改: {file_path}")
-                process_note_file(file_path)
-    
+                self.change_queue.put(Path(src_path_str))
+
+    def on_modified(self, event):
+        self._enqueue(event)
+
     def on_created(self, event):
-        if not event.is_directory:
-            src_path_str = str(event.src_path)
-            if src_path_str.endswith('.md'):
-                file_path = Path(src_path_str)
-                print(f"检测到新文件: {file_path}")
-                process_note_file(file_path)
-    
+        if event.is_directory:
+            # 从Vault外移入的目录只产生一个目录事件，需要逐个登记其中的笔记
+            for file_path in Path(str(event.src_path)).rglob("*.md"):
+                self.change_queue.put(file_path)
+        else:
+            self._enqueue(event)
+
     def on_deleted(self, event):
-        if not event.is_directory:
-            src_path_str = str(event.src_path)
-            if src_path_str.endswith('.md'):
-                file_path = Path(src_path_str)
-                vault_path = Path(config.VAULT_PATH)
-                doc_id = str(file_path.relative_to(vault_path))
-                store.delete_document(doc_id)
-                print(f"已删除索引中的文件: {doc_id}")
+        if event.is_directory:
+            self._delete_directory(Path(str(event.src_path)))
+        else:
+            self._enqueue(event)
+
+    def on_moved(self, event):
+        # watchdog为目录内的每个文件额外生成的合成事件已由目录级的批量改名覆盖
+        if getattr(event, "is_synthetic", False):
+            return
+        src_path = Path(str(event.src_path))
+        dest_path = Path(str(event.dest_path))
+        if event.is_directory:
+            self._move_directory(src_path, dest_path)
+        else:
+            self._move_note(src_path, dest_path)
+
+    def _move_note(self, src_path: Path, dest_path: Path):
+        src_id = to_doc_id(src_path) if src_path.suffix == '.md' else None
+        dest_id = to_doc_id(dest_path) if dest_path.suffix == '.md' else None
+        if src_id is not None and dest_id is not None:
+            # 先落盘缓冲中的写入，确保改名作用在最新的行上
+            write_buffer.flush()
+            if store.rename_document(src_id, dest_id):
+                print(f"已重命名索引中的文件: {src_id} -> {dest_id}")
+        # 移入/移出Vault、与非.md文件互相改名、未索引的文件等情况，以及处理中的旧路径写入，
+        # 都交给防抖队列按文件的最终状态处理（已改名且未修改的文件会被直接跳过）
+        if src_id is not None:
+            self.change_queue.put(src_path)
+        if dest_id is not None:
+            self.change_queue.put(dest_path)
+
+    def _move_directory(self, src_path: Path, dest_path: Path):
+        src_id = to_doc_id(src_path)
+        dest_id = to_doc_id(dest_path)
+        if src_id is not None and dest_id is not None:
+            write_buffer.flush()
+            renamed = store.rename_prefix(src_id + os.sep, dest_id + os.sep)
+            print(f"已移动索引中的目录: {src_id} -> {dest_id} ({renamed} 篇)")
+        elif src_id is not None:
+            # 移出Vault等同于删除
+            self._delete_directory(src_path)
+        elif dest_id is not None:
+            # 从Vault外移入
+            for file_path in dest_path.rglob("*.md"):
+                self.change_queue.put(file_path)
+
+    def _delete_directory(self, dir_path: Path):
+        doc_id = to_doc_id(dir_path)
+        if doc_id is None:
+            return
+        write_buffer.flush()
+        deleted = store.delete_prefix(doc_id + os.sep)
+        print(f"已删除索引中的目录: {doc_id} ({deleted} 篇)")
 
 
 def start_watching():
     """开始监视Vault的变化。"""
-    event_handler = VaultChangeHandler()
+    # 变更经防抖队列合并后处理，产生的索引写入由写后缓冲批量提交
+    change_queue = DebouncedChangeQueue(sync_note_path)
+    metrics.QUEUE_DEPTH.set_function(lambda: len(change_queue), queue="watch")
+    event_handler = VaultChangeHandler(change_queue)
     observer = Observer()
     observer.schedule(event_handler, str(config.VAULT_PATH), recursive=True)
     observer.start()
@@ -207,9 +542,15 @@ def start_watching():
         print("监视已停止。")
     
     observer.join()
+    change_queue.close()
+    write_buffer.close()
 
 
 if __name__ == "__main__":
+    # 定期打印运行指标摘要
+    if config.METRICS_SUMMARY_INTERVAL_SECONDS > 0:
+        metrics.start_periodic_summary(config.METRICS_SUMMARY_INTERVAL_SECONDS)
+
     # 构建初始索引
     build_initial_index()
 
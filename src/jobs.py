@@ -0,0 +1,134 @@
+"""
+持久化的后台任务队列。
+提交文章后立即返回任务ID；任务保存在 reasoning_index.db 的 jobs 表中，
+由API进程内的工作协程依次领取执行。每个节点完成后保存检查点，
+进程重启后任务从最后完成的节点继续，已完成的LLM调用不会重复执行。
+"""
+import asyncio
+import os
+import uuid
+from typing import Any, Dict, Optional, Set
+
+import config
+from src import storage
+from src.graph import arun_resumable
+
+
+class JobWorkerPool:
+    """在事件循环中运行固定数量的工作协程，并为运行中的任务维持租约心跳。"""
+
+    def __init__(self, num_workers: int = config.JOB_WORKERS):
+        self.num_workers = num_workers
+        # 标识本进程，只有领取任务的进程才能更新它
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.store: Optional[storage.ReasoningIndexStore] = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._running: Set[str] = set()
+
+    def start(self, store: storage.ReasoningIndexStore):
+        """启动工作协程和心跳协程（需在事件循环中调用）。"""
+        self.store = store
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """停止所有协程，并把本进程未完成的任务放回队列。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 按数据库中的租约归属放回队列：取消时 _run 已移除运行中的任务ID，
+        # 而正在领取的任务可能已在数据库线程中标记为运行中、却还没有交给工作协程
+        requeued = await storage.run_in_db_thread(self.store.release_jobs, self.worker_id)
+        if requeued:
+            print(f"已把 {requeued} 个未完成的任务放回队列")
+        self._running.clear()
+
+    async def submit(self, request: Dict[str, Any]) -> str:
+        """保存任务并唤醒空闲的工作协程，返回任务ID。"""
+        job_id = uuid.uuid4().hex
+        await storage.run_in_db_thread(self.store.create_job, job_id, request)
+        self._wakeup.set()
+        return job_id
+
+    async def _work(self):
+        while True:
+            try:
+                job = await storage.run_in_db_thread(self.store.claim_next_job, self.worker_id)
+                if job is not None:
+                    await self._run(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 数据库暂时被索引器锁住等错误不应让工作协程退出；未结束的任务由租约过期后回收
+                print(f"任务工作协程出错，{config.JOB_POLL_INTERVAL_SECONDS} 秒后重试: {e}")
+                await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        request = job["request"]
+        self._running.add(job_id)
+        if job["last_node"]:
+            print(f"任务 {job_id} 从节点 {job['last_node']} 之后继续执行")
+
+        async def on_checkpoint(node: str, state: Dict[str, Any]):
+            saved = await storage.run_in_db_thread(
+                self.store.checkpoint_job, job_id, self.worker_id, node, state
+            )
+            if not saved:
+                raise RuntimeError("任务租约已失效")
+
+        try:
+            final_note = await arun_resumable(
+                request["text"], request.get("source_url") or "", request.get("bypass_cache", False),
+                last_node=job["last_node"], checkpoint_state=job["state"],
+                on_checkpoint=on_checkpoint
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 未达到重试上限时放回队列，下次从检查点继续
+            status = "queued" if job["attempts"] < config.JOB_MAX_ATTEMPTS else "failed"
+            print(f"任务 {job_id} 第 {job['attempts']} 次执行失败: {e}")
+            await storage.run_in_db_thread(
+                self.store.finish_job, job_id, self.worker_id, status, error=str(e)
+            )
+            if status == "queued":
+                self._wakeup.set()
+        else:
+            await storage.run_in_db_thread(
+                self.store.finish_job, job_id, self.worker_id, "succeeded", result=final_note
+            )
+        finally:
+            self._running.discard(job_id)
+
+    async def _heartbeat(self):
+        """定期刷新本进程运行中任务的租约，并回收已退出进程遗留的任务。"""
+        while True:
+            try:
+                await storage.run_in_db_thread(
+                    self.store.touch_jobs, list(self._running), self.worker_id
+                )
+                requeued, failed = await storage.run_in_db_thread(
+                    self.store.requeue_stale_jobs, config.JOB_LEASE_SECONDS
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"刷新任务租约时出错，{config.JOB_POLL_INTERVAL_SECONDS} 秒后重试: {e}")
+                await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            if failed:
+                print(f"{failed} 个中断的任务已达到重试上限，标记为失败")
+            if requeued:
+                print(f"回收了 {requeued} 个中断的任务")
+                self._wakeup.set()
+            await asyncio.sleep(config.JOB_HEARTBEAT_SECONDS)
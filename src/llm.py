@@ -0,0 +1,109 @@
+"""
+共享的LLM客户端工厂。
+图节点和索引器通过 get_llm(stage) 获取按模型复用的 ChatDeepSeek 实例，
+所有实例共享同一组带连接池和keep-alive的HTTP客户端。
+可以通过 set_llm_factory 替换实例的创建方式（例如基准测试中使用本地桩模型）。
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_deepseek import ChatDeepSeek
+from pydantic import SecretStr
+
+import config
+
+_lock = threading.Lock()
+_llms: Dict[str, ChatDeepSeek] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+# 自定义的LLM工厂：接收模型名，返回实现 invoke/ainvoke/astream 的对象
+_llm_factory: Optional[Callable[[str], Any]] = None
+
+
+def _http_options() -> dict:
+    return {
+        "timeout": httpx.Timeout(
+            config.LLM_TIMEOUT_SECONDS, connect=config.LLM_CONNECT_TIMEOUT_SECONDS
+        ),
+        "limits": httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+
+
+def get_model_for_stage(stage: str) -> str:
+    """返回某个阶段配置的模型，未单独配置时使用 ALCHEMY_LLM_MODEL。"""
+    return config.STAGE_LLM_MODELS.get(stage) or config.ALCHEMY_LLM_MODEL
+
+
+def set_llm_factory(factory: Optional[Callable[[str], Any]]):
+    """
+    替换创建LLM实例的工厂；传入 None 恢复默认的 ChatDeepSeek。
+    已创建的实例会被丢弃，需在模块通过 get_llm 取得实例之前调用。
+    """
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory
+        _llms.clear()
+
+
+def get_llm(stage: str) -> ChatDeepSeek:
+    """
+    获取指定阶段（distillation / rerank / synthesis）使用的LLM。
+    实例按模型名懒加载并在进程内复用。
+    """
+    global _http_client, _http_async_client
+    model = get_model_for_stage(stage)
+    with _lock:
+        llm = _llms.get(model)
+        if llm is None and _llm_factory is not None:
+            llm = _llms[model] = _llm_factory(model)
+        if llm is None:
+            load_dotenv()
+            if _http_client is None:
+                _http_client = httpx.Client(**_http_options())
+                _http_async_client = httpx.AsyncClient(**_http_options())
+            api_key = os.environ.get("DEEPSEEK_API_KEY")
+            llm = ChatDeepSeek(
+                model=model,
+                api_key=SecretStr(api_key) if api_key else None,
+                timeout=config.LLM_TIMEOUT_SECONDS,
+                max_retries=config.LLM_MAX_RETRIES,
+                http_client=_http_client,
+                http_async_client=_http_async_client,
+                # 流式调用时请求末尾的用量块，否则流式合成的token数无法计入指标
+                stream_usage=True,
+            )
+            _llms[model] = llm
+        return llm
+
+
+def _release_clients():
+    global _http_client, _http_async_client
+    with _lock:
+        clients = (_http_client, _http_async_client)
+        _http_client = None
+        _http_async_client = None
+        _llms.clear()
+    return clients
+
+
+def close_llm_clients():
+    """关闭共享的HTTP客户端（同步进程退出前调用）。"""
+    http_client, _ = _release_clients()
+    if http_client is not None:
+        http_client.close()
+
+
+async def aclose_llm_clients():
+    """在事件循环中关闭共享的同步与异步HTTP客户端。"""
+    http_client, http_async_client = _release_clients()
+    if http_client is not None:
+        http_client.close()
+    if http_async_client is not None:
+        await http_async_client.aclose()
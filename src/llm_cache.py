@@ -0,0 +1,247 @@
+"""
+LLM响应的持久化缓存。
+以 模型名 + 提示模板版本 + 渲染后提示的哈希 为键，把响应文本保存在 data/ 下的SQLite文件中，
+支持过期时间(TTL)、按条数上限的LRU淘汰、命中/未命中计数以及单次调用绕过缓存。
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import config
+from src import metrics
+
+
+def response_to_text(response: Any) -> str:
+    """把LLM响应（消息对象或其他）转换为字符串。"""
+    text = response.content if hasattr(response, 'content') else str(response)
+    # 确保结果是字符串
+    if not isinstance(text, str):
+        text = str(text)
+    return text
+
+
+def record_usage(stage: str, response: Any):
+    """把响应中的token用量（usage_metadata）计入指标。"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), stage=stage, kind="prompt")
+    metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), stage=stage, kind="completion")
+
+
+def get_model_name(llm: Any) -> str:
+    """取得LLM实例的模型名，用作缓存键的一部分。"""
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__)
+
+
+class LLMResponseCache:
+    """基于SQLite的内容寻址LLM响应缓存。"""
+
+    # 每写入该数量的条目执行一次过期清理和超额淘汰，而不是每次写入都统计条数
+    EVICTION_INTERVAL = 100
+
+    def __init__(
+        self, db_path: Path = config.LLM_CACHE_PATH,
+        ttl_seconds: float = config.LLM_CACHE_TTL_SECONDS,
+        max_entries: int = config.LLM_CACHE_MAX_ENTRIES
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_eviction = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            db_path, timeout=config.SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    prompt_version TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_access REAL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache(created_at)"
+            )
+            self._evict()
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, prompt: str) -> str:
+        """由模型名、模板版本和渲染后的提示计算缓存键。"""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}\0{prompt_version}\0{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的缓存响应，并刷新其最近访问时间。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, prompt_version: str, response: str):
+        """写入响应；每 EVICTION_INTERVAL 次写入清理一次过期和超出条数上限的条目。"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache
+                (key, model, prompt_version, response, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, prompt_version, response, now, now)
+            )
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= self.EVICTION_INTERVAL:
+                self._evict()
+
+    def _evict(self):
+        """删除过期条目，并在超出条数上限时淘汰最久未访问的条目（调用方持有锁和事务）。"""
+        self._puts_since_eviction = 0
+        if self.ttl_seconds:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access LIMIT ?
+                )
+                """,
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回本进程内的命中/未命中计数和当前条目数。"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """返回进程内共享的响应缓存，首次调用时创建。"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
+
+
+def _cache_key(llm: Any, prompt: Any, prompt_version: str):
+    prompt_text = str(prompt)
+    model = get_model_name(llm)
+    return prompt_text, model, LLMResponseCache.make_key(model, prompt_version, prompt_text)
+
+
+def cached_invoke(
+    llm: Any, prompt: Any, prompt_version: str, bypass: bool = False,
+    before_invoke: Optional[Callable[[], None]] = None, stage: str = "",
+    validate: Optional[Callable[[str], bool]] = None
+) -> str:
+    """
+    带缓存地调用 llm.invoke 并返回响应文本。
+    bypass 为 True 时跳过缓存读取（仍会用新响应覆盖缓存）；
+    before_invoke 只在真正调用LLM前执行（例如限速）；stage 用于指标标签；
+    validate 判断响应能否被调用方解析，不通过的响应不写入缓存，已缓存的也不再使用。
+    """
+    prompt_text, model, key = _cache_key(llm, prompt, prompt_version)
+
+    if config.LLM_CACHE_ENABLED and not bypass:
+        cached = get_llm_cache().get(key)
+        if cached is not None and (validate is None or validate(cached)):
+            metrics.LLM_REQUESTS.inc(stage=stage, cache="hit")
+            return cached
+
+    if before_invoke is not None:
+        before_invoke()
+    metrics.LLM_REQUESTS.inc(stage=stage, cache="miss")
+    with metrics.track(metrics.LLM_LATENCY, metrics.LLM_ERRORS, stage=stage):
+        response = llm.invoke(prompt_text)
+    record_usage(stage, response)
+    text = response_to_text(response)
+
+    if config.LLM_CACHE_ENABLED and (validate is None or validate(text)):
+        get_llm_cache().put(key, model, prompt_version, text)
+    return text
+
+
+async def acached_invoke(
+    llm: Any, prompt: Any, prompt_version: str, bypass: bool = False,
+    on_token: Optional[Callable[[str], None]] = None, stage: str = "",
+    validate: Optional[Callable[[str], bool]] = None
+) -> str:
+    """
+    cached_invoke 的异步版本：使用 llm.ainvoke，缓存读写在数据库线程池中执行。
+    提供 on_token 时改用 llm.astream，每收到一段文本就回调一次；
+    命中缓存时把完整响应作为一段回调。stage 和 validate 的含义与 cached_invoke 相同。
+    """
+    # 延迟导入，避免与 storage 模块形成循环依赖
+    from src.storage import run_in_db_thread
+
+    prompt_text, model, key = _cache_key(llm, prompt, prompt_version)
+
+    if config.LLM_CACHE_ENABLED and not bypass:
+        cached = await run_in_db_thread(get_llm_cache().get, key)
+        if cached is not None and (validate is None or validate(cached)):
+            metrics.LLM_REQUESTS.inc(stage=stage, cache="hit")
+            if on_token is not None:
+                on_token(cached)
+            return cached
+
+    metrics.LLM_REQUESTS.inc(stage=stage, cache="miss")
+    with metrics.track(metrics.LLM_LATENCY, metrics.LLM_ERRORS, stage=stage):
+        if on_token is None:
+            response = await llm.ainvoke(prompt_text)
+            record_usage(stage, response)
+            text = response_to_text(response)
+        else:
+            parts = []
+            async for chunk in llm.astream(prompt_text):
+                # 流式响应的token用量通常只出现在最后一段中
+                record_usage(stage, chunk)
+                piece = response_to_text(chunk)
+                if piece:
+                    parts.append(piece)
+                    on_token(piece)
+            text = "".join(parts)
+
+    if config.LLM_CACHE_ENABLED and (validate is None or validate(text)):
+        await run_in_db_thread(get_llm_cache().put, key, model, prompt_version, text)
+    return text
@@ -1,17 +1,53 @@
 """
 FastAPI服务器，通过API暴露LangGraph逻辑。
 """
-from fastapi import FastAPI
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any, Union
 
-from src.graph import process_article
+import config
+from src import metrics, storage
+from src.llm import aclose_llm_clients
+from src.graph import aprocess_article, aprocess_articles, astream_article_events
+from src.jobs import JobWorkerPool
+
+# 限制本进程同时运行的处理流程数量
+pipeline_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_PIPELINES)
+
+# 后台任务的工作协程池
+job_pool = JobWorkerPool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时预热检索索引，使其在各次请求之间常驻复用，并启动后台任务的工作协程；
+    退出时把未完成的任务放回队列并关闭数据库长连接。
+    """
+    store = storage.get_store()
+    store.warm_up()
+    job_pool.start(store)
+    for status in ("queued", "running"):
+        metrics.QUEUE_DEPTH.set_function(
+            lambda status=status: store.count_jobs(status), queue=f"jobs_{status}"
+        )
+    yield
+    await job_pool.stop()
+    store.close()
+    await aclose_llm_clients()
+
 
 # 创建FastAPI应用
 app = FastAPI(
     title="知识炼金术师 API",
     description="一个使用LangGraph和DeepSeek API的AI系统，用于处理文章并生成与现有知识库关联的新笔记。",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 
@@ -25,6 +61,8 @@ class KnowledgePoint(BaseModel):
 class ArticleRequest(BaseModel):
     text: str
     source_url: Optional[str] = ""
+    # 为 True 时忽略已缓存的LLM响应（例如对不满意的结果重新生成）
+    bypass_cache: bool = False
 
 
 class ArticleResponse(BaseModel):
@@ -39,11 +77,163 @@ async def process_article_endpoint(request: ArticleRequest):
     
     - **text**: 新文章的内容
     - **source_url**: 文章的来源URL（可选）
+    - **bypass_cache**: 是否跳过LLM响应缓存（可选）
     """
-    generated_note = process_article(request.text, request.source_url)
+    # 整个流程以异步方式运行，等待LLM响应时不会阻塞其他请求
+    async with pipeline_semaphore:
+        metrics.PIPELINES_IN_FLIGHT.inc(endpoint="process_article")
+        try:
+            generated_note = await aprocess_article(
+                request.text, request.source_url, request.bypass_cache
+            )
+        finally:
+            metrics.PIPELINES_IN_FLIGHT.dec(endpoint="process_article")
     return ArticleResponse(generated_note=generated_note)
 
 
+class BatchArticleRequest(BaseModel):
+    articles: List[ArticleRequest]
+
+
+class BatchArticleResult(BaseModel):
+    generated_note: Optional[Union[List[KnowledgePoint], str]] = None
+    # 该篇文章处理失败时的错误信息
+    error: Optional[str] = None
+
+
+class BatchArticleResponse(BaseModel):
+    results: List[BatchArticleResult]
+
+
+@app.post("/process-articles", response_model=BatchArticleResponse)
+async def process_articles_endpoint(request: BatchArticleRequest):
+    """
+    批量处理多篇文章，返回与请求顺序一致的结果。
+
+    - **articles**: ArticleRequest 列表（字段与 /process-article 相同）
+
+    单篇文章失败时该项的 error 字段包含错误信息，其余文章的结果不受影响。
+    """
+    if len(request.articles) > config.BATCH_MAX_ARTICLES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"单次最多处理 {config.BATCH_MAX_ARTICLES} 篇文章"
+        )
+    # 整批只占用一个流程名额，批内并发由 BATCH_CONCURRENCY 控制
+    async with pipeline_semaphore:
+        metrics.PIPELINES_IN_FLIGHT.inc(endpoint="process_articles")
+        try:
+            results = await aprocess_articles([article.model_dump() for article in request.articles])
+        finally:
+            metrics.PIPELINES_IN_FLIGHT.dec(endpoint="process_articles")
+    return BatchArticleResponse(results=[BatchArticleResult(**result) for result in results])
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    # queued / running / succeeded / failed
+    status: str
+    # 最后完成的流程节点
+    last_node: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    generated_note: Optional[Union[List[KnowledgePoint], str]] = None
+
+
+async def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = await storage.run_in_db_thread(storage.get_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@app.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job_endpoint(request: ArticleRequest):
+    """
+    提交后台处理任务并立即返回任务ID，请求体与 /process-article 相同。
+    任务持久化在数据库中，API重启后会从最后完成的节点继续执行。
+    """
+    job_id = await job_pool.submit(request.model_dump())
+    return JobSubmitResponse(job_id=job_id, status="queued")
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def job_status_endpoint(job_id: str):
+    """查询任务状态；任务成功后同时返回生成的笔记。"""
+    job = await _get_job_or_404(job_id)
+    return JobStatusResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        last_node=job["last_node"],
+        attempts=job["attempts"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        generated_note=job["result"] if job["status"] == "succeeded" else None
+    )
+
+
+@app.get("/jobs/{job_id}/result", response_model=ArticleResponse)
+async def job_result_endpoint(job_id: str):
+    """获取已完成任务的结果；任务尚未成功时返回409。"""
+    job = await _get_job_or_404(job_id)
+    if job["status"] != "succeeded":
+        raise HTTPException(
+            status_code=409,
+            detail={"status": job["status"], "error": job["error"]}
+        )
+    return ArticleResponse(generated_note=job["result"])
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条server-sent event。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/process-article/stream")
+async def process_article_stream_endpoint(request: ArticleRequest):
+    """
+    以server-sent events流式处理新文章，请求体与 /process-article 相同。
+
+    依次发送的事件：
+    - **fingerprint**: 提炼出的文章指纹
+    - **candidates**: BM25候选笔记ID
+    - **rerank**: 重排序后的笔记ID及理由
+    - **context**: 用作上下文的笔记ID
+    - **token**: 合成阶段的LLM输出片段
+    - **knowledge_point**: 生成完毕的单个知识点（index/title/content）
+    - **result**: 最终的完整结果（与 /process-article 的响应相同）
+    - **error**: 处理失败时的错误信息
+    - **done**: 流结束
+    """
+    async def event_stream():
+        async with pipeline_semaphore:
+            metrics.PIPELINES_IN_FLIGHT.inc(endpoint="process_article_stream")
+            try:
+                async for event, data in astream_article_events(
+                    request.text, request.source_url, request.bypass_cache
+                ):
+                    yield _sse(event, data)
+            except Exception as e:
+                yield _sse("error", {"message": str(e)})
+            finally:
+                metrics.PIPELINES_IN_FLIGHT.dec(endpoint="process_article_stream")
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/")
 async def root():
     """根端点，提供API信息。"""
@@ -51,11 +241,24 @@ async def root():
         "message": "知识炼金术师 API",
         "description": "使用LangGraph和DeepSeek API处理文章并生成关联笔记。",
         "endpoints": {
-            "process_article": "POST /process-article - 处理新文章并生成关联笔记"
+            "process_article": "POST /process-article - 处理新文章并生成关联笔记",
+            "process_article_stream": "POST /process-article/stream - 以server-sent events流式返回处理进度和生成结果",
+            "process_articles": "POST /process-articles - 批量处理多篇文章",
+            "submit_job": "POST /jobs - 提交后台处理任务，立即返回任务ID",
+            "job_status": "GET /jobs/{job_id} - 查询任务状态和结果",
+            "metrics": "GET /metrics - Prometheus格式的运行指标"
         }
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """以Prometheus文本格式导出运行指标（节点耗时、LLM token与缓存命中、检索耗时、队列长度等）。"""
+    # 部分指标在导出时查询数据库，放到数据库线程池中执行
+    text = await storage.run_in_db_thread(metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """健康检查端点。"""
@@ -0,0 +1,291 @@
+"""
+进程内的运行指标。
+提供计数器、仪表和直方图三种指标，以Prometheus文本格式导出（API的 /metrics 端点），
+也可以输出简要的文本摘要（索引器定期打印）。不依赖 prometheus_client。
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 延迟直方图的默认桶边界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 数量类直方图（候选数等）的桶边界
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# token数直方图的桶边界
+TOKEN_BUCKETS = (256, 512, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    @property
+    def metadata_name(self) -> str:
+        """HELP/TYPE 行使用的名称。"""
+        return self.name
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """返回 (名称后缀, 标签, 值) 列表。"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器。"""
+
+    TYPE = "counter"
+
+    @property
+    def metadata_name(self) -> str:
+        # 与 prometheus_client 一致：计数器的样本名带 _total 后缀，HELP/TYPE 行也使用同一名称
+        return self.name + "_total"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("_total", self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；也可以注册一个在导出时调用的取值函数（如队列长度）。"""
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception as e:
+                print(f"读取指标 {self.name} 时出错: {e}")
+        return [("", self._labels(key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """按桶累计观测值的直方图。"""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签 -> [各桶计数（非累计）, 总和, 总数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时（秒），代码块抛出异常时同样记录。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def stats(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """返回各标签组合的 (总数, 总和)。"""
+        with self._lock:
+            return {key: (entry[2], entry[1]) for key, entry in self._values.items()}
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+@contextmanager
+def track(latency: Histogram, errors: Counter, **labels):
+    """记录代码块的耗时，并在抛出异常时增加错误计数。"""
+    with latency.time(**labels):
+        try:
+            yield
+        except BaseException:
+            errors.inc(**labels)
+            raise
+
+
+def render() -> str:
+    """以Prometheus文本格式导出所有指标。"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.metadata_name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.metadata_name} {metric.TYPE}")
+        for suffix, labels, value in metric.samples():
+            lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    """返回所有已有数据的指标的简要文本摘要。"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        if isinstance(metric, Histogram):
+            for key, (count, total) in sorted(metric.stats().items()):
+                labels = _format_labels(metric._labels(key))
+                lines.append(f"{metric.name}{labels}: 次数={count}, 平均={total / count:.3f}")
+        else:
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)}: {value:g}")
+    return "\n".join(lines)
+
+
+def start_periodic_summary(interval: float, stop: Optional[threading.Event] = None) -> threading.Thread:
+    """启动后台线程，每隔 interval 秒打印一次指标摘要。"""
+    stop = stop or threading.Event()
+
+    def report():
+        while not stop.wait(interval):
+            text = summary()
+            if text:
+                print(f"--- 运行指标 ---\n{text}")
+
+    thread = threading.Thread(target=report, daemon=True)
+    thread.start()
+    return thread
+
+
+# --- 流程指标 ---
+NODE_LATENCY = Histogram(
+    "alchemist_node_duration_seconds", "LangGraph节点的执行耗时", ["node"]
+)
+NODE_ERRORS = Counter(
+    "alchemist_node_errors", "LangGraph节点抛出的异常次数", ["node"]
+)
+CANDIDATES = Histogram(
+    "alchemist_candidates", "各阶段的候选笔记数量", ["stage"], buckets=COUNT_BUCKETS
+)
+CONTEXT_TOKENS = Histogram(
+    "alchemist_synthesis_context_tokens", "合成提示中文章和上下文笔记的token数（打包前后）",
+    ["part", "packing"], buckets=TOKEN_BUCKETS
+)
+RERANK_PATH = Counter(
+    "alchemist_rerank_path", "重排序路径的选择次数（full：完整重排序，shrink：只重排序尾部，skip：跳过）", ["path"]
+)
+PIPELINES_IN_FLIGHT = Gauge(
+    "alchemist_pipelines_in_flight", "API中正在运行的处理流程数量", ["endpoint"]
+)
+
+# --- LLM指标 ---
+LLM_REQUESTS = Counter(
+    "alchemist_llm_requests", "LLM调用次数（按是否命中响应缓存）", ["stage", "cache"]
+)
+LLM_LATENCY = Histogram(
+    "alchemist_llm_duration_seconds", "实际调用LLM的耗时（不含缓存命中）", ["stage"]
+)
+LLM_TOKENS = Counter(
+    "alchemist_llm_tokens", "LLM消耗的token数", ["stage", "kind"]
+)
+LLM_ERRORS = Counter(
+    "alchemist_llm_errors", "LLM调用失败次数", ["stage"]
+)
+
+# --- 检索指标 ---
+SEARCH_LATENCY = Histogram(
+    "alchemist_search_duration_seconds",
+    "检索耗时（engine：rank_bm25 / fts5 / resident / chunks 章节检索 / dense 向量检索）", ["engine", "mode"]
+)
+BODY_CACHE = Counter(
+    "alchemist_body_cache_requests", "读取笔记正文时进程内LRU缓存的命中情况", ["result"]
+)
+
+# --- 索引器指标 ---
+INDEXER_FILE_LATENCY = Histogram(
+    "alchemist_indexer_file_duration_seconds", "索引器处理单个笔记文件的耗时"
+)
+INDEXER_FILES = Counter(
+    "alchemist_indexer_files", "索引器处理的文件数（按结果）", ["result"]
+)
+QUEUE_DEPTH = Gauge(
+    "alchemist_queue_depth", "各队列中等待处理的条目数", ["queue"]
+)
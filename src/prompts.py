@@ -19,6 +19,8 @@ DISTILLATION_PROMPT_TMPL = """
 ---
 """
 DISTILLATION_PROMPT = PromptTemplate.from_template(DISTILLATION_PROMPT_TMPL)
+# 提示模板版本，参与LLM响应缓存的键；修改模板或其输出的解析方式时递增
+DISTILLATION_PROMPT_VERSION = "1"
 
 # 推理和重排序候选指纹的提示
 REASONING_MATCH_PROMPT_TMPL = """
@@ -56,6 +58,7 @@ REASONING_MATCH_PROMPT_TMPL = """
 }}
 """
 REASONING_MATCH_PROMPT = PromptTemplate.from_template(REASONING_MATCH_PROMPT_TMPL)
+REASONING_MATCH_PROMPT_VERSION = "1"
 
 # 最终合成新笔记的提示
 SYNTHESIS_PROMPT_TMPL = """
@@ -91,4 +94,5 @@ SYNTHESIS_PROMPT_TMPL = """
   ]
 }}
 """
-SYNTHESIS_PROMPT = PromptTemplate.from_template(SYNTHESIS_PROMPT_TMPL)
\ No newline at end of file
+SYNTHESIS_PROMPT = PromptTemplate.from_template(SYNTHESIS_PROMPT_TMPL)
+SYNTHESIS_PROMPT_VERSION = "1"
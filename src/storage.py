@@ -4,12 +4,149 @@
 """
 import sqlite3
 import json
+import asyncio
+import functools
+import os
+import itertools
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterable
 from rank_bm25 import BM25Okapi
 
 
 import config
+from src import metrics
+from src.bm25_index import get_resident_index
+from src.body_store import BodyCache, body_hash, compress, decompress
+from src.embeddings import get_dense_index
+from src.tokenizer import get_tokenizer
+
+# 单条SQL语句中绑定参数数量的保守上限
+SQLITE_MAX_VARIABLES = 900
+
+# 热表中检索结果（轻量句柄）包含的列；正文 full_text 按内容哈希压缩存放在 reasoning_blobs 中
+HANDLE_COLUMNS = "doc_id, metadata, fingerprint_text"
+# 章节表中返回给调用方的列（不含词元）
+CHUNK_COLUMNS = "doc_id, ordinal, heading, start_offset, end_offset, fingerprint_text"
+# FTS5 对持久化词元建索引时的分词方式：词元已由 src.tokenizer 切好并转为小写，
+# 保留变音符号和下划线，使 FTS5 与 rank_bm25 / resident 引擎看到相同的词表
+FTS_TOKENIZE = "unicode61 remove_diacritics 0 tokenchars '_'"
+
+
+def _chunked(items: List[Any], size: int):
+    """将列表按固定大小切分。"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# 异步代码中执行SQLite操作的专用线程池
+_db_executor: Optional[ThreadPoolExecutor] = None
+_db_executor_lock = threading.Lock()
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=config.SQLITE_EXECUTOR_WORKERS, thread_name_prefix="sqlite"
+            )
+        return _db_executor
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """在数据库线程池中执行同步的存储操作，避免阻塞事件循环。"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_db_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def _batched(iterable: Iterable[Any], size: int):
+    """将任意可迭代对象按固定大小分批（不要求先转换为列表）。"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _ConnectionPool:
+    """
+    长连接池：一组只读连接加一个独占的写连接。
+    使用WAL日志模式，读连接不会被索引器的写事务阻塞；
+    sqlite3 模块按连接缓存预编译语句，长连接使这些语句得以复用。
+    """
+
+    def __init__(self, db_path: Path, read_pool_size: int):
+        self.db_path = db_path
+        self._max_readers = max(1, read_pool_size)
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._writer = self._connect()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=config.SQLITE_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+        # 负值表示以KiB为单位
+        conn.execute(f"PRAGMA cache_size = -{int(config.SQLITE_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._all_readers) < self._max_readers:
+                conn = self._connect(read_only=True)
+                self._all_readers.append(conn)
+                return conn
+        # 连接数已达上限，等待其他线程归还
+        return self._readers.get()
+
+    @contextmanager
+    def reader(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            with self._writer:
+                yield self._writer
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+            self._readers = queue.LifoQueue()
+        with self._writer_lock:
+            self._writer.close()
 
 
 class ReasoningIndexStore:
@@ -17,14 +154,28 @@ class ReasoningIndexStore:
 
     def __init__(self, db_path: Path = config.DB_PATH):
         self.db_path = db_path
+        self.tokenizer = get_tokenizer()
+        self._pool = _ConnectionPool(db_path, config.SQLITE_READ_POOL_SIZE)
+        self._body_cache = BodyCache(config.BODY_CACHE_MAX_ENTRIES)
         self._create_table()
 
-    def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def _read(self):
+        """借用一个只读连接。"""
+        return self._pool.reader()
+
+    def _write(self):
+        """独占唯一的写连接，并在一个事务中执行（退出时提交，异常时回滚）。"""
+        return self._pool.writer()
+
+    def close(self):
+        """关闭所有长连接。"""
+        self._pool.close()
 
     def _create_table(self):
-        with self._get_connection() as conn:
+        with self._write() as conn:
             cursor = conn.cursor()
+            # 在同一个写事务中完成建表与迁移，多个进程同时启动时也只会迁移一次
+            cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS reasoning_index (
                     doc_id TEXT PRIMARY KEY,
@@ -33,81 +184,794 @@ class ReasoningIndexStore:
                     full_text TEXT
                 )
             """)
-            conn.commit()
+            self._migrate(cursor)
+            self._ensure_tokenizer(cursor)
+            self.database_id = self._ensure_database_id(cursor)
+
+    def _migrate(self, cursor: sqlite3.Cursor):
+        """按 PRAGMA user_version 依次执行尚未应用的模式迁移。"""
+        migrations = [
+            self._migrate_fts5,
+            self._migrate_change_log,
+            self._migrate_tokens,
+            self._migrate_hot_cold_split,
+            self._migrate_content_hash_index,
+            self._migrate_jobs,
+            self._migrate_rename_change_log,
+            self._migrate_chunks,
+            self._migrate_body_blobs,
+            self._migrate_fts_tokenize,
+        ]
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        for target, migration in enumerate(migrations[version:], start=version + 1):
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+
+    def _migrate_fts5(self, cursor: sqlite3.Cursor):
+        """
+        创建 fingerprint_text 的FTS5外部内容表及同步触发器，
+        并从已有的 reasoning_index 回填。
+        """
+        self._create_fts_table(cursor, "fingerprint_text")
+
+    def _create_fts_table(self, cursor: sqlite3.Cursor, column: str, tokenize: Optional[str] = None):
+        """创建对 reasoning_index.<column> 建索引的FTS5外部内容表、同步触发器并回填。"""
+        tokenize_option = f',\n                tokenize="{tokenize}"' if tokenize else ""
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS reasoning_index_fts USING fts5(
+                {column},
+                content='reasoning_index',
+                content_rowid='rowid'{tokenize_option}
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS reasoning_index_fts_ai
+            AFTER INSERT ON reasoning_index BEGIN
+                INSERT INTO reasoning_index_fts(rowid, {column})
+                VALUES (new.rowid, new.{column});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS reasoning_index_fts_ad
+            AFTER DELETE ON reasoning_index BEGIN
+                INSERT INTO reasoning_index_fts(reasoning_index_fts, rowid, {column})
+                VALUES ('delete', old.rowid, old.{column});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS reasoning_index_fts_au
+            AFTER UPDATE ON reasoning_index BEGIN
+                INSERT INTO reasoning_index_fts(reasoning_index_fts, rowid, {column})
+                VALUES ('delete', old.rowid, old.{column});
+                INSERT INTO reasoning_index_fts(rowid, {column})
+                VALUES (new.rowid, new.{column});
+            END
+        """)
+        cursor.execute("INSERT INTO reasoning_index_fts(reasoning_index_fts) VALUES ('rebuild')")
+
+    def _drop_fts_table(self, cursor: sqlite3.Cursor):
+        for trigger in ("reasoning_index_fts_ai", "reasoning_index_fts_ad", "reasoning_index_fts_au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS reasoning_index_fts")
+
+    def _migrate_change_log(self, cursor: sqlite3.Cursor):
+        """
+        创建写入变更日志。每次写入 reasoning_index 都会追加一行，
+        AUTOINCREMENT 序号即为写入代数(generation)，供常驻索引增量刷新。
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS index_changes (
+                generation INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL
+            )
+        """)
+        for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS reasoning_index_changes_{event.lower()}
+                AFTER {event} ON reasoning_index BEGIN
+                    INSERT INTO index_changes(doc_id) VALUES ({row}.doc_id);
+                END
+            """)
+
+    def _migrate_tokens(self, cursor: sqlite3.Cursor):
+        """
+        新增持久化的词元列 tokens（分词结果以空格连接），回填已有行，
+        并让FTS5改为对 tokens 建索引，使检索两侧使用同一分词器。
+        """
+        cursor.execute("ALTER TABLE reasoning_index ADD COLUMN tokens TEXT")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self._drop_fts_table(cursor)
+        self._retokenize_all(cursor)
+        self._create_fts_table(cursor, "tokens")
+
+    def _migrate_hot_cold_split(self, cursor: sqlite3.Cursor):
+        """
+        把 full_text 从 reasoning_index 移到独立的冷表 reasoning_body，
+        使检索只扫描窄的热表（doc_id、元数据、指纹、词元）。
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reasoning_body (
+                doc_id TEXT PRIMARY KEY,
+                full_text TEXT
+            )
+        """)
+        cursor.execute("""
+            INSERT OR REPLACE INTO reasoning_body (doc_id, full_text)
+            SELECT doc_id, full_text FROM reasoning_index
+        """)
+        # 需要 SQLite >= 3.35；释放的页面会被后续写入复用，可手动执行 VACUUM 缩小文件
+        cursor.execute("ALTER TABLE reasoning_index DROP COLUMN full_text")
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS reasoning_index_body_ad
+            AFTER DELETE ON reasoning_index BEGIN
+                DELETE FROM reasoning_body WHERE doc_id = old.doc_id;
+            END
+        """)
+
+    def _migrate_content_hash_index(self, cursor: sqlite3.Cursor):
+        """为元数据中的 content_hash 建立表达式索引，用于按内容查找已有指纹。"""
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_reasoning_index_content_hash
+            ON reasoning_index(json_extract(metadata, '$.content_hash'))
+        """)
+
+    def _migrate_jobs(self, cursor: sqlite3.Cursor):
+        """创建后台任务表：保存请求、状态、最后完成的节点及其检查点状态。"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                last_node TEXT,
+                state TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    def _migrate_rename_change_log(self, cursor: sqlite3.Cursor):
+        """doc_id 被改写（重命名）时，变更日志同时记录旧ID，常驻索引才能移除旧条目。"""
+        cursor.execute("DROP TRIGGER IF EXISTS reasoning_index_changes_update")
+        cursor.execute("""
+            CREATE TRIGGER reasoning_index_changes_update
+            AFTER UPDATE ON reasoning_index BEGIN
+                INSERT INTO index_changes(doc_id) SELECT old.doc_id WHERE old.doc_id IS NOT new.doc_id;
+                INSERT INTO index_changes(doc_id) VALUES (new.doc_id);
+            END
+        """)
+
+    def _migrate_chunks(self, cursor: sqlite3.Cursor):
+        """
+        创建章节表：长笔记按标题切分后每个章节的指纹、词元及其在正文中的字符区间。
+        章节随父文档删除；重命名时由 _rename_rows 同步改写 doc_id。
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reasoning_chunks (
+                doc_id TEXT NOT NULL,
+                ordinal INTEGER NOT NULL,
+                heading TEXT,
+                start_offset INTEGER NOT NULL,
+                end_offset INTEGER NOT NULL,
+                content_hash TEXT,
+                fingerprint_text TEXT,
+                tokens TEXT,
+                PRIMARY KEY (doc_id, ordinal)
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_reasoning_chunks_content_hash ON reasoning_chunks(content_hash)"
+        )
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS reasoning_index_chunks_ad
+            AFTER DELETE ON reasoning_index BEGIN
+                DELETE FROM reasoning_chunks WHERE doc_id = old.doc_id;
+            END
+        """)
+
+    def _migrate_body_blobs(self, cursor: sqlite3.Cursor):
+        """
+        把正文从 reasoning_body 移到按内容哈希寻址的压缩表 reasoning_blobs，
+        reasoning_index 只保存正文的哈希 body_hash；内容相同的笔记共用一份正文，
+        不再被任何笔记引用的正文由触发器删除。
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reasoning_blobs (
+                body_hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+        cursor.execute("ALTER TABLE reasoning_index ADD COLUMN body_hash TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_reasoning_index_body_hash ON reasoning_index(body_hash)")
+
+        # 分批读取旧正文，避免一次性载入整个库
+        rows = cursor.connection.execute("SELECT doc_id, full_text FROM reasoning_body WHERE full_text IS NOT NULL")
+        while True:
+            batch = rows.fetchmany(config.WRITE_BATCH_SIZE)
+            if not batch:
+                break
+            hashed = [(doc_id, body_hash(full_text), full_text) for doc_id, full_text in batch]
+            cursor.executemany(
+                "INSERT OR IGNORE INTO reasoning_blobs (body_hash, codec, data) VALUES (?, ?, ?)",
+                [(digest, *compress(full_text)) for _, digest, full_text in hashed]
+            )
+            cursor.executemany(
+                "UPDATE reasoning_index SET body_hash = ? WHERE doc_id = ?",
+                [(digest, doc_id) for doc_id, digest, _ in hashed]
+            )
+        cursor.execute("DROP TRIGGER IF EXISTS reasoning_index_body_ad")
+        cursor.execute("DROP TABLE IF EXISTS reasoning_body")
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS reasoning_blobs_gc_ad
+            AFTER DELETE ON reasoning_index BEGIN
+                DELETE FROM reasoning_blobs WHERE body_hash = old.body_hash
+                AND NOT EXISTS (SELECT 1 FROM reasoning_index WHERE body_hash = old.body_hash);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS reasoning_blobs_gc_au
+            AFTER UPDATE OF body_hash ON reasoning_index
+            WHEN old.body_hash IS NOT new.body_hash BEGIN
+                DELETE FROM reasoning_blobs WHERE body_hash = old.body_hash
+                AND NOT EXISTS (SELECT 1 FROM reasoning_index WHERE body_hash = old.body_hash);
+            END
+        """)
+
+    def _migrate_fts_tokenize(self, cursor: sqlite3.Cursor):
+        """
+        按 FTS_TOKENIZE 重建FTS5表。默认的 unicode61 会去掉变音符号并在下划线处切分，
+        使 café 与 cafe、mixed 与 mixed_case 互相匹配，与持久化词元上的BM25结果不一致。
+        """
+        self._drop_fts_table(cursor)
+        self._create_fts_table(cursor, "tokens", FTS_TOKENIZE)
+
+    def _ensure_tokenizer(self, cursor: sqlite3.Cursor):
+        """若配置的分词器与写入时使用的不同，则重新分词全部文档。"""
+        cursor.execute("SELECT value FROM index_meta WHERE key = 'tokenizer'")
+        row = cursor.fetchone()
+        if row is None or row[0] != self.tokenizer.name:
+            print(f"分词器变更为 {self.tokenizer.name}，正在重新分词全部指纹...")
+            self._retokenize_all(cursor)
+
+    @staticmethod
+    def _ensure_database_id(cursor: sqlite3.Cursor) -> str:
+        """
+        返回数据库的随机标识，首次打开时生成。
+        数据库被删除重建后标识随之改变，磁盘上的派生数据（如向量快照）据此判断是否属于本库。
+        """
+        cursor.execute("SELECT value FROM index_meta WHERE key = 'database_id'")
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        database_id = uuid.uuid4().hex
+        cursor.execute("INSERT INTO index_meta (key, value) VALUES ('database_id', ?)", (database_id,))
+        return database_id
+
+    def _retokenize_all(self, cursor: sqlite3.Cursor):
+        cursor.execute("SELECT doc_id, fingerprint_text FROM reasoning_index")
+        updates = [
+            (self._tokenize_for_storage(fingerprint_text), doc_id)
+            for doc_id, fingerprint_text in cursor.fetchall()
+        ]
+        cursor.executemany("UPDATE reasoning_index SET tokens = ? WHERE doc_id = ?", updates)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reasoning_chunks'")
+        if cursor.fetchone():
+            cursor.execute("SELECT doc_id, ordinal, fingerprint_text FROM reasoning_chunks")
+            cursor.executemany(
+                "UPDATE reasoning_chunks SET tokens = ? WHERE doc_id = ? AND ordinal = ?",
+                [
+                    (self._tokenize_for_storage(fingerprint_text), doc_id, ordinal)
+                    for doc_id, ordinal, fingerprint_text in cursor.fetchall()
+                ]
+            )
+        cursor.execute(
+            "INSERT OR REPLACE INTO index_meta (key, value) VALUES ('tokenizer', ?)",
+            (self.tokenizer.name,)
+        )
+
+    def _tokenize_for_storage(self, text: Optional[str]) -> str:
+        return " ".join(self.tokenizer.tokenize(text or ""))
+
+    def _tokenize_query(self, query: Union[str, List[str]]) -> List[str]:
+        """查询可以是原始文本，也可以是已用同一分词器切好的词元列表。"""
+        if isinstance(query, str):
+            return self.tokenizer.tokenize(query)
+        return list(query)
+
+    def _prune_change_log(self, cursor: sqlite3.Cursor):
+        """只保留最近 INDEX_CHANGELOG_RETENTION 条变更。"""
+        cursor.execute(
+            """
+            DELETE FROM index_changes WHERE generation <= (
+                SELECT seq FROM sqlite_sequence WHERE name = 'index_changes'
+            ) - ?
+            """,
+            (config.INDEX_CHANGELOG_RETENTION,)
+        )
+
+    def get_generation(self) -> int:
+        """返回当前写入代数；每次添加、更新或删除文档都会使其递增。"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'index_changes'")
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+    def get_changed_doc_ids(self, since_generation: int) -> Optional[List[str]]:
+        """
+        返回在 since_generation 之后被写入的文档ID。
+        若所需的变更日志已被裁剪，返回 None，调用方应完整重建。
+        """
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(generation) FROM index_changes")
+            oldest = cursor.fetchone()[0]
+            if oldest is None or oldest > since_generation + 1:
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'index_changes'")
+                row = cursor.fetchone()
+                if row and row[0] > since_generation:
+                    return None
+                return []
+            cursor.execute(
+                "SELECT DISTINCT doc_id FROM index_changes WHERE generation > ?",
+                (since_generation,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_token_streams(self, doc_ids: Optional[List[str]] = None) -> List[tuple]:
+        """返回持久化的 (doc_id, tokens) 列表；doc_ids 为 None 时返回全部文档。"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            if doc_ids is None:
+                cursor.execute("SELECT doc_id, tokens FROM reasoning_index")
+                return cursor.fetchall()
+            rows = []
+            for batch in _chunked(doc_ids, SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT doc_id, tokens FROM reasoning_index WHERE doc_id IN ({placeholders})",
+                    batch
+                )
+                rows.extend(cursor.fetchall())
+            return rows
+
+    def get_fingerprints(self, doc_ids: Optional[List[str]] = None) -> List[tuple]:
+        """返回 (doc_id, fingerprint_text) 列表；doc_ids 为 None 时返回全部文档。"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            if doc_ids is None:
+                cursor.execute("SELECT doc_id, fingerprint_text FROM reasoning_index")
+                return cursor.fetchall()
+            rows = []
+            for batch in _chunked(doc_ids, SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT doc_id, fingerprint_text FROM reasoning_index WHERE doc_id IN ({placeholders})",
+                    batch
+                )
+                rows.extend(cursor.fetchall())
+            return rows
+
+    def get_chunk_token_streams(self, doc_ids: Optional[List[str]] = None) -> List[tuple]:
+        """
+        返回章节级的 (doc_id, ordinal, tokens) 列表；doc_ids 为 None 时返回全部文档。
+        没有章节记录的文档（未切分或在启用章节索引前写入）按整篇作为序号0的章节返回。
+        """
+        query = """
+            SELECT doc_id, ordinal, tokens FROM reasoning_chunks {chunk_filter}
+            UNION ALL
+            SELECT doc_id, 0, tokens FROM reasoning_index AS r
+            WHERE NOT EXISTS (SELECT 1 FROM reasoning_chunks AS c WHERE c.doc_id = r.doc_id) {doc_filter}
+        """
+        with self._read() as conn:
+            cursor = conn.cursor()
+            if doc_ids is None:
+                cursor.execute(query.format(chunk_filter="", doc_filter=""))
+                return cursor.fetchall()
+            rows = []
+            for batch in _chunked(doc_ids, SQLITE_MAX_VARIABLES // 2):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    query.format(
+                        chunk_filter=f"WHERE doc_id IN ({placeholders})",
+                        doc_filter=f"AND r.doc_id IN ({placeholders})"
+                    ),
+                    batch + batch
+                )
+                rows.extend(cursor.fetchall())
+            return rows
+
+    def get_chunks(self, doc_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """批量读取文档的章节记录（不含词元），返回 {doc_id: 按序号排列的章节列表}。"""
+        chunks: Dict[str, List[Dict[str, Any]]] = {}
+        if not doc_ids:
+            return chunks
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            for batch in _chunked(list(doc_ids), SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    f"""
+                    SELECT {CHUNK_COLUMNS} FROM reasoning_chunks
+                    WHERE doc_id IN ({placeholders}) ORDER BY doc_id, ordinal
+                    """,
+                    batch
+                )
+                for row in cursor.fetchall():
+                    chunks.setdefault(row["doc_id"], []).append(dict(row))
+        return chunks
+
+    def rebuild_fts_index(self):
+        """从 reasoning_index 完整重建FTS5索引（用于修复不一致）。"""
+        with self._write() as conn:
+            conn.execute("INSERT INTO reasoning_index_fts(reasoning_index_fts) VALUES ('rebuild')")
 
     def add_or_update_document(
         self, doc_id: str, metadata: Dict[str, Any],
         fingerprint_text: str, full_text: str
     ):
         """在索引中添加或更新文档。"""
-        with self._get_connection() as conn:
+        self.add_documents_bulk([{
+            "doc_id": doc_id,
+            "metadata": metadata,
+            "fingerprint_text": fingerprint_text,
+            "full_text": full_text,
+        }])
+
+    def delete_document(self, doc_id: str):
+        """从索引中删除文档。"""
+        self.delete_documents_bulk([doc_id])
+
+    def add_documents_bulk(
+        self, documents: Iterable[Dict[str, Any]], batch_size: Optional[int] = None
+    ) -> List[float]:
+        """
+        批量添加或更新文档。每个文档是包含 doc_id、metadata、fingerprint_text、
+        full_text 的字典，可选的 chunks 为章节列表（heading、start_offset、end_offset、
+        content_hash、fingerprint_text）；每批在一个事务中用 executemany 写入。
+        返回每批的耗时（秒）。
+        """
+        timings = []
+        for batch in _batched(documents, batch_size or config.WRITE_BATCH_SIZE):
+            started = time.perf_counter()
+            # 在获取写连接之前完成哈希和压缩；同一批中内容相同的正文只压缩一次
+            body_hashes = [
+                body_hash(doc["full_text"]) if doc["full_text"] is not None else None for doc in batch
+            ]
+            blob_rows = [
+                (digest, *compress(doc["full_text"]))
+                for digest, doc in dict(zip(body_hashes, batch)).items() if digest is not None
+            ]
+            index_rows = [
+                (doc["doc_id"], json.dumps(doc["metadata"]), doc["fingerprint_text"],
+                 self._tokenize_for_storage(doc["fingerprint_text"]), digest)
+                for doc, digest in zip(batch, body_hashes)
+            ]
+            chunk_rows = [
+                (doc["doc_id"], ordinal, chunk.get("heading"), chunk["start_offset"], chunk["end_offset"],
+                 chunk.get("content_hash"), chunk["fingerprint_text"],
+                 self._tokenize_for_storage(chunk["fingerprint_text"]))
+                for doc in batch
+                for ordinal, chunk in enumerate(doc.get("chunks") or [])
+            ]
+            with self._write() as conn:
+                cursor = conn.cursor()
+                # 使用UPSERT而不是INSERT OR REPLACE：保持rowid不变，并触发UPDATE触发器以同步FTS5
+                cursor.executemany(
+                    """
+                    INSERT INTO reasoning_index
+                    (doc_id, metadata, fingerprint_text, tokens, body_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(doc_id) DO UPDATE SET
+                        metadata = excluded.metadata,
+                        fingerprint_text = excluded.fingerprint_text,
+                        tokens = excluded.tokens,
+                        body_hash = excluded.body_hash
+                    """,
+                    index_rows
+                )
+                # 正文在索引行之后写入：更新索引行时触发器可能删除了本批其他文档仍要引用的正文
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO reasoning_blobs (body_hash, codec, data) VALUES (?, ?, ?)",
+                    blob_rows
+                )
+                # 旧版本的章节整体替换（不再切分的文档只删除）
+                cursor.executemany(
+                    "DELETE FROM reasoning_chunks WHERE doc_id = ?", [(doc["doc_id"],) for doc in batch]
+                )
+                cursor.executemany(
+                    """
+                    INSERT INTO reasoning_chunks
+                    (doc_id, ordinal, heading, start_offset, end_offset, content_hash, fingerprint_text, tokens)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    chunk_rows
+                )
+                self._prune_change_log(cursor)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def delete_documents_bulk(
+        self, doc_ids: Iterable[str], batch_size: Optional[int] = None
+    ) -> List[float]:
+        """批量删除文档，每批一个事务。返回每批的耗时（秒）。"""
+        timings = []
+        for batch in _batched(doc_ids, batch_size or config.WRITE_BATCH_SIZE):
+            started = time.perf_counter()
+            with self._write() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "DELETE FROM reasoning_index WHERE doc_id = ?",
+                    [(doc_id,) for doc_id in batch]
+                )
+                self._prune_change_log(cursor)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    @staticmethod
+    def _prefix_range(prefix: str) -> Tuple[str, str]:
+        """
+        返回覆盖所有以 prefix 开头的doc_id的区间 [下界, 上界)，可直接使用主键索引做范围扫描。
+        空前缀或只含路径分隔符的前缀会匹配整个Vault，直接拒绝，避免目录操作误删或误改全部文档。
+        """
+        if not prefix.strip("/" + os.sep):
+            raise ValueError(f"目录前缀不能为空或只包含路径分隔符: {prefix!r}")
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    @staticmethod
+    def _renamed_metadata(metadata: Optional[str], old_doc_id: str, new_doc_id: str) -> str:
+        """重命名后同步更新元数据中的文件路径和文件名。"""
+        metadata = json.loads(metadata) if metadata else {}
+        file_path = metadata.get("file_path")
+        if isinstance(file_path, str) and file_path.endswith(old_doc_id):
+            metadata["file_path"] = file_path[:len(file_path) - len(old_doc_id)] + new_doc_id
+        if "file_name" in metadata:
+            metadata["file_name"] = Path(new_doc_id).name
+        return json.dumps(metadata)
+
+    def _rename_rows(self, cursor: sqlite3.Cursor, renames: List[Tuple[str, str, str]]):
+        """按 (旧ID, 新ID, 新元数据) 改写doc_id；指纹、词元和正文哈希保持不变。"""
+        # 目标ID已有文档时（移动覆盖了已有文件）先删除
+        cursor.executemany(
+            "DELETE FROM reasoning_index WHERE doc_id = ?",
+            [(new_doc_id,) for _, new_doc_id, _ in renames]
+        )
+        cursor.executemany(
+            "UPDATE reasoning_index SET doc_id = ?, metadata = ? WHERE doc_id = ?",
+            [(new_doc_id, metadata, old_doc_id) for old_doc_id, new_doc_id, metadata in renames]
+        )
+        cursor.executemany(
+            "UPDATE reasoning_chunks SET doc_id = ? WHERE doc_id = ?",
+            [(new_doc_id, old_doc_id) for old_doc_id, new_doc_id, _ in renames]
+        )
+        self._prune_change_log(cursor)
+
+    def rename_document(self, old_doc_id: str, new_doc_id: str) -> bool:
+        """文件改名或移动时改写doc_id，保留已有指纹；旧ID不在索引中时返回 False。"""
+        with self._write() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT metadata FROM reasoning_index WHERE doc_id = ?", (old_doc_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            self._rename_rows(
+                cursor, [(old_doc_id, new_doc_id, self._renamed_metadata(row[0], old_doc_id, new_doc_id))]
+            )
+            return True
+
+    def rename_prefix(self, old_prefix: str, new_prefix: str) -> int:
+        """目录移动：在一个事务中把所有以 old_prefix 开头的doc_id改为以 new_prefix 开头，返回文档数。"""
+        with self._write() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                """
-                INSERT OR REPLACE INTO reasoning_index
-                (doc_id, metadata, fingerprint_text, full_text)
-                VALUES (?, ?, ?, ?)
-                """,
-                (doc_id, json.dumps(metadata), fingerprint_text, full_text)
+                "SELECT doc_id, metadata FROM reasoning_index WHERE doc_id >= ? AND doc_id < ?",
+                self._prefix_range(old_prefix)
             )
-            conn.commit()
+            renames = []
+            for old_doc_id, metadata in cursor.fetchall():
+                new_doc_id = new_prefix + old_doc_id[len(old_prefix):]
+                renames.append((old_doc_id, new_doc_id, self._renamed_metadata(metadata, old_doc_id, new_doc_id)))
+            if renames:
+                self._rename_rows(cursor, renames)
+            return len(renames)
 
-    def delete_document(self, doc_id: str):
-        """从索引中删除文档。"""
-        with self._get_connection() as conn:
+    def delete_prefix(self, prefix: str) -> int:
+        """目录删除：用一条语句删除所有以 prefix 开头的文档，返回删除的数量。"""
+        with self._write() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM reasoning_index WHERE doc_id = ?", (doc_id,))
-            conn.commit()
+            cursor.execute(
+                "DELETE FROM reasoning_index WHERE doc_id >= ? AND doc_id < ?",
+                self._prefix_range(prefix)
+            )
+            deleted = cursor.rowcount
+            self._prune_change_log(cursor)
+            return deleted
 
-    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
-        """通过ID检索单个文档。"""
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
+    def get_document(self, doc_id: str, include_body: bool = True) -> Optional[Dict[str, Any]]:
+        """通过ID检索单个文档；include_body 为 False 时不读取和解压 full_text。"""
+        with self._read() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM reasoning_index WHERE doc_id = ?", (doc_id,))
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(
+                f"SELECT {HANDLE_COLUMNS}, body_hash FROM reasoning_index WHERE doc_id = ?", (doc_id,)
+            )
             row = cursor.fetchone()
-            return dict(row) if row else None
+            if row is None:
+                return None
+            document = dict(row)
+            digest = document.pop("body_hash")
+            if include_body:
+                document["full_text"] = self._read_blobs(cursor, [digest]).get(digest)
+            return document
 
-    def get_all_documents(self) -> List[Dict[str, Any]]:
-        """从索引中检索所有文档。"""
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
+    def get_all_documents(self, include_body: bool = False) -> List[Dict[str, Any]]:
+        """从索引中检索所有文档的句柄；include_body 为 True 时同时读取 full_text（不进入正文缓存）。"""
+        with self._read() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM reasoning_index")
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f"SELECT {HANDLE_COLUMNS}, body_hash FROM reasoning_index")
+            documents = [dict(row) for row in cursor.fetchall()]
+            digests = [document.pop("body_hash") for document in documents]
+            if include_body:
+                bodies = self._read_blobs(cursor, digests, cache=False)
+                for document, digest in zip(documents, digests):
+                    document["full_text"] = bodies.get(digest)
+            return documents
 
-    def search_by_bm25(self, query: str, top_k: int = config.LIBRARIAN_TOP_K) -> List[Dict[str, Any]]:
-            """
-            使用 BM25 对 fingerprint_text 进行检索与排序。
-            """
-            # 取全部文档
-            with self._get_connection() as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM reasoning_index")
-                rows = cursor.fetchall()
+    def find_fingerprint_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """返回任一内容哈希相同的已索引文档或章节的指纹；没有则返回 None。"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT fingerprint_text FROM reasoning_index
+                WHERE json_extract(metadata, '$.content_hash') = ?
+                LIMIT 1
+                """,
+                (content_hash,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "SELECT fingerprint_text FROM reasoning_chunks WHERE content_hash = ? LIMIT 1",
+                    (content_hash,)
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
 
-            if not rows:
-                return []
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        """只更新文档的元数据（内容未变时使用，不改动指纹和正文）。"""
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE reasoning_index SET metadata = ? WHERE doc_id = ?",
+                (json.dumps(metadata), doc_id)
+            )
 
-            # 仅使用 fingerprint_text 构建语料
-            corpus_texts = [
-                (row["fingerprint_text"] or "")
-                for row in rows
-            ]
+    def get_bodies(self, doc_ids: List[str]) -> Dict[str, str]:
+        """批量读取正文，返回 {doc_id: full_text}：先从热表取正文哈希，再按哈希读取并解压。"""
+        if not doc_ids:
+            return {}
+        with self._read() as conn:
+            cursor = conn.cursor()
+            digests = {}
+            for batch in _chunked(list(dict.fromkeys(doc_ids)), SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT doc_id, body_hash FROM reasoning_index WHERE doc_id IN ({placeholders})",
+                    batch
+                )
+                digests.update(cursor.fetchall())
+            blobs = self._read_blobs(cursor, digests.values())
+        return {doc_id: blobs[digest] for doc_id, digest in digests.items() if digest in blobs}
 
-            # 简单分词，可按需替换为 jieba.lcut
-            tokenized_corpus = [text.split() for text in corpus_texts]
+    def _read_blobs(self, cursor: sqlite3.Cursor, digests: Iterable[Optional[str]],
+                    cache: bool = True) -> Dict[str, str]:
+        """按内容哈希读取正文：先查进程内LRU缓存，其余从 reasoning_blobs 批量读取并解压。"""
+        digests = [digest for digest in dict.fromkeys(digests) if digest]
+        bodies = self._body_cache.get_many(digests) if cache else {}
+        missing = [digest for digest in digests if digest not in bodies]
+        loaded = {}
+        for batch in _chunked(missing, SQLITE_MAX_VARIABLES):
+            placeholders = ",".join("?" * len(batch))
+            rows = cursor.execute(
+                f"SELECT body_hash, codec, data FROM reasoning_blobs WHERE body_hash IN ({placeholders})",
+                batch
+            ).fetchall()
+            loaded.update((row[0], decompress(row[1], row[2])) for row in rows)
+        if cache:
+            self._body_cache.put_many(loaded)
+        bodies.update(loaded)
+        return bodies
 
-            # 初始化 BM25
-            bm25 = BM25Okapi(tokenized_corpus)
+    @staticmethod
+    def _qualified_handle_columns(alias: str) -> str:
+        return ", ".join(f"{alias}.{column.strip()}" for column in HANDLE_COLUMNS.split(","))
+
+    def search_by_bm25(
+        self, query: Union[str, List[str]], top_k: int = config.LIBRARIAN_TOP_K
+    ) -> List[Dict[str, Any]]:
+        """
+        使用 BM25 对 fingerprint_text 的持久化词元进行检索与排序。
+        query 可以是原始文本或已分好的词元；具体引擎由 config.SEARCH_ENGINE 决定，
+        启用 CHUNKED_INDEXING 时按章节检索，句柄的 chunks 字段列出命中的章节。
+        返回按得分从高到低排列、不含 full_text 的轻量句柄，score 为BM25得分（越大越相关），
+        正文按需通过 get_bodies/get_document 读取。
+        """
+        query_tokens = self._tokenize_query(query)
+        if config.CHUNKED_INDEXING:
+            with metrics.SEARCH_LATENCY.time(engine="chunks", mode="single"):
+                return self._search_many_by_chunks([query_tokens], top_k)[0]
+        with metrics.SEARCH_LATENCY.time(engine=config.SEARCH_ENGINE, mode="single"):
+            if config.SEARCH_ENGINE == "fts5":
+                return self._search_by_fts5(query_tokens, top_k)
+            if config.SEARCH_ENGINE == "resident":
+                return self._search_by_resident(query_tokens, top_k)
+            return self._search_by_rank_bm25(query_tokens, top_k)
+
+    def search_by_bm25_many(
+        self, queries: List[Union[str, List[str]]], top_k: int = config.LIBRARIAN_TOP_K
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索多条查询，返回与 queries 顺序一致的句柄列表。
+        rank_bm25 引擎只读取并构建一次语料；resident 引擎在一次向量化计算中为所有查询打分。
+        """
+        queries_tokens = [self._tokenize_query(query) for query in queries]
+        if config.CHUNKED_INDEXING:
+            with metrics.SEARCH_LATENCY.time(engine="chunks", mode="batch"):
+                return self._search_many_by_chunks(queries_tokens, top_k)
+        with metrics.SEARCH_LATENCY.time(engine=config.SEARCH_ENGINE, mode="batch"):
+            if config.SEARCH_ENGINE == "fts5":
+                return [self._search_by_fts5(tokens, top_k) for tokens in queries_tokens]
+            if config.SEARCH_ENGINE == "resident":
+                return self._search_many_by_resident(queries_tokens, top_k)
+            return self._search_many_by_rank_bm25(queries_tokens, top_k)
+
+    def _search_by_rank_bm25(self, query_tokens: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """读取全部词元，在内存中构建 BM25Okapi 并排序。"""
+        return self._search_many_by_rank_bm25([query_tokens], top_k)[0]
+
+    def _search_many_by_rank_bm25(
+        self, queries_tokens: List[List[str]], top_k: int
+    ) -> List[List[Dict[str, Any]]]:
+        """读取全部词元，构建一次 BM25Okapi，再依次为每条查询排序。"""
+        # 取全部文档的热列
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f"SELECT {HANDLE_COLUMNS}, tokens FROM reasoning_index")
+            rows = cursor.fetchall()
 
-            # 查询处理
-            tokenized_query = query.split()
+        if not rows:
+            return [[] for _ in queries_tokens]
 
+        # 使用写入时持久化的 fingerprint_text 词元构建语料，无需重新分词
+        tokenized_corpus = [(row["tokens"] or "").split() for row in rows]
+
+        # 初始化 BM25
+        bm25 = BM25Okapi(tokenized_corpus)
+
+        # 组装结果时不返回词元
+        handles = [dict(row) for row in rows]
+        for handle in handles:
+            handle.pop("tokens")
+
+        all_results = []
+        for query_tokens in queries_tokens:
             # 得分计算
-            scores = bm25.get_scores(tokenized_query)
+            scores = bm25.get_scores(query_tokens)
 
             # 取 top_k 索引
             ranked_indices = sorted(
@@ -115,7 +979,394 @@ class ReasoningIndexStore:
                 key=lambda i: scores[i],
                 reverse=True
             )[:top_k]
+            all_results.append([dict(handles[i], score=float(scores[i])) for i in ranked_indices])
+        return all_results
+
+    def _search_by_fts5(self, query_tokens: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """使用FTS5内置的 bm25() 排序，仅从数据库取回 top_k 行。"""
+        match_expr = self._build_fts_query(query_tokens)
+        if not match_expr:
+            return []
+
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            # bm25() 返回值越小越相关，取相反数作为得分
+            cursor.execute(
+                f"""
+                SELECT {self._qualified_handle_columns('r')}, -bm25(reasoning_index_fts) AS score
+                FROM reasoning_index_fts
+                JOIN reasoning_index AS r ON r.rowid = reasoning_index_fts.rowid
+                WHERE reasoning_index_fts MATCH ?
+                ORDER BY bm25(reasoning_index_fts)
+                LIMIT ?
+                """,
+                (match_expr, top_k)
+            )
+            rows = cursor.fetchall()
+        return [dict(row) for row in rows]
+
+    def warm_up(self):
+        """预先构建常驻BM25索引，避免第一次查询承担构建开销。"""
+        if config.CHUNKED_INDEXING:
+            get_resident_index(self.db_path, chunked=True).refresh(self)
+        elif config.SEARCH_ENGINE == "resident":
+            get_resident_index(self.db_path).refresh(self)
+        if config.DENSE_RETRIEVAL:
+            get_dense_index(self.db_path).refresh(self)
+
+    def _search_by_resident(self, query_tokens: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """使用进程级常驻BM25索引打分，只从数据库读取 top_k 行。"""
+        index = get_resident_index(self.db_path)
+        index.refresh(self)
+        hits = index.search(query_tokens, top_k)
+        by_id = {doc["doc_id"]: doc for doc in self._get_documents_by_ids([doc_id for doc_id, _ in hits])}
+        return [dict(by_id[doc_id], score=score) for doc_id, score in hits if doc_id in by_id]
+
+    def _search_many_by_resident(
+        self, queries_tokens: List[List[str]], top_k: int
+    ) -> List[List[Dict[str, Any]]]:
+        """用常驻索引一次为多条查询打分，所有命中的句柄合并为一次读取。"""
+        index = get_resident_index(self.db_path)
+        index.refresh(self)
+        all_hits = index.search_many(queries_tokens, top_k)
+        doc_ids = list(dict.fromkeys(doc_id for hits in all_hits for doc_id, _ in hits))
+        by_id = {doc["doc_id"]: doc for doc in self._get_documents_by_ids(doc_ids)}
+        return [
+            [dict(by_id[doc_id], score=score) for doc_id, score in hits if doc_id in by_id]
+            for hits in all_hits
+        ]
+
+    def search_by_embedding(self, query: str, top_k: int = config.DENSE_TOP_K) -> List[Dict[str, Any]]:
+        """用本地嵌入模型对指纹做向量检索，返回带 score（余弦相似度）的轻量句柄。"""
+        return self.search_by_embedding_many([query], top_k)[0]
+
+    def search_by_embedding_many(
+        self, queries: List[str], top_k: int = config.DENSE_TOP_K
+    ) -> List[List[Dict[str, Any]]]:
+        """批量向量检索，所有查询在一次矩阵乘法中打分，命中的句柄合并为一次读取。"""
+        with metrics.SEARCH_LATENCY.time(engine="dense", mode="single" if len(queries) == 1 else "batch"):
+            index = get_dense_index(self.db_path)
+            index.refresh(self)
+            all_hits = index.search_many(queries, top_k)
+            doc_ids = list(dict.fromkeys(doc_id for hits in all_hits for doc_id, _ in hits))
+            by_id = {doc["doc_id"]: doc for doc in self._get_documents_by_ids(doc_ids)}
+            return [
+                [dict(by_id[doc_id], score=score) for doc_id, score in hits if doc_id in by_id]
+                for hits in all_hits
+            ]
+
+    def _search_many_by_chunks(
+        self, queries_tokens: List[List[str]], top_k: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        用章节级常驻索引打分，再按父文档聚合：取回 top_k * CHUNK_SEARCH_OVERSAMPLE 个章节，
+        每篇笔记的得分为其命中章节得分的衰减加权和。
+        """
+        index = get_resident_index(self.db_path, chunked=True)
+        index.refresh(self)
+        all_hits = index.search_many(queries_tokens, top_k * config.CHUNK_SEARCH_OVERSAMPLE)
+
+        ranked = []
+        for hits in all_hits:
+            matched: Dict[str, List[Tuple[int, float]]] = {}
+            for (doc_id, ordinal), score in hits:
+                # hits 已按得分从高到低排列；没有命中任何查询词的章节只在笔记本身无命中时保留一个
+                if score > 0 or doc_id not in matched:
+                    matched.setdefault(doc_id, []).append((ordinal, score))
+            scores = {
+                doc_id: sum(score * config.CHUNK_AGGREGATION_DECAY ** i for i, (_, score) in enumerate(chunks))
+                for doc_id, chunks in matched.items()
+            }
+            top = sorted(scores, key=scores.get, reverse=True)[:top_k]
+            ranked.append([(doc_id, scores[doc_id], matched[doc_id]) for doc_id in top])
+
+        doc_ids = list(dict.fromkeys(doc_id for results in ranked for doc_id, _, _ in results))
+        by_id = {doc["doc_id"]: doc for doc in self._get_documents_by_ids(doc_ids)}
+        chunks_by_id = self.get_chunks(doc_ids)
+
+        all_results = []
+        for results in ranked:
+            handles = []
+            for doc_id, score, matched_chunks in results:
+                if doc_id not in by_id:
+                    continue
+                handle = dict(by_id[doc_id], score=score)
+                records = {chunk["ordinal"]: chunk for chunk in chunks_by_id.get(doc_id, [])}
+                handle["chunks"] = [
+                    # 没有章节记录的文档以整篇作为章节（区间为空表示全文）
+                    dict(records.get(ordinal) or {
+                        "doc_id": doc_id, "ordinal": ordinal, "heading": None,
+                        "start_offset": None, "end_offset": None,
+                        "fingerprint_text": handle["fingerprint_text"],
+                    }, score=chunk_score)
+                    for ordinal, chunk_score in matched_chunks
+                ]
+                handles.append(handle)
+            all_results.append(handles)
+        return all_results
+
+    def get_documents(self, doc_ids: List[str]) -> List[Dict[str, Any]]:
+        """按给定顺序批量读取包含 full_text 的文档，重复或不存在的ID被忽略。"""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        documents = self._get_documents_by_ids(doc_ids)
+        bodies = self.get_bodies(doc_ids)
+        for document in documents:
+            document["full_text"] = bodies.get(document["doc_id"])
+        return documents
+
+    def _get_documents_by_ids(self, doc_ids: List[str]) -> List[Dict[str, Any]]:
+        """按给定顺序批量读取文档句柄，不存在的ID被忽略。"""
+        if not doc_ids:
+            return []
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            by_id = {}
+            for batch in _chunked(doc_ids, SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT {HANDLE_COLUMNS} FROM reasoning_index WHERE doc_id IN ({placeholders})",
+                    batch
+                )
+                by_id.update((row["doc_id"], dict(row)) for row in cursor.fetchall())
+        return [by_id[doc_id] for doc_id in doc_ids if doc_id in by_id]
+
+    # --- 后台任务 ---
+
+    JOB_JSON_COLUMNS = ("request", "state", "result")
+
+    @classmethod
+    def _job_from_row(cls, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for column in cls.JOB_JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def create_job(self, job_id: str, request: Dict[str, Any]):
+        """新建一个排队中的任务。"""
+        now = time.time()
+        with self._write() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, status, request, created_at, updated_at)
+                VALUES (?, 'queued', ?, ?, ?)
+                """,
+                (job_id, json.dumps(request, ensure_ascii=False), now, now)
+            )
+
+    def count_jobs(self, status: str) -> int:
+        """返回处于指定状态的任务数。"""
+        with self._read() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务；不存在时返回 None。"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            return self._job_from_row(row) if row else None
+
+    def claim_next_job(self, worker: str) -> Optional[Dict[str, Any]]:
+        """原子地领取最早排队的任务并标记为运行中；没有任务时返回 None。"""
+        with self._write() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(
+                """
+                UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = (
+                    SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1
+                )
+                RETURNING *
+                """,
+                (worker, time.time())
+            )
+            row = cursor.fetchone()
+            return self._job_from_row(row) if row else None
+
+    def checkpoint_job(self, job_id: str, worker: str, last_node: str, state: Dict[str, Any]) -> bool:
+        """保存节点完成后的状态；任务已不属于该 worker 时返回 False。"""
+        with self._write() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET last_node = ?, state = ?, updated_at = ?
+                WHERE job_id = ? AND worker = ? AND status = 'running'
+                """,
+                (last_node, json.dumps(state, ensure_ascii=False), time.time(), job_id, worker)
+            )
+            return cursor.rowcount > 0
+
+    def finish_job(
+        self, job_id: str, worker: str, status: str,
+        result: Any = None, error: Optional[str] = None
+    ) -> bool:
+        """
+        结束一次运行：status 为 succeeded / failed，或 queued（放回队列等待重试，保留检查点）。
+        任务已不属于该 worker 时返回 False。
+        """
+        with self._write() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, error = ?, worker = NULL, updated_at = ?
+                WHERE job_id = ? AND worker = ? AND status = 'running'
+                """,
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error, time.time(), job_id, worker
+                )
+            )
+            return cursor.rowcount > 0
+
+    def touch_jobs(self, job_ids: List[str], worker: str):
+        """刷新运行中任务的租约时间（心跳）。"""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._write() as conn:
+            conn.executemany(
+                "UPDATE jobs SET updated_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                [(now, job_id, worker) for job_id in job_ids]
+            )
+
+    def release_jobs(self, worker: str) -> int:
+        """把该 worker 所有运行中的任务放回队列（保留检查点），返回数量。"""
+        with self._write() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ?
+                WHERE status = 'running' AND worker = ?
+                """,
+                (time.time(), worker)
+            )
+            return cursor.rowcount
+
+    def requeue_stale_jobs(
+        self, lease_seconds: float, max_attempts: int = config.JOB_MAX_ATTEMPTS
+    ) -> Tuple[int, int]:
+        """
+        回收租约已过期（执行它的进程已退出）的运行中任务，返回 (放回队列数, 标记失败数)。
+        已执行 max_attempts 次的任务不再放回队列，避免反复导致进程崩溃的任务被无限重试。
+        """
+        now = time.time()
+        with self._write() as conn:
+            failed = conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', worker = NULL, updated_at = ?,
+                    error = '任务执行中断的次数已达到重试上限'
+                WHERE status = 'running' AND updated_at < ? AND attempts >= ?
+                """,
+                (now, now - lease_seconds, max_attempts)
+            ).rowcount
+            requeued = conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', worker = NULL
+                WHERE status = 'running' AND updated_at < ?
+                """,
+                (now - lease_seconds,)
+            ).rowcount
+            return requeued, failed
+
+    @staticmethod
+    def _build_fts_query(tokens: List[str]) -> str:
+        """将查询词转换为FTS5 MATCH表达式：每个词作为短语加引号转义，以OR连接。"""
+        phrases = []
+        seen = set()
+        for token in tokens:
+            if token in seen:
+                continue
+            seen.add(token)
+            phrases.append('"' + token.replace('"', '""') + '"')
+        return " OR ".join(phrases)
+
+
+class WriteBehindBuffer:
+    """
+    写后缓冲：先在内存中累积文档的写入与删除（同一文档只保留最后一次操作），
+    数量达到 max_items 或距上次刷新超过 max_delay 秒时，批量写入存储。
+    """
+
+    def __init__(
+        self, store: ReasoningIndexStore,
+        max_items: int = config.WRITE_BUFFER_MAX_ITEMS,
+        max_delay: float = config.WRITE_BUFFER_MAX_DELAY
+    ):
+        self.store = store
+        self.max_items = max_items
+        self.max_delay = max_delay
+        # doc_id -> 文档字典；值为 None 表示删除
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def add(self, document: Dict[str, Any]):
+        """缓冲一次添加或更新。"""
+        self._put(document["doc_id"], document)
+
+    def delete(self, doc_id: str):
+        """缓冲一次删除。"""
+        self._put(doc_id, None)
+
+    def _put(self, doc_id: str, document: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._pending[doc_id] = document
+            full = len(self._pending) >= self.max_items
+        if full:
+            self.flush()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """把缓冲中的所有操作批量写入存储。"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            upserts = [doc for doc in pending.values() if doc is not None]
+            deletes = [doc_id for doc_id, doc in pending.items() if doc is None]
+            try:
+                timings = self.store.add_documents_bulk(upserts) if upserts else []
+                timings += self.store.delete_documents_bulk(deletes) if deletes else []
+            except Exception as e:
+                # 写入失败时放回缓冲，等待下次刷新重试（期间更新的操作优先）
+                with self._lock:
+                    for doc_id, doc in pending.items():
+                        self._pending.setdefault(doc_id, doc)
+                print(f"批量写入索引时出错: {e}")
+                return
+            batches = ", ".join(f"{t * 1000:.1f}ms" for t in timings)
+            print(f"已批量写入索引: 更新 {len(upserts)} 篇, 删除 {len(deletes)} 篇 (每批耗时: {batches})")
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.max_delay):
+            self.flush()
+
+    def close(self):
+        """停止后台刷新线程并写入剩余操作。"""
+        self._stopped.set()
+        self._flusher.join()
+        self.flush()
+
+
+# 进程级共享的存储实例
+_default_store: Optional[ReasoningIndexStore] = None
+_default_store_lock = threading.Lock()
+
 
-            # 组装结果
-            results = [dict(rows[i]) for i in ranked_indices]
-            return results
\ No newline at end of file
+def get_store() -> ReasoningIndexStore:
+    """返回进程内共享的 ReasoningIndexStore（基于 config.DB_PATH），首次调用时创建。"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ReasoningIndexStore()
+        return _default_store
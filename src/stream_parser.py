@@ -0,0 +1,81 @@
+"""
+合成结果的增量解析。
+LLM以流式方式输出 {"knowledge_points": [{...}, {...}]} 时，
+每当数组中的一个知识点对象完整到达就立即解析出来，无需等待整个JSON结束。
+"""
+import json
+from typing import List, Dict, Any
+
+
+class KnowledgePointStreamParser:
+    """逐块喂入LLM输出，返回新完成的知识点。"""
+
+    ARRAY_KEY = '"knowledge_points"'
+
+    def __init__(self):
+        self.buffer = ""
+        # 扫描位置与状态，每个字符只扫描一次
+        self._pos = 0
+        self._in_array = False
+        self._array_done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = -1
+        self.count = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """追加一段输出，返回其中新完成的知识点列表。"""
+        self.buffer += chunk
+        if self._array_done:
+            return []
+
+        if not self._in_array:
+            key_pos = self.buffer.find(self.ARRAY_KEY)
+            if key_pos < 0:
+                return []
+            bracket_pos = self.buffer.find("[", key_pos + len(self.ARRAY_KEY))
+            if bracket_pos < 0:
+                return []
+            self._in_array = True
+            self._pos = bracket_pos + 1
+
+        points = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    point = self._parse_object(buffer[self._object_start:self._pos + 1])
+                    if point is not None:
+                        points.append(point)
+            elif char == "]" and self._depth == 0:
+                self._array_done = True
+                self._pos += 1
+                break
+            self._pos += 1
+
+        self.count += len(points)
+        return points
+
+    @staticmethod
+    def _parse_object(text: str):
+        try:
+            point = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return point if isinstance(point, dict) else None
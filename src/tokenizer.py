@@ -0,0 +1,91 @@
+"""
+BM25检索使用的可插拔分词器。
+写入指纹时分词一次并持久化，查询端使用同一个分词器，保证两侧词表一致。
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+import config
+
+# CJK统一表意文字、扩展A、兼容表意文字、日文假名和韩文音节
+_CJK_RANGES = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK_RANGES}]+)|([^\\W{_CJK_RANGES}]+)")
+
+
+class Tokenizer:
+    """分词器基类。产出的词元不包含空白字符，以便用空格连接后持久化。"""
+
+    name = "base"
+
+    def tokenize(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+
+class WhitespaceTokenizer(Tokenizer):
+    """按空白切分（旧版行为）。"""
+
+    name = "whitespace"
+
+    def tokenize(self, text: str) -> List[str]:
+        return (text or "").split()
+
+
+class CharNgramTokenizer(Tokenizer):
+    """
+    CJK连续片段切分为字符n-gram，其他文字按单词切分并转为小写。
+    不依赖词典，适合中英混排的指纹。
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self.name = f"ngram{n}"
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for cjk, word in _TOKEN_RE.findall(text or ""):
+            if word:
+                tokens.append(word.lower())
+            elif len(cjk) <= self.n:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + self.n] for i in range(len(cjk) - self.n + 1))
+        return tokens
+
+
+class JiebaTokenizer(Tokenizer):
+    """基于jieba词典的中文分词（可选依赖）。"""
+
+    name = "jieba"
+
+    def __init__(self):
+        try:
+            import jieba
+        except ImportError as e:
+            raise ImportError("使用 jieba 分词器需要先安装：pip install jieba") from e
+        self._jieba = jieba
+
+    def tokenize(self, text: str) -> List[str]:
+        # 去掉标点和空白，只保留由文字组成的词
+        return [
+            piece.lower()
+            for piece in self._jieba.lcut(text or "")
+            if re.fullmatch(r"\w+", piece)
+        ]
+
+
+def get_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    """按名称（默认取 config.TOKENIZER）获取分词器实例。"""
+    return _create_tokenizer(name or config.TOKENIZER)
+
+
+@lru_cache(maxsize=None)
+def _create_tokenizer(name: str) -> Tokenizer:
+    if name == "whitespace":
+        return WhitespaceTokenizer()
+    if name == "jieba":
+        return JiebaTokenizer()
+    match = re.fullmatch(r"ngram(\d*)", name)
+    if match:
+        return CharNgramTokenizer(int(match.group(1) or 2))
+    raise ValueError(f"未知的分词器: {name}")
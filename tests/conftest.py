@@ -0,0 +1,53 @@
+"""
+测试共用的夹具：每个测试使用临时目录中的独立数据库，LLM替换为本地桩模型，
+不需要DeepSeek密钥，也不会读写 data/ 下的文件。
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "sk-test")
+
+import config
+from benchmarks.stub_llm import StubChatModel
+from src import llm, storage
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _isolated_default_store(tmp_path_factory):
+    """
+    src.indexer 等模块在导入时通过 get_store() 打开共享存储；
+    先指向临时数据库，保证测试不会打开或迁移 data/ 下的真实数据库。
+    """
+    if storage._default_store is None:
+        storage._default_store = storage.ReasoningIndexStore(tmp_path_factory.mktemp("default") / "index.db")
+    yield
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """临时数据库上的 ReasoningIndexStore，并设为进程内共享的存储实例。"""
+    monkeypatch.setattr(config, "DB_PATH", tmp_path / "reasoning_index.db")
+    monkeypatch.setattr(config, "LLM_CACHE_ENABLED", False)
+    instance = storage.ReasoningIndexStore(config.DB_PATH)
+    monkeypatch.setattr(storage, "_default_store", instance)
+    yield instance
+    instance.close()
+
+
+@pytest.fixture
+def stub_llm():
+    """所有阶段使用确定性的桩模型。"""
+    llm.set_llm_factory(lambda model: StubChatModel(model))
+    yield
+    llm.set_llm_factory(None)
+
+
+def make_document(doc_id: str, fingerprint: str, full_text: str = None, **extra):
+    return {
+        "doc_id": doc_id,
+        "metadata": {"file_name": doc_id},
+        "fingerprint_text": fingerprint,
+        "full_text": full_text if full_text is not None else f"# {doc_id}\n\n{fingerprint}",
+        **extra,
+    }
@@ -0,0 +1,108 @@
+import random
+
+import numpy as np
+import pytest
+
+import config
+from src.bm25_index import ResidentBM25Index
+from tests.conftest import make_document
+
+WORDS = ["量子", "计算", "烹饪", "火候", "历史", "战争", "数学", "证明", "音乐", "和声", "编程", "并发"]
+QUERIES = ["量子 计算", "烹饪", "历史 战争 数学", "并发 并发 编程", "不存在的词"]
+
+
+def _fingerprint(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+
+
+def _scores(store, engine, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", engine)
+    top_k = len(store.get_token_streams())
+    single = [{h["doc_id"]: h["score"] for h in store.search_by_bm25(q, top_k=top_k)} for q in QUERIES]
+    many = [{h["doc_id"]: h["score"] for h in hits} for hits in store.search_by_bm25_many(QUERIES, top_k=top_k)]
+    return single, many
+
+
+def _assert_parity(store, monkeypatch):
+    expected, expected_many = _scores(store, "rank_bm25", monkeypatch)
+    actual, actual_many = _scores(store, "resident", monkeypatch)
+    for reference, resident in ((expected, actual), (expected_many, actual_many), (expected, expected_many)):
+        for ref, got in zip(reference, resident):
+            assert ref.keys() == got.keys()
+            for doc_id, score in ref.items():
+                assert got[doc_id] == pytest.approx(score, rel=1e-6, abs=1e-9)
+
+
+def test_resident_matches_rank_bm25_through_updates(store, monkeypatch):
+    # 调小合并阈值，让增量段与合并两条路径都被覆盖
+    monkeypatch.setattr(ResidentBM25Index, "DELTA_MIN_DOCS", 3)
+    rng = random.Random(7)
+    store.add_documents_bulk([make_document(f"d{i}.md", _fingerprint(rng)) for i in range(40)])
+    _assert_parity(store, monkeypatch)
+
+    for round_ in range(4):
+        changed = rng.sample(range(40), 5)
+        store.add_documents_bulk([make_document(f"d{i}.md", _fingerprint(rng)) for i in changed[:2]])
+        store.add_documents_bulk([make_document(f"new{round_}-{i}.md", _fingerprint(rng)) for i in range(2)])
+        store.delete_documents_bulk([f"d{i}.md" for i in changed[2:]])
+        _assert_parity(store, monkeypatch)
+
+
+def test_resident_top_k_is_ordered_prefix(store, monkeypatch):
+    rng = random.Random(3)
+    store.add_documents_bulk([make_document(f"d{i}.md", _fingerprint(rng)) for i in range(30)])
+    monkeypatch.setattr(config, "SEARCH_ENGINE", "resident")
+    full = store.search_by_bm25("量子 计算", top_k=30)
+    head = store.search_by_bm25("量子 计算", top_k=5)
+    assert [h["score"] for h in head] == sorted((h["score"] for h in head), reverse=True)
+    assert [h["score"] for h in head] == pytest.approx([h["score"] for h in full[:5]])
+
+
+MIXED_WORDS = ["量子计算", "纠错", "表面码", "分布式系统", "共识算法", "mixed_case", "Café", "naïve", "Python3"] + [
+    f"词{i}" for i in range(30)
+]
+
+
+def _positive(hits):
+    return {h["doc_id"]: h["score"] for h in hits if h["score"] > 0}
+
+
+def _ranks(values):
+    return np.argsort(np.argsort(values))
+
+
+def test_fts5_ranking_agrees_with_persisted_tokens(store, monkeypatch):
+    rng = random.Random(1)
+    store.add_documents_bulk([
+        make_document(f"d{i}.md", " ".join(rng.choice(MIXED_WORDS) for _ in range(rng.randint(3, 15))))
+        for i in range(200)
+    ])
+    for query in ["量子计算 纠错", "mixed_case", "Café naïve", "Python3 分布式", "共识"]:
+        monkeypatch.setattr(config, "SEARCH_ENGINE", "rank_bm25")
+        expected = _positive(store.search_by_bm25(query, top_k=200))
+        monkeypatch.setattr(config, "SEARCH_ENGINE", "fts5")
+        actual = store.search_by_bm25(query, top_k=200)
+        # FTS5 只返回命中的文档，命中集合必须一致；k1 不同（1.2 对 1.5）只允许排序有细微差别
+        assert {h["doc_id"] for h in actual} == set(expected)
+        actual_scores = {h["doc_id"]: h["score"] for h in actual}
+        doc_ids = list(expected)
+        correlation = np.corrcoef(
+            _ranks([expected[d] for d in doc_ids]), _ranks([actual_scores[d] for d in doc_ids])
+        )[0, 1]
+        assert correlation > 0.98
+        top = sorted(expected, key=expected.get, reverse=True)[:10]
+        assert actual[0]["doc_id"] == top[0]
+        assert len(set(top) & {h["doc_id"] for h in actual[:10]}) >= 8
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("café", ["a.md"]), ("cafe", ["b.md"]), ("mixed", ["d.md"]), ("mixed_case", ["c.md"]),
+])
+def test_fts5_does_not_fold_diacritics_or_split_underscores(store, monkeypatch, query, expected):
+    store.add_documents_bulk([
+        make_document("a.md", "café"), make_document("b.md", "cafe"),
+        make_document("c.md", "mixed_case"), make_document("d.md", "mixed"),
+    ])
+    for engine in ("rank_bm25", "fts5"):
+        monkeypatch.setattr(config, "SEARCH_ENGINE", engine)
+        assert sorted(_positive(store.search_by_bm25(query, top_k=10))) == expected
@@ -0,0 +1,78 @@
+import pytest
+
+import config
+from src.context_packer import OMISSION_MARK, count_tokens, pack_context, trim_to_budget
+
+FRONT_MATTER = "---\ntags: [物理]\n---"
+
+
+def _note(topic, paragraphs=8):
+    sections = [f"## 第{i}节\n\n" + f"{topic}相关的论述第{i}段。" * 20 for i in range(paragraphs)]
+    return FRONT_MATTER + "\n# " + topic + "\n\n" + "\n\n".join(sections)
+
+
+@pytest.fixture(autouse=True)
+def _estimate_counter(monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_TOKEN_COUNTER", "estimate")
+
+
+def test_short_text_is_unchanged():
+    assert trim_to_budget("# 标题\n\n正文", 100) == "# 标题\n\n正文"
+
+
+@pytest.mark.parametrize("budget", [150, 300, 600])
+def test_trim_keeps_structure_and_relevant_paragraphs(budget):
+    text = _note("量子") + "\n\n## 关键\n\n" + "拓扑纠错是核心。" * 10
+    trimmed = trim_to_budget(text, budget, query="拓扑纠错")
+    assert count_tokens(trimmed) <= budget
+    assert trimmed.startswith(FRONT_MATTER)
+    for heading in ["# 量子", "## 第0节", "## 第7节", "## 关键"]:
+        assert heading in trimmed
+    assert "拓扑纠错是核心。" * 10 in trimmed
+    assert OMISSION_MARK in trimmed
+
+
+@pytest.mark.parametrize("budget", [1, 2, 5, 20, 40])
+def test_tiny_budgets_keep_some_content(budget):
+    trimmed = trim_to_budget(_note("量子"), budget, query="论述")
+    assert 0 < count_tokens(trimmed) <= budget
+    assert "---" not in trimmed and "#" not in trimmed
+    assert trimmed.strip(OMISSION_MARK) or budget == 1
+
+
+def test_zero_budget_trims_to_nothing():
+    assert trim_to_budget(_note("量子"), 0) == ""
+
+
+@pytest.mark.parametrize("budget", [50, 400, 2000, 5000])
+def test_pack_context_stays_within_budget(budget):
+    notes = [{"doc_id": f"n{i}.md", "full_text": _note(f"主题{i}")} for i in range(5)]
+    article, packed = pack_context(_note("文章"), notes, query="论述", budget=budget)
+    total = count_tokens(article) + sum(count_tokens(note["full_text"]) for note in packed)
+    assert total <= budget
+    # 放入的笔记都带有正文，而不只是前端信息和标题
+    for note in packed:
+        assert note["full_text"] and "论述" in note["full_text"]
+    assert [note["doc_id"] for note in packed] == [f"n{i}.md" for i in range(len(packed))]
+
+
+def test_higher_ranked_notes_get_budget_first():
+    notes = [{"doc_id": f"n{i}.md", "full_text": _note(f"主题{i}")} for i in range(4)]
+    _, packed = pack_context("短文章", notes, budget=1500)
+    sizes = [count_tokens(note["full_text"]) for note in packed]
+    assert len(packed) == 4
+    assert sizes == sorted(sizes, reverse=True) and sizes[0] > sizes[-1]
+
+
+def test_short_notes_pass_unused_budget_down():
+    long_note = _note("主题")
+    notes = [{"doc_id": "short.md", "full_text": "# 短\n\n一句话"}, {"doc_id": "long.md", "full_text": long_note}]
+    _, packed = pack_context("短文章", notes, budget=1000)
+    assert packed[0]["full_text"] == "# 短\n\n一句话"
+    alone = pack_context("短文章", notes[1:], budget=1000)[1][0]["full_text"]
+    assert count_tokens(packed[1]["full_text"]) == count_tokens(alone)
+
+
+def test_zero_budget_disables_packing():
+    notes = [{"doc_id": "n.md", "full_text": _note("主题")}]
+    assert pack_context("文章", notes, budget=0) == ("文章", notes)
@@ -0,0 +1,78 @@
+import pytest
+
+import config
+from src import storage
+from src.embeddings import DenseIndex, HashingEmbedder, reciprocal_rank_fusion
+from tests.conftest import make_document
+
+
+def _index(tmp_path):
+    return DenseIndex(tmp_path / "reasoning_index_embeddings", HashingEmbedder(64))
+
+
+def _ids(results):
+    return [doc_id for doc_id, _ in results]
+
+
+def test_reciprocal_rank_fusion_sums_ranks_and_keeps_first_handle():
+    bm25 = [{"doc_id": "a", "chunks": [1]}, {"doc_id": "b"}]
+    dense = [{"doc_id": "b"}, {"doc_id": "c"}, {"doc_id": "a", "chunks": [2]}]
+    fused = reciprocal_rank_fusion([bm25, dense], top_k=2, k=60)
+    assert [h["doc_id"] for h in fused] == ["b", "a"]
+    assert fused[0]["fusion_score"] == 1 / 62 + 1 / 61
+    assert fused[1]["chunks"] == [1]
+
+
+def test_snapshot_is_reused_and_caught_up(store, tmp_path):
+    store.add_documents_bulk([
+        make_document("q.md", "量子 计算 比特"), make_document("c.md", "烹饪 火候 食材"),
+    ])
+    index = _index(tmp_path)
+    index.refresh(store)
+    assert _ids(index.search_many(["量子计算"], 1)[0]) == ["q.md"]
+
+    # 新进程加载快照后只追加期间的变更
+    store.add_documents_bulk([make_document("h.md", "历史 王朝 战争")])
+    store.delete_document("c.md")
+    reloaded = _index(tmp_path)
+    reloaded.refresh(store)
+    assert reloaded.num_docs == 2
+    assert _ids(reloaded.search_many(["王朝历史"], 1)[0]) == ["h.md"]
+
+
+def test_snapshot_from_rebuilt_database_is_discarded(tmp_path):
+    old = storage.ReasoningIndexStore(tmp_path / "reasoning_index.db")
+    old.add_documents_bulk([make_document(f"old{i}.md", f"旧笔记 主题{i}") for i in range(20)])
+    _index(tmp_path).refresh(old)
+    old.close()
+
+    # 删除数据库后在同一位置重建：新库的写入代数小于快照记录的代数
+    for path in tmp_path.glob("reasoning_index.db*"):
+        path.unlink()
+    new = storage.ReasoningIndexStore(tmp_path / "reasoning_index.db")
+    new.add_documents_bulk([make_document("new.md", "量子 计算")])
+    assert new.get_generation() < 20
+
+    index = _index(tmp_path)
+    index.refresh(new)
+    assert index.num_docs == 1
+    assert _ids(index.search_many(["旧笔记 量子"], 5)[0]) == ["new.md"]
+    new.close()
+
+
+def test_default_backend_requires_a_local_model(monkeypatch):
+    from src import embeddings
+
+    assert config.EMBEDDING_BACKEND == "sentence_transformers"
+    embeddings._create_embedder.cache_clear()
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        with pytest.raises(ImportError):
+            embeddings.get_embedder()
+    else:
+        monkeypatch.setattr(config, "EMBEDDING_MODEL", "/nonexistent/model")
+        with pytest.raises(RuntimeError):
+            embeddings.get_embedder()
+    finally:
+        embeddings._create_embedder.cache_clear()
@@ -0,0 +1,28 @@
+import asyncio
+
+import config
+from src import graph
+from tests.conftest import make_document
+
+
+def _failing_keywords(text, *args, **kwargs):
+    raise RuntimeError("推测检索故障")
+
+
+def test_speculation_failure_does_not_fail_batch(store, stub_llm, monkeypatch):
+    store.add_documents_bulk([make_document("q.md", "量子 计算 比特", "# 量子\n\n正文")])
+    monkeypatch.setattr(config, "SPECULATIVE_RETRIEVAL", True)
+    monkeypatch.setattr(graph, "extract_keywords", _failing_keywords)
+
+    results = asyncio.run(graph.aprocess_articles([
+        {"text": "量子计算 量子比特"}, {"text": "量子计算的历史"}
+    ]))
+    assert [r["error"] for r in results] == [None, None]
+    assert all(r["generated_note"] for r in results)
+
+
+def test_speculation_failure_does_not_fail_single_run(store, stub_llm, monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_RETRIEVAL", True)
+    monkeypatch.setattr(graph, "extract_keywords", _failing_keywords)
+    assert graph.speculative_retrieval_node({"article_text": "量子计算"}) == {"speculative_candidates": []}
+    assert asyncio.run(graph.arun_resumable("量子计算 量子比特"))
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import config
+from src import indexer, storage
+from tests.conftest import make_document
+
+
+LONG_SECTION = "内容" * 200
+
+
+def test_keyed_locks_are_bounded_and_stable():
+    locks = indexer._KeyedLocks(stripes=8)
+    assert locks("a") is locks("a")
+    assert len({id(locks(str(i))) for i in range(1000)}) <= 8
+
+
+def test_split_into_chunks_respects_front_matter_fences_and_min_size(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_MIN_CHARS", 100)
+    monkeypatch.setattr(config, "CHUNK_HEADING_LEVELS", 2)
+    content = (
+        "---\ntitle: t\n---\n"
+        f"# 第一章\n{LONG_SECTION}\n"
+        "## 短节\n很短\n"
+        f"### 三级标题不切分\n```\n# 代码块中的注释\n```\n"
+        f"## 第二章\n{LONG_SECTION}\n"
+    )
+    chunks = indexer.split_into_chunks(content)
+    assert [c["heading"] for c in chunks] == ["第一章", "第二章"]
+    # 章节区间首尾相接并覆盖全文，前端信息归入第一个章节
+    assert chunks[0]["start_offset"] == 0
+    assert chunks[0]["end_offset"] == chunks[1]["start_offset"]
+    assert chunks[-1]["end_offset"] == len(content)
+    assert "短节" in content[chunks[0]["start_offset"]:chunks[0]["end_offset"]]
+
+
+def test_split_into_chunks_returns_empty_for_single_section():
+    assert indexer.split_into_chunks(f"# 标题\n{LONG_SECTION}") == []
+
+
+def test_identical_content_reuses_fingerprint(store, monkeypatch):
+    calls = []
+
+    def fake_invoke(llm, prompt, version, **kwargs):
+        calls.append(prompt)
+        return "指纹"
+
+    monkeypatch.setattr(indexer, "store", store)
+    monkeypatch.setattr(indexer, "cached_invoke", fake_invoke)
+    monkeypatch.setattr(indexer, "recent_fingerprints", type(indexer.recent_fingerprints)())
+
+    assert indexer.distill_fingerprint("正文", "h1") == "指纹"
+    assert indexer.distill_fingerprint("正文", "h1") == "指纹"
+    assert len(calls) == 1
+
+    # 已落盘的文档按元数据中的 content_hash 复用
+    store.add_documents_bulk([make_document("a.md", "已有指纹", metadata={"content_hash": "h2"})])
+    assert indexer.distill_fingerprint("其他", "h2") == "已有指纹"
+    assert len(calls) == 1
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.005)
+
+
+def test_debounced_queue_coalesces_rapid_events():
+    calls = []
+    queue = indexer.DebouncedChangeQueue(calls.append, debounce_seconds=0.1, workers=2)
+    try:
+        for _ in range(20):
+            queue.put(Path("a.md"))
+            queue.put(Path("b.md"))
+        assert len(queue) == 2
+        assert calls == []
+        _wait_until(lambda: len(calls) == 2)
+        time.sleep(0.2)
+        assert sorted(calls) == [Path("a.md"), Path("b.md")]
+    finally:
+        queue.close()
+
+
+def test_debounced_queue_never_processes_a_path_concurrently():
+    started = threading.Event()
+    release = threading.Event()
+    active = []
+    overlaps = []
+    calls = []
+    lock = threading.Lock()
+
+    def handler(path):
+        with lock:
+            overlaps.append(path in active)
+            active.append(path)
+        calls.append(path)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        with lock:
+            active.remove(path)
+
+    queue = indexer.DebouncedChangeQueue(handler, debounce_seconds=0.01, workers=4)
+    try:
+        queue.put(Path("a.md"))
+        assert started.wait(5)
+        # 处理期间到达的事件要等当前处理结束后才执行
+        queue.put(Path("a.md"))
+        time.sleep(0.1)
+        assert calls == [Path("a.md")]
+        release.set()
+        _wait_until(lambda: len(calls) == 2)
+        assert overlaps == [False, False]
+    finally:
+        release.set()
+        queue.close()
+
+
+def test_debounced_queue_close_flushes_pending_events():
+    calls = []
+    queue = indexer.DebouncedChangeQueue(calls.append, debounce_seconds=3600)
+    queue.put(Path("a.md"))
+    queue.close()
+    assert calls == [Path("a.md")]
+
+
+def test_initial_build_checks_each_file_once(store, tmp_path, monkeypatch):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    for name in ("a", "b", "c"):
+        (vault / f"{name}.md").write_text(f"# {name}\n\n正文 {name}", encoding="utf-8")
+
+    buffer = storage.WriteBehindBuffer(store, max_delay=3600)
+    monkeypatch.setattr(config, "VAULT_PATH", str(vault))
+    monkeypatch.setattr(indexer, "store", store)
+    monkeypatch.setattr(indexer, "write_buffer", buffer)
+    monkeypatch.setattr(indexer, "cached_invoke", lambda llm, prompt, version, **kwargs: "指纹")
+    monkeypatch.setattr(indexer, "recent_fingerprints", type(indexer.recent_fingerprints)())
+
+    checks, hashes = [], []
+    needs_processing, get_file_hash = indexer.needs_processing, indexer.get_file_hash
+    monkeypatch.setattr(indexer, "needs_processing", lambda path: checks.append(path) or needs_processing(path))
+    monkeypatch.setattr(indexer, "get_file_hash", lambda path: hashes.append(path) or get_file_hash(path))
+
+    try:
+        indexer.build_initial_index(concurrency=2)
+        assert len(checks) == 3 and len(store.get_all_documents()) == 3
+
+        # 修改一个文件后重建：扫描阶段检查每个文件一次，处理阶段不再重复检查和哈希
+        checks.clear()
+        changed = vault / "b.md"
+        changed.write_text("# b\n\n新的正文", encoding="utf-8")
+        stat = changed.stat()
+        os.utime(changed, (stat.st_atime, stat.st_mtime + 10))
+        indexer.build_initial_index(concurrency=1)
+        assert sorted(p.name for p in checks) == ["a.md", "b.md", "c.md"]
+        assert [p.name for p in hashes] == ["b.md"]
+        assert store.get_document("b.md")["full_text"] == "# b\n\n新的正文"
+    finally:
+        buffer.close()
@@ -0,0 +1,139 @@
+import asyncio
+import sqlite3
+
+import config
+from src import graph, jobs
+
+
+def _status(store, job_id):
+    return store.get_job(job_id)["status"]
+
+
+def test_claim_checkpoint_and_finish(store):
+    store.create_job("j1", {"text": "a"})
+    job = store.claim_next_job("w1")
+    assert job["job_id"] == "j1" and job["status"] == "running" and job["attempts"] == 1
+    assert store.claim_next_job("w2") is None
+
+    assert store.checkpoint_job("j1", "w1", "distill_fingerprint", {"query_fingerprint": "q"})
+    # 其他进程不能更新不属于它的任务
+    assert not store.checkpoint_job("j1", "w2", "filter_candidates", {})
+    assert store.finish_job("j1", "w1", "succeeded", result=["note"])
+    job = store.get_job("j1")
+    assert job["status"] == "succeeded" and job["result"] == ["note"]
+    assert job["last_node"] == "distill_fingerprint"
+
+
+def test_stale_lease_is_requeued(store):
+    store.create_job("j1", {"text": "a"})
+    store.claim_next_job("w1")
+    assert store.requeue_stale_jobs(lease_seconds=3600) == (0, 0)
+    assert store.requeue_stale_jobs(lease_seconds=-1) == (1, 0)
+    assert _status(store, "j1") == "queued"
+    # 原进程的租约已失效，不能再结束任务
+    assert not store.finish_job("j1", "w1", "succeeded")
+    assert store.claim_next_job("w2")["attempts"] == 2
+
+
+def test_stale_job_at_max_attempts_fails(store):
+    store.create_job("j1", {"text": "a"})
+    for attempt in range(3):
+        assert store.claim_next_job(f"w{attempt}")["attempts"] == attempt + 1
+        expected = (1, 0) if attempt < 2 else (0, 1)
+        assert store.requeue_stale_jobs(lease_seconds=-1, max_attempts=3) == expected
+    job = store.get_job("j1")
+    assert job["status"] == "failed" and job["error"]
+    assert store.claim_next_job("w9") is None
+
+
+def test_worker_runs_job_to_completion(store, stub_llm):
+    async def run():
+        pool = jobs.JobWorkerPool(num_workers=1)
+        pool.start(store)
+        job_id = await pool.submit({"text": "量子计算 量子比特", "source_url": ""})
+        for _ in range(200):
+            if _status(store, job_id) == "succeeded":
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+        return job_id
+
+    job_id = asyncio.run(run())
+    job = store.get_job(job_id)
+    assert job["status"] == "succeeded"
+    assert job["last_node"] == "synthesize_note"
+    assert job["result"]
+
+
+def test_stop_requeues_running_jobs(store, monkeypatch):
+    async def hanging_pipeline(*args, **kwargs):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(jobs, "arun_resumable", hanging_pipeline)
+    monkeypatch.setattr(config, "JOB_HEARTBEAT_SECONDS", 3600)
+
+    async def run():
+        pool = jobs.JobWorkerPool(num_workers=1)
+        pool.start(store)
+        job_id = await pool.submit({"text": "a"})
+        for _ in range(200):
+            if _status(store, job_id) == "running":
+                break
+            await asyncio.sleep(0.01)
+        assert _status(store, job_id) == "running"
+        await pool.stop()
+        return job_id
+
+    job_id = asyncio.run(run())
+    assert _status(store, job_id) == "queued"
+
+
+def test_resume_skips_completed_nodes(store, stub_llm, monkeypatch):
+    calls = []
+    original = graph.adistill_fingerprint_node
+
+    async def tracked(state):
+        calls.append(state)
+        return await original(state)
+
+    monkeypatch.setattr(graph, "adistill_fingerprint_node", tracked)
+    result = asyncio.run(graph.arun_resumable(
+        "量子计算", last_node="fetch_context",
+        checkpoint_state={"query_fingerprint": "量子", "context_notes": []}
+    ))
+    assert result and not calls
+
+
+def test_workers_survive_transient_database_errors(store, stub_llm, monkeypatch):
+    monkeypatch.setattr(config, "JOB_POLL_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(config, "JOB_HEARTBEAT_SECONDS", 0.01)
+    failures = {"claim_next_job": 2, "requeue_stale_jobs": 2}
+
+    def flaky(name):
+        original = getattr(store, name)
+
+        def wrapper(*args, **kwargs):
+            if failures[name]:
+                failures[name] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return original(*args, **kwargs)
+        return wrapper
+
+    for name in failures:
+        monkeypatch.setattr(store, name, flaky(name))
+
+    async def run():
+        pool = jobs.JobWorkerPool(num_workers=1)
+        pool.start(store)
+        job_id = await pool.submit({"text": "量子计算 量子比特", "source_url": ""})
+        for _ in range(300):
+            if _status(store, job_id) == "succeeded":
+                break
+            await asyncio.sleep(0.02)
+        heartbeat_alive = not pool._tasks[-1].done()
+        await pool.stop()
+        return job_id, heartbeat_alive
+
+    job_id, heartbeat_alive = asyncio.run(run())
+    assert _status(store, job_id) == "succeeded"
+    assert heartbeat_alive and failures == {"claim_next_job": 0, "requeue_stale_jobs": 0}
@@ -0,0 +1,11 @@
+from src import llm
+
+
+def test_deepseek_client_requests_usage_when_streaming(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test")
+    llm.set_llm_factory(None)
+    try:
+        client = llm.get_llm("synthesis")
+        assert client._should_stream_usage()
+    finally:
+        llm.set_llm_factory(None)
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import config
+from src import graph, llm_cache
+from src.llm_cache import LLMResponseCache, acached_invoke, cached_invoke
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = None
+
+
+class ScriptedLLM:
+    """按顺序返回预设响应的LLM，并记录调用次数。"""
+
+    model_name = "scripted"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return Response(self.responses.pop(0))
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = LLMResponseCache(tmp_path / "llm_cache.db", ttl_seconds=0, max_entries=3)
+    monkeypatch.setattr(config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", instance)
+    yield instance
+    instance.close()
+
+
+def test_eviction_keeps_most_recently_used(cache, monkeypatch):
+    monkeypatch.setattr(LLMResponseCache, "EVICTION_INTERVAL", 1)
+    for i in range(3):
+        cache.put(f"k{i}", "m", "v1", f"r{i}")
+    assert cache.get("k0") == "r0"
+    cache.put("k3", "m", "v1", "r3")
+    assert cache.get("k1") is None
+    assert [cache.get(k) for k in ("k0", "k2", "k3")] == ["r0", "r2", "r3"]
+
+
+def test_eviction_runs_periodically_not_per_write(cache):
+    for i in range(5):
+        cache.put(f"k{i}", "m", "v1", f"r{i}")
+    assert cache.stats()["entries"] == 5
+    for i in range(5, LLMResponseCache.EVICTION_INTERVAL):
+        cache.put(f"k{i}", "m", "v1", f"r{i}")
+    assert cache.stats()["entries"] == 3
+
+
+def test_responses_are_reused(cache):
+    llm = ScriptedLLM("a")
+    assert cached_invoke(llm, "prompt", "v1") == "a"
+    assert cached_invoke(llm, "prompt", "v1") == "a"
+    assert asyncio.run(acached_invoke(llm, "prompt", "v1")) == "a"
+    assert llm.calls == 1
+    # 模板版本不同视为不同的键
+    llm.responses.append("b")
+    assert cached_invoke(llm, "prompt", "v2") == "b"
+
+
+def test_unparseable_responses_are_not_cached(cache):
+    validate = graph._valid_synthesis_response
+    llm = ScriptedLLM("not json", '{"knowledge_points": []}')
+    assert cached_invoke(llm, "prompt", "v1", validate=validate) == "not json"
+    assert cached_invoke(llm, "prompt", "v1", validate=validate) == '{"knowledge_points": []}'
+    assert cached_invoke(llm, "prompt", "v1", validate=validate) == '{"knowledge_points": []}'
+    assert llm.calls == 2
+
+
+def test_previously_cached_broken_response_is_ignored(cache):
+    llm = ScriptedLLM("broken", '{"results": [{"id": "a.md", "reason": "r"}]}')
+    cached_invoke(llm, "prompt", "v1")
+    text = asyncio.run(acached_invoke(llm, "prompt", "v1", validate=graph._valid_rerank_response))
+    assert graph._load_rerank_results(text) == [("a.md", "r")]
+    assert llm.calls == 2
+
+
+def test_response_validators():
+    assert graph._valid_synthesis_response('```json\n{"knowledge_points": [{"title": "T"}]}\n```')
+    assert not graph._valid_synthesis_response('{"knowledge_points": "x"}')
+    assert not graph._valid_rerank_response('{"results": [{"reason": "no id"}]}')
+    assert not graph._valid_rerank_response('[1, 2]')
@@ -0,0 +1,37 @@
+import re
+
+from src import metrics
+
+
+def _families(text):
+    """按 Prometheus 文本格式 0.0.4 解析出 {名称: 类型} 和全部样本名。"""
+    types = dict(re.findall(r"^# TYPE (\S+) (\S+)$", text, re.M))
+    helps = set(re.findall(r"^# HELP (\S+) ", text, re.M))
+    samples = [line.split("{")[0].split(" ")[0] for line in text.splitlines() if line and not line.startswith("#")]
+    return types, helps, samples
+
+
+def test_sample_names_match_their_metadata():
+    counter = metrics.Counter("test_metrics_requests", "测试计数器", ["kind"])
+    histogram = metrics.Histogram("test_metrics_duration_seconds", "测试直方图", buckets=(1,))
+    gauge = metrics.Gauge("test_metrics_depth", "测试仪表")
+    counter.inc(kind="a")
+    histogram.observe(0.5)
+    gauge.set(3)
+
+    types, helps, samples = _families(metrics.render())
+    assert types["test_metrics_requests_total"] == "counter"
+    assert "test_metrics_requests" not in types
+    assert types["test_metrics_duration_seconds"] == "histogram"
+    assert types["test_metrics_depth"] == "gauge"
+    assert set(types) == helps
+    # 每个样本都属于某个已声明的指标族
+    suffixes = {"counter": ("",), "gauge": ("",), "histogram": ("_bucket", "_sum", "_count")}
+    declared = {name + suffix for name, kind in types.items() for suffix in suffixes[kind]}
+    assert set(samples) <= declared
+    assert 'test_metrics_requests_total{kind="a"} 1.0' in metrics.render()
+
+
+def test_search_latency_is_labelled_by_engine():
+    assert metrics.SEARCH_LATENCY.name == "alchemist_search_duration_seconds"
+    assert "engine" in metrics.SEARCH_LATENCY.labelnames
@@ -0,0 +1,64 @@
+import pytest
+
+import config
+from src import graph
+from src.embeddings import reciprocal_rank_fusion
+
+
+def _candidates(scores):
+    return [{"doc_id": f"d{i}", "score": score, "fingerprint_text": "f"} for i, score in enumerate(scores)]
+
+
+def _fused(*rankings):
+    return reciprocal_rank_fusion([[{"doc_id": d} for d in ranking] for ranking in rankings], top_k=10)
+
+
+@pytest.fixture(autouse=True)
+def adaptive(monkeypatch):
+    monkeypatch.setattr(config, "ADAPTIVE_RERANK", True)
+    monkeypatch.setattr(config, "FINAL_TOP_K", 5)
+    monkeypatch.setattr(config, "RERANK_SKIP_MAX_CANDIDATES", 5)
+    monkeypatch.setattr(config, "RERANK_SCORE_GAP", 0.3)
+    monkeypatch.setattr(config, "RERANK_FUSED_SCORE_GAP", 0.2)
+
+
+@pytest.mark.parametrize("scores, head", [
+    ([10, 9, 8], 3),
+    ([10, 9, 8, 7, 6, 1, 1, 1, 1, 1], 5),
+    ([10, 4, 3.9, 3.8, 3.7, 3.6, 3.5, 3.4, 3.3, 3.2], 1),
+    ([10, 9.5, 9, 8.5, 8, 7.5, 7, 6.5, 6, 5.5], 0),
+])
+def test_confident_head_for_bm25_scores(scores, head):
+    assert graph._confident_head(_candidates(scores)) == head
+
+
+def test_confident_head_disabled(monkeypatch):
+    monkeypatch.setattr(config, "ADAPTIVE_RERANK", False)
+    assert graph._confident_head(_candidates([10, 1, 1, 1, 1, 1, 1])) == 0
+
+
+def test_fused_gap_marks_where_lists_stop_agreeing(monkeypatch):
+    # BM25阈值调高也不影响融合候选
+    monkeypatch.setattr(config, "RERANK_SCORE_GAP", 0.9)
+    a = [f"a{i}" for i in range(10)]
+    b = [f"b{i}" for i in range(10)]
+    # 两路在前两名上一致
+    assert graph._confident_head(_fused(a, a[:2] + b[:8])) == 2
+    # 两路的前五名相同（顺序不同）
+    both = _fused(a, [a[4], a[3], a[2], a[1], a[0]] + b[:5])
+    assert graph._confident_head(both) == 5
+    assert graph._route_rerank({"candidates": both}) == "skip_rerank"
+    # 没有交集或完全一致时没有分界，走完整重排序
+    assert graph._confident_head(_fused(a, b)) == 0
+    assert graph._confident_head(_fused(a, a)) == 0
+
+
+def test_shrunk_rerank_keeps_confident_head():
+    state = {"query_fingerprint": "q", "candidates": _candidates([10, 4, 3.9, 3.8, 3.7, 3.6, 3.5, 3.4, 3.3, 3.2])}
+    prompt = graph._build_rerank_prompt(state)
+    assert "d0" not in prompt and "排名前4位" in prompt
+    ranked = graph._parse_rerank_response(
+        state, '{"results": [{"id": "d3", "reason": "r"}, {"id": "d0", "reason": "dup"}, {"id": "d5", "reason": "r"}]}'
+    )["ranked_candidates"]
+    assert [c["doc_id"] for c in ranked] == ["d0", "d3", "d5"]
+    assert ranked[0]["reason"] == graph.CONFIDENT_REASON
@@ -0,0 +1,315 @@
+import json
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+import config
+from src import body_store, storage
+from tests.conftest import make_document
+
+BASELINE_DB = Path(config.ROOT_DIR) / "data" / "reasoning_index.db"
+SCHEMA_VERSION = 10
+
+
+def _create_baseline(path: Path, rows):
+    """迁移前的原始表结构：正文与指纹同在 reasoning_index 中，user_version 为 0。"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE reasoning_index (
+            doc_id TEXT PRIMARY KEY,
+            metadata TEXT,
+            fingerprint_text TEXT,
+            full_text TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO reasoning_index VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def _tables(store):
+    with store._read() as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+@pytest.mark.parametrize("engine", ["rank_bm25", "fts5", "resident"])
+def test_migration_chain_from_baseline(tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", engine)
+    rows = [
+        ("q.md", '{"content_hash": "h1"}', "量子 计算 比特", "# 量子\n\n正文一"),
+        ("c.md", '{"content_hash": "h2"}', "烹饪 火候", "# 烹饪\n\n正文二"),
+        ("copy.md", '{"content_hash": "h1"}', "量子 计算 比特", "# 量子\n\n正文一"),
+    ]
+    # rank_bm25 的 IDF 在词项出现于半数以上文档时为负，补几篇无关笔记
+    rows += [(f"n{i}.md", "{}", f"杂项 记录 {i}", f"杂项 {i}") for i in range(5)]
+    _create_baseline(tmp_path / "old.db", rows)
+    store = storage.ReasoningIndexStore(tmp_path / "old.db")
+
+    with store._read() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(reasoning_index)")}
+        # 内容相同的两篇笔记共用一份正文
+        assert conn.execute("SELECT COUNT(*) FROM reasoning_blobs").fetchone()[0] == len(rows) - 1
+    assert {"tokens", "body_hash"} <= columns and "full_text" not in columns
+    assert "reasoning_body" not in _tables(store)
+    assert {"jobs", "reasoning_chunks", "index_changes"} <= _tables(store)
+
+    assert store.get_bodies([row[0] for row in rows]) == {doc_id: text for doc_id, _, _, text in rows}
+    assert store.search_by_bm25("量子 计算", top_k=1)[0]["doc_id"] in ("q.md", "copy.md")
+    assert store.find_fingerprint_by_content_hash("h2") == "烹饪 火候"
+    store.close()
+
+    # 再次打开不会重复迁移
+    reopened = storage.ReasoningIndexStore(tmp_path / "old.db")
+    assert reopened.get_document("c.md")["full_text"] == "# 烹饪\n\n正文二"
+    reopened.close()
+
+
+@pytest.mark.skipif(not BASELINE_DB.exists(), reason="仓库中没有示例数据库")
+def test_migrating_a_copy_of_the_bundled_database(tmp_path):
+    path = tmp_path / "copy.db"
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    before = dict(conn.execute(
+        "SELECT doc_id, full_text FROM reasoning_index" if conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        else "SELECT doc_id, full_text FROM reasoning_body"
+    ))
+    conn.close()
+
+    store = storage.ReasoningIndexStore(path)
+    assert store.get_bodies(list(before)) == {k: v for k, v in before.items() if v is not None}
+    store.close()
+
+
+def test_blobs_are_shared_and_collected(store):
+    def blob_count():
+        with store._read() as conn:
+            return conn.execute("SELECT COUNT(*) FROM reasoning_blobs").fetchone()[0]
+
+    long_text = "正文内容 " * 200
+    store.add_documents_bulk([
+        make_document("a.md", "x", long_text),
+        make_document("b.md", "y", long_text),
+        make_document("c.md", "z", "短"),
+    ])
+    assert blob_count() == 2
+
+    # 同一批中交换正文：触发器删除的旧正文会在本批写入时补回
+    store.add_documents_bulk([
+        make_document("a.md", "x", "新"),
+        make_document("b.md", "y", "短"),
+        make_document("c.md", "z", long_text),
+    ])
+    assert store.get_bodies(["a.md", "b.md", "c.md"]) == {"a.md": "新", "b.md": "短", "c.md": long_text}
+    assert blob_count() == 3
+
+    store.rename_document("c.md", "d.md")
+    assert store.get_document("d.md")["full_text"] == long_text
+    store.delete_documents_bulk(["a.md", "b.md", "d.md"])
+    assert blob_count() == 0
+
+
+@pytest.mark.parametrize("codec", ["zstd", "zlib", "none"])
+def test_body_codecs_round_trip(codec):
+    text = "中文正文 with ascii " * 50
+    used, data = body_store.compress(text, codec)
+    assert body_store.decompress(used, data) == text
+    if codec != "none":
+        assert used in ("zstd", "zlib") and len(data) < len(text.encode("utf-8"))
+
+
+def test_incompressible_body_is_stored_raw():
+    assert body_store.compress("ab", "zlib") == ("none", b"ab")
+
+
+def test_body_cache_evicts_least_recently_used():
+    cache = body_store.BodyCache(max_entries=2)
+    cache.put_many({"a": "A", "b": "B"})
+    assert cache.get_many(["a"]) == {"a": "A"}
+    cache.put_many({"c": "C"})
+    assert cache.get_many(["a", "b", "c"]) == {"a": "A", "c": "C"}
+
+
+def test_write_behind_buffer_coalesces_operations(store):
+    store.add_documents_bulk([make_document("old.md", "旧")])
+    buffer = storage.WriteBehindBuffer(store, max_items=100, max_delay=3600)
+    buffer.add(make_document("a.md", "第一版"))
+    buffer.add(make_document("a.md", "第二版"))
+    buffer.add(make_document("b.md", "临时"))
+    buffer.delete("b.md")
+    buffer.delete("old.md")
+    assert len(buffer) == 3
+    assert store.get_document("old.md") is not None
+
+    buffer.close()
+    assert len(buffer) == 0
+    assert store.get_document("a.md")["fingerprint_text"] == "第二版"
+    assert store.get_document("b.md") is None
+    assert store.get_document("old.md") is None
+
+
+def test_write_behind_buffer_flushes_when_full_or_stale(store):
+    buffer = storage.WriteBehindBuffer(store, max_items=2, max_delay=3600)
+    buffer.add(make_document("a.md", "一"))
+    assert store.get_document("a.md") is None
+    buffer.add(make_document("b.md", "二"))
+    assert len(buffer) == 0 and store.get_document("b.md") is not None
+    buffer.close()
+
+    buffer = storage.WriteBehindBuffer(store, max_items=100, max_delay=0.01)
+    buffer.add(make_document("c.md", "三"))
+    for _ in range(200):
+        if store.get_document("c.md") is not None:
+            break
+        time.sleep(0.01)
+    assert store.get_document("c.md") is not None
+    buffer.close()
+
+
+def test_write_behind_buffer_retries_failed_writes(store, monkeypatch):
+    buffer = storage.WriteBehindBuffer(store, max_items=100, max_delay=3600)
+    original = store.add_documents_bulk
+
+    def failing(documents):
+        # 写入失败期间到达的新操作应覆盖放回缓冲的旧操作
+        buffer.add(make_document("a.md", "更新后"))
+        raise sqlite3.OperationalError("database is locked")
+
+    buffer.add(make_document("a.md", "失败的写入"))
+    buffer.add(make_document("b.md", "二"))
+    monkeypatch.setattr(store, "add_documents_bulk", failing)
+    buffer.flush()
+    assert len(buffer) == 2
+
+    monkeypatch.setattr(store, "add_documents_bulk", original)
+    buffer.close()
+    assert store.get_document("a.md")["fingerprint_text"] == "更新后"
+    assert store.get_document("b.md") is not None
+
+
+def _fts_doc_ids(store, term):
+    with store._read() as conn:
+        return sorted(row[0] for row in conn.execute(
+            """
+            SELECT r.doc_id FROM reasoning_index_fts
+            JOIN reasoning_index AS r ON r.rowid = reasoning_index_fts.rowid
+            WHERE reasoning_index_fts MATCH ?
+            """,
+            (f'"{term}"',)
+        ))
+
+
+def _chunk_doc_ids(store):
+    with store._read() as conn:
+        return sorted({row[0] for row in conn.execute("SELECT doc_id FROM reasoning_chunks")})
+
+
+def _chunked_document(doc_id, fingerprint):
+    chunk = {"heading": "一", "start_offset": 0, "end_offset": 5, "content_hash": None, "fingerprint_text": fingerprint}
+    return make_document(doc_id, fingerprint, chunks=[chunk, dict(chunk, heading="二")])
+
+
+def test_rename_prefix_moves_directory(store, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", "resident")
+    store.add_documents_bulk([
+        dict(_chunked_document("notes/a.md", "量子 计算"), metadata={"file_name": "a.md", "file_path": "/v/notes/a.md"}),
+        _chunked_document("notes/sub/b.md", "量子 比特"),
+        _chunked_document("notes2/c.md", "量子 纠缠"),
+    ])
+    # 先构建常驻索引，确认改名后能增量看到新ID
+    assert {h["doc_id"] for h in store.search_by_bm25("量子", top_k=10)} == {"notes/a.md", "notes/sub/b.md", "notes2/c.md"}
+
+    assert store.rename_prefix("notes/", "archive/notes/") == 2
+    moved = store.get_document("archive/notes/a.md")
+    assert moved["fingerprint_text"] == "量子 计算"
+    assert json.loads(moved["metadata"]) == {"file_name": "a.md", "file_path": "/v/archive/notes/a.md"}
+    assert store.get_document("notes/a.md") is None
+    # 相同前缀的兄弟目录不受影响
+    assert store.get_document("notes2/c.md") is not None
+
+    expected = ["archive/notes/a.md", "archive/notes/sub/b.md", "notes2/c.md"]
+    assert _chunk_doc_ids(store) == expected
+    assert _fts_doc_ids(store, "量子") == expected
+    assert sorted(h["doc_id"] for h in store.search_by_bm25("量子", top_k=10)) == expected
+
+    assert store.delete_prefix("archive/") == 2
+    assert _chunk_doc_ids(store) == _fts_doc_ids(store, "量子") == ["notes2/c.md"]
+    assert [h["doc_id"] for h in store.search_by_bm25("量子", top_k=10)] == ["notes2/c.md"]
+
+
+def test_rename_onto_existing_document_overwrites_it(store, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", "resident")
+    store.add_documents_bulk([_chunked_document("a.md", "量子 计算"), _chunked_document("b.md", "烹饪 火候")])
+    store.search_by_bm25("量子", top_k=10)
+
+    assert store.rename_document("a.md", "b.md")
+    assert not store.rename_document("missing.md", "c.md")
+    assert [doc["doc_id"] for doc in store.get_all_documents()] == ["b.md"]
+    assert store.get_document("b.md")["fingerprint_text"] == "量子 计算"
+    assert _chunk_doc_ids(store) == _fts_doc_ids(store, "量子") == ["b.md"]
+    assert _fts_doc_ids(store, "烹饪") == []
+    assert [h["doc_id"] for h in store.search_by_bm25("量子", top_k=10)] == ["b.md"]
+    assert store.search_by_bm25("烹饪", top_k=10)[0]["score"] == 0
+
+
+def test_rename_prefix_onto_existing_directory(store):
+    store.add_documents_bulk([make_document("a/x.md", "新"), make_document("b/x.md", "旧"), make_document("b/y.md", "留")])
+    assert store.rename_prefix("a/", "b/") == 1
+    assert {doc["doc_id"]: doc["fingerprint_text"] for doc in store.get_all_documents()} == {"b/x.md": "新", "b/y.md": "留"}
+
+
+@pytest.mark.parametrize("prefix", ["", "/", os.sep])
+def test_prefix_operations_reject_vault_wide_prefixes(store, prefix):
+    store.add_documents_bulk([make_document("a.md", "量子")])
+    with pytest.raises(ValueError):
+        store.delete_prefix(prefix)
+    with pytest.raises(ValueError):
+        store.rename_prefix(prefix, "x/")
+    assert store.get_document("a.md") is not None
+
+
+def test_chunk_search_finds_section_deep_in_long_note(store, monkeypatch):
+    from src import graph, indexer
+
+    monkeypatch.setattr(config, "CHUNKED_INDEXING", True)
+    monkeypatch.setattr(config, "CHUNK_MIN_CHARS", 50)
+    topics = ["烹饪 火候", "历史 战争", "音乐 和声", "编程 并发", "数学 证明", "天文 星系", "化学 反应", "地理 气候"]
+    deep = len(topics) - 2
+    sections = [f"## 第{i}节\n" + f"第{i}节的正文。" * 20 + "\n" for i in range(len(topics))]
+    sections[deep] = "## 表面码\n" + "拓扑纠错依赖表面码。" * 20 + "\n"
+    long_text = "# 长笔记\n" + "".join(sections)
+    chunks = indexer.split_into_chunks(long_text)
+    assert len(chunks) == len(topics)
+    for chunk, topic in zip(chunks, topics):
+        chunk["fingerprint_text"] = topic
+    chunks[deep]["fingerprint_text"] = "拓扑 纠错 表面码"
+
+    store.add_documents_bulk([
+        make_document("long.md", "\n".join(c["fingerprint_text"] for c in chunks), long_text, chunks=chunks),
+        make_document("short.md", "拓扑 几何 流形 同伦 同调", "# 短笔记\n\n拓扑学简介"),
+    ] + [make_document(f"other{i}.md", topic) for i, topic in enumerate(topics)])
+
+    results = store.search_by_bm25("拓扑 纠错", top_k=3)
+    assert [h["doc_id"] for h in results[:2]] == ["long.md", "short.md"]
+    assert results[0]["score"] > results[1]["score"]
+    assert results[0]["chunks"][0]["ordinal"] == deep and results[0]["chunks"][0]["heading"] == "表面码"
+
+    context = graph._matched_sections(long_text, results[0])
+    assert context == "……\n\n" + sections[deep].strip() + "\n\n……"
+    # 没有章节记录的短笔记按全文返回
+    assert graph._matched_sections("# 短笔记\n\n拓扑学简介", results[1]) == "# 短笔记\n\n拓扑学简介"
+
+
+def test_zstd_bodies_fail_loudly_without_the_codec(monkeypatch):
+    pytest.importorskip("zstandard")
+    codec, data = body_store.compress("正文内容 " * 50, "zstd")
+    assert codec == "zstd"
+    monkeypatch.setattr(body_store, "_zstandard", lambda: None)
+    with pytest.raises(ImportError):
+        body_store.decompress(codec, data)
+    # 写入时退回所有进程都能读取的 zlib
+    assert body_store.resolve_codec("zstd") == "zlib"
@@ -0,0 +1,55 @@
+import json
+import random
+
+import pytest
+
+from src.stream_parser import KnowledgePointStreamParser
+
+POINTS = [
+    {"title": "大括号 {不是对象} 与 [数组]", "content": "引号 \"嵌套\" 与反斜杠 \\ 结尾\\", "sources": ["a.md"]},
+    {"title": "嵌套", "content": {"inner": {"deep": [1, 2, {"x": "}"}]}}, "sources": []},
+    {"title": "转义", "content": "\\\"}{\n换行\t制表 é", "sources": ["b.md", "c.md"]},
+]
+RESPONSE = "```json\n" + json.dumps({"knowledge_points": POINTS}, ensure_ascii=False, indent=2) + "\n```"
+
+
+def _feed_all(chunks):
+    parser = KnowledgePointStreamParser()
+    points = []
+    for chunk in chunks:
+        points.extend(parser.feed(chunk))
+    return parser, points
+
+
+def test_single_chunk():
+    parser, points = _feed_all([RESPONSE])
+    assert points == POINTS
+    assert parser.count == len(POINTS)
+
+
+@pytest.mark.parametrize("cut", range(0, len(RESPONSE), 7))
+def test_two_chunk_splits(cut):
+    _, points = _feed_all([RESPONSE[:cut], RESPONSE[cut:]])
+    assert points == POINTS
+
+
+def test_char_by_char_and_random_chunks():
+    assert _feed_all(RESPONSE)[1] == POINTS
+    rng = random.Random(0)
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(1, len(RESPONSE)), rng.randint(1, 20)))
+        chunks = [RESPONSE[i:j] for i, j in zip([0] + cuts, cuts + [len(RESPONSE)])]
+        assert _feed_all(chunks)[1] == POINTS
+
+
+def test_points_are_emitted_as_soon_as_complete():
+    parser = KnowledgePointStreamParser()
+    first_end = RESPONSE.index('"sources": [\n        "a.md"\n      ]\n    }') + len('"sources": [\n        "a.md"\n      ]\n    }')
+    assert parser.feed(RESPONSE[:first_end - 1]) == []
+    assert parser.feed(RESPONSE[first_end - 1:first_end]) == [POINTS[0]]
+
+
+def test_ignores_text_after_the_array_and_malformed_objects():
+    parser, points = _feed_all(['{"knowledge_points": [{"title": 1,}, {"title": 2}]', ', "extra": [{"title": 3}]}'])
+    assert points == [{"title": 2}]
+    assert parser.count == 1
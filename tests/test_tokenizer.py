@@ -0,0 +1,85 @@
+import pytest
+
+import config
+from src import storage
+from src.tokenizer import CharNgramTokenizer, get_tokenizer
+from tests.conftest import make_document
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("量子计算", ["量子", "子计", "计算"]),
+    ("量", ["量"]),
+    ("量子计算Quantum_Error 纠错3次", ["量子", "子计", "计算", "quantum_error", "纠错", "3", "次"]),
+    ("Café，表面码。", ["café", "表面", "面码"]),
+    ("ひらがな 한국어", ["ひら", "らが", "がな", "한국", "국어"]),
+    ("", []),
+    (None, []),
+])
+def test_ngram_tokenizer(text, tokens):
+    assert get_tokenizer("ngram").tokenize(text) == tokens
+
+
+def test_ngram_size_is_configurable():
+    tokenizer = get_tokenizer("ngram3")
+    assert isinstance(tokenizer, CharNgramTokenizer) and tokenizer.name == "ngram3"
+    assert tokenizer.tokenize("量子计算机 AB") == ["量子计", "子计算", "计算机", "ab"]
+
+
+def test_whitespace_tokenizer_keeps_legacy_behaviour():
+    assert get_tokenizer("whitespace").tokenize(" 量子计算， Hello  world\n") == ["量子计算，", "Hello", "world"]
+
+
+def test_jieba_tokenizer_drops_punctuation():
+    pytest.importorskip("jieba")
+    tokens = get_tokenizer("jieba").tokenize("量子计算的纠错，Hello World！")
+    assert "量子" in tokens or "量子计算" in tokens
+    assert "hello" in tokens and "world" in tokens
+    assert all(token.strip("，！") == token for token in tokens)
+
+
+def test_unknown_tokenizer_is_rejected():
+    with pytest.raises(ValueError):
+        get_tokenizer("nonexistent")
+
+
+def test_tokens_never_contain_whitespace():
+    text = "量子 计算\tmixed_case\nCafé  한국어"
+    for name in ("ngram", "ngram3", "whitespace"):
+        assert all(token and not any(ch.isspace() for ch in token) for token in get_tokenizer(name).tokenize(text))
+
+
+def test_changing_tokenizer_retokenizes_on_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_ENGINE", "fts5")
+    monkeypatch.setattr(config, "TOKENIZER", "whitespace")
+    path = tmp_path / "index.db"
+    chunk = {"heading": "一", "start_offset": 0, "end_offset": 4, "fingerprint_text": "量子计算 纠错"}
+    store = storage.ReasoningIndexStore(path)
+    store.add_documents_bulk([
+        make_document("q.md", "量子计算 纠错", chunks=[chunk, dict(chunk, fingerprint_text="表面码")]),
+    ] + [make_document(f"n{i}.md", f"其他 {i}") for i in range(5)])
+    # 空格分词时子串无法命中
+    assert store.search_by_bm25("计算", top_k=1) == []
+    store.close()
+
+    monkeypatch.setattr(config, "TOKENIZER", "ngram")
+    store = storage.ReasoningIndexStore(path)
+    with store._read() as conn:
+        assert conn.execute("SELECT value FROM index_meta WHERE key = 'tokenizer'").fetchone()[0] == "ngram2"
+        assert conn.execute("SELECT tokens FROM reasoning_index WHERE doc_id = 'q.md'").fetchone()[0] == "量子 子计 计算 纠错"
+        assert [row[0] for row in conn.execute("SELECT tokens FROM reasoning_chunks ORDER BY ordinal")] == [
+            "量子 子计 计算 纠错", "表面 面码"
+        ]
+    # FTS5 和常驻索引都看到新的词元
+    assert [h["doc_id"] for h in store.search_by_bm25("计算", top_k=1)] == ["q.md"]
+    monkeypatch.setattr(config, "SEARCH_ENGINE", "resident")
+    assert store.search_by_bm25("计算", top_k=1)[0]["doc_id"] == "q.md"
+    store.close()
+
+    # 分词器未变化（ngram 与 ngram2 是同一个分词器）时再次打开不会重新分词
+    monkeypatch.setattr(config, "TOKENIZER", "ngram2")
+    store = storage.ReasoningIndexStore(path)
+    generation = store.get_generation()
+    store.close()
+    store = storage.ReasoningIndexStore(path)
+    assert store.get_generation() == generation
+    store.close()